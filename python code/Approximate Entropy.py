@@ -1,11 +1,75 @@
 import os
 import threading
+import functools
 import pandas as pd
 import numpy as np
-import EntropyHub as EH
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import ttk
+from batch_runner import BatchRunner, default_workers, split_range
+from entropy_engine import (coarse_grain, tolerance_groups, entropies_for, window_starts, window_entropies,
+                            summarize_windows)
+from data_cache import read_table, is_data_file
+from schema_index import SchemaIndex
+
+
+def plan_apen_file(path, ms, cols, scales=(1,)):
+    """
+    One work unit per (column, scale); a missing column gives a single unit with no data.
+    All scales come from one cumulative sum, and the tolerance is taken from the original series.
+    """
+    df = read_table(path, cols)
+    units = []
+    for col in cols:
+        if col not in df.columns:
+            units.append((col, None, None, None))
+            continue
+        data = df[col].values.flatten()
+        groups = tolerance_groups(data, ms, ("apen",))
+        units.extend((col, scale, series, groups) for scale, series in coarse_grain(data, scales).items())
+    return units
+
+
+def compute_apen_unit(unit):
+    """All requested m for one series share a single match-counting pass; returns (col, scale, {m: ApEn})."""
+    col, scale, series, groups = unit
+    if series is None:
+        return col, None, None
+    return col, scale, {m: value for (_, m), value in entropies_for(series, groups).items()}
+
+
+def plan_apen_windows(path, ms, cols, window_size, step, chunks):
+    """
+    Chunks of consecutive windows per column, each carrying only the samples its windows cover.
+    The tolerance comes from the whole recording, so every window is matched against the same r.
+    """
+    df = read_table(path, cols)
+    units = []
+    for col in cols:
+        data = df[col].values.flatten() if col in df.columns else None
+        n_windows = 0 if data is None else len(window_starts(len(data), window_size, step))
+        if not n_windows:
+            units.append((col, None, None, None, window_size, step))
+            continue
+        groups = tolerance_groups(data, ms, ("apen",))
+        units.extend((col, first, data[first * step:(last - 1) * step + window_size], groups, window_size, step)
+                     for first, last in split_range(n_windows, chunks))
+    return units
+
+
+def compute_apen_window_unit(unit):
+    """Per-window ApEn for one chunk (match counts updated as the window slides); returns (col, first, {m: array})."""
+    col, first, series, groups, window_size, step = unit
+    if series is None:
+        return col, None, None
+    return col, first, {m: values for (_, m), values in window_entropies(series, window_size, step, groups).items()}
+
+
+def result_column(col, m, scale, ms, scales):
+    """A single m and scale keep the old column name so existing sheets still line up."""
+    params = ([f"m={m}"] if len(ms) > 1 else []) + ([f"scale={scale}"] if len(scales) > 1 else [])
+    return f"{col} ApEn" + (f"({', '.join(params)})" if params else "")
+
 
 class ApproxEntropyApp:
     MAX_COLS = 5
@@ -51,11 +115,33 @@ class ApproxEntropyApp:
         param_frame = ttk.Labelframe(container, text="Entropy Parameters", padding=10)
         param_frame.pack(fill='x', pady=5)
 
-        ttk.Label(param_frame, text="Embedding dimension (m):").grid(row=0, column=0, sticky='w')
+        ttk.Label(param_frame, text="Embedding dimension(s) m (comma-separated):").grid(row=0, column=0, sticky='w')
         self.entry_m = ttk.Entry(param_frame, width=10)
         self.entry_m.insert(0, "2")
         self.entry_m.grid(row=0, column=1, sticky='w', padx=5)
 
+        ttk.Label(param_frame, text="Workers:").grid(row=1, column=0, sticky='w')
+        self.entry_workers = ttk.Entry(param_frame, width=10)
+        self.entry_workers.insert(0, str(default_workers()))
+        self.entry_workers.grid(row=1, column=1, sticky='w', padx=5)
+
+        ttk.Label(param_frame, text="Max scale (1 = single-scale):").grid(row=2, column=0, sticky='w')
+        self.entry_scale = ttk.Entry(param_frame, width=10)
+        self.entry_scale.insert(0, "1")
+        self.entry_scale.grid(row=2, column=1, sticky='w', padx=5)
+
+        self.whole_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(param_frame, text="Whole recording (no windowing)",
+                        variable=self.whole_var).grid(row=3, column=0, columnspan=2, sticky='w')
+        ttk.Label(param_frame, text="Window size:").grid(row=4, column=0, sticky='w')
+        self.entry_window = ttk.Entry(param_frame, width=10)
+        self.entry_window.insert(0, "1000")
+        self.entry_window.grid(row=4, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Overlap ratio (0-1):").grid(row=5, column=0, sticky='w')
+        self.entry_overlap = ttk.Entry(param_frame, width=10)
+        self.entry_overlap.insert(0, "0.5")
+        self.entry_overlap.grid(row=5, column=1, sticky='w', padx=5)
+
         # Progress and log
         progress_frame = ttk.Frame(container, padding=0)
         progress_frame.pack(fill='both', expand=True, pady=5)
@@ -83,18 +169,17 @@ class ApproxEntropyApp:
         if not os.path.isdir(folder):
             messagebox.showerror("Invalid folder", "Please select a valid folder first.")
             return
-        files = [f for f in os.listdir(folder) if f.lower().endswith((".xls", ".xlsx", ".csv"))]
+        files = [f for f in os.listdir(folder) if is_data_file(f)]
         if not files:
             messagebox.showwarning("No files found", "No Excel/CSV files in the folder.")
             return
         try:
-            path = os.path.join(folder, files[0])
-            df = pd.read_excel(path) if path.endswith(('.xls', '.xlsx')) else pd.read_csv(path)
-            cols = [''] + list(df.columns)
+            index = SchemaIndex.scan([os.path.join(folder, f) for f in files])
+            cols = [''] + index.intersection()
             for combo in self.combo_cols:
                 combo['values'] = cols
                 combo.set('')
-            messagebox.showinfo("Columns Loaded", f"Loaded columns from {files[0]}")
+            messagebox.showinfo("Columns Loaded", index.report())
         except Exception as e:
             messagebox.showerror("Load Error", str(e))
 
@@ -112,42 +197,119 @@ class ApproxEntropyApp:
         folder = self.entry_folder.get()
         output = self.entry_output.get()
         try:
-            m = int(self.entry_m.get())
+            ms = sorted({int(v) for v in self.entry_m.get().split(',') if v.strip()})
+            workers = int(self.entry_workers.get())
+            max_scale = int(self.entry_scale.get())
+            window_size = int(self.entry_window.get())
+            overlap = float(self.entry_overlap.get())
         except ValueError:
-            messagebox.showerror("Invalid input", "Embedding dimension must be numeric.")
+            messagebox.showerror("Invalid input", "Embedding dimension and workers must be numeric.")
+            return
+        if workers < 1 or max_scale < 1 or not ms or min(ms) < 1:
+            messagebox.showerror("Invalid input", "Workers, max scale and embedding dimensions must be >=1.")
             return
+        whole = self.whole_var.get()
+        if not whole:
+            step = int(window_size * (1 - overlap))
+            if not (0 <= overlap < 1) or step < 1 or window_size <= max(ms) + 1:
+                messagebox.showerror("Invalid window settings",
+                                     "Overlap must be in [0, 1), the step >=1 sample and window size > m+1.")
+                return
+            if max_scale > 1:
+                messagebox.showerror("Invalid window settings", "Windowed mode works on the original scale only.")
+                return
         cols = [c.get() for c in self.combo_cols if c.get()]
         if not os.path.isdir(folder) or not cols or not output:
             messagebox.showerror("Missing info", "Ensure folder, columns, and output are set.")
             return
-        threading.Thread(target=self.process_files, args=(folder, output, m, cols), daemon=True).start()
+        threading.Thread(target=self.process_files, args=(folder, output, ms, cols, workers, max_scale,
+                                                               None if whole else (window_size, overlap)),
+                         daemon=True).start()
 
-    def process_files(self, folder, output, m, cols):
-        files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
+    def process_files(self, folder, output, ms, cols, workers=1, max_scale=1, window=None):
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if is_data_file(f)]
         self.progress['maximum'] = len(files)
         self.progress['value'] = 0
-        results = []
-        for file in files:
-            basename = os.path.basename(file)
-            try:
-                df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
-                row = {'Filename': basename}
-                logs = []
-                for col in cols:
-                    if col in df.columns:
-                        data = df[col].values.flatten()
-                        th = 0.2 * np.std(data)
-                        s = EH.ApEn(data, m, r=th)[0][-1]
-                        row[f"{col} ApEn"] = s
-                        logs.append(f"{col}={s:.4f}")
+        scales = tuple(range(1, max_scale + 1))
+        if window is not None:
+            window_size, overlap = window
+            step = int(window_size * (1 - overlap))
+
+        def merge(file, values):
+            found = {}
+            for col, scale, s in values:
+                if s is not None:
+                    for m, value in s.items():
+                        found[(col, m, scale)] = value
+            # Columns ordered by column, then m, then scale, so each entropy curve reads left to right
+            row = {'Filename': os.path.basename(file)}
+            logs = []
+            for col in cols:
+                if not any(key[0] == col for key in found):
+                    logs.append(f"{col} skipped")
+                    continue
+                for m in ms:
+                    for scale in scales:
+                        row[result_column(col, m, scale, ms, scales)] = found[(col, m, scale)]
+                    if len(scales) == 1:
+                        logs.append(f"{result_column(col, m, 1, ms, scales)}={found[(col, m, 1)]:.4f}")
                     else:
-                        logs.append(f"{col} skipped")
-                results.append(row)
-                self.log_message(f"{basename}: " + ", ".join(logs))
-            except Exception as e:
-                self.log_message(f"Error {basename}: {e}")
+                        logs.append(f"{col}(m={m}) scales 1-{max_scale} done")
+            return row, logs, []
+
+        def merge_windows(file, values):
+            series = {}
+            for col, first, s in values:
+                if s is not None:
+                    for m, curve in s.items():
+                        series.setdefault((col, m), []).append(curve)
+            # One summary row per file, plus the per-window series in long format
+            row = {'Filename': os.path.basename(file)}
+            logs = []
+            windows = []
+            for col in cols:
+                if not any(key[0] == col for key in series):
+                    logs.append(f"{col} skipped")
+                    continue
+                for m in ms:
+                    curve = np.concatenate(series[(col, m)])
+                    name = result_column(col, m, 1, ms, (1,))
+                    for stat, value in summarize_windows(curve).items():
+                        row[f"{name} {stat}"] = value
+                    starts = np.arange(len(curve)) * step
+                    windows.append(pd.DataFrame({'Filename': os.path.basename(file), 'Column': col, 'm': m,
+                                                 'Window': np.arange(len(curve)), 'Start': starts,
+                                                 'End': starts + window_size, 'ApEn': curve}))
+                    logs.append(f"{name}: {len(curve)} windows, mean={row[f'{name} mean']:.4f}")
+            return row, logs, windows
+
+        def on_file_done(file, result):
+            self.log_message(f"{os.path.basename(file)}: " + ", ".join(result[1]))
             self.progress['value'] += 1
-        if results:
+
+        def on_error(file, exc):
+            self.log_message(f"Error {os.path.basename(file)}: {exc}")
+            self.progress['value'] += 1
+
+        if window is None:
+            # Each (file, column, scale) is a separate unit, so one long file spreads over several workers
+            plan = functools.partial(plan_apen_file, ms=tuple(ms), cols=cols, scales=scales)
+            outcomes = BatchRunner(workers).run(files, plan, compute_apen_unit, merge, on_file_done, on_error)
+        else:
+            # Split each recording into ~2 window chunks per worker; each chunk updates its counts incrementally
+            plan = functools.partial(plan_apen_windows, ms=tuple(ms), cols=cols, window_size=window_size, step=step,
+                                     chunks=2 * workers)
+            outcomes = BatchRunner(workers).run(files, plan, compute_apen_window_unit, merge_windows,
+                                                on_file_done, on_error)
+        results = [row for row, _, _ in filter(None, outcomes)]
+        windows = [frame for _, _, frames in filter(None, outcomes) for frame in frames]
+        if results and windows:
+            with pd.ExcelWriter(output) as writer:
+                pd.DataFrame(results).to_excel(writer, sheet_name='Summary', index=False)
+                pd.concat(windows, ignore_index=True).to_excel(writer, sheet_name='Windows', index=False)
+            self.log_message(f"Results saved to {output}")
+            messagebox.showinfo("Completed", "Calculation finished.")
+        elif results:
             pd.DataFrame(results).to_excel(output, index=False)
             self.log_message(f"Results saved to {output}")
             messagebox.showinfo("Completed", "Calculation finished.")
@@ -1,15 +1,49 @@
 import os
+import threading
+import functools
 import pandas as pd
 import numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-from scipy.stats import entropy
+from batch_runner import BatchRunner, SkipFile, default_workers
+from cross_entropy_engine import calculate_cross_entropy, batch_cross_entropy, BinGrid, ADAPTIVE_BINS
+from entropy_engine import summarize_windows
+from data_cache import read_table, is_data_file
+from schema_index import SchemaIndex
+
+
+def plan_cross_entropy_file(path):
+    """The whole file is a single work unit; the histograms are built afterwards for all files at once."""
+    return [path]
+
+
+def read_cross_entropy_pair(path, selected_cols):
+    """
+    Read the two selected columns as floats with NaN and +-inf dropped, trimmed to a common length.
+    All files share one bin grid, so a non-finite value must not reach it.
+    """
+    df = read_table(path, selected_cols)
+
+    if selected_cols[0] not in df.columns or selected_cols[1] not in df.columns:
+        raise SkipFile("Columns not found.")
+
+    try:
+        col_x = pd.to_numeric(df[selected_cols[0]]).to_numpy(dtype=float)
+        col_y = pd.to_numeric(df[selected_cols[1]]).to_numpy(dtype=float)
+    except Exception as e:
+        raise SkipFile(f"Failed to convert columns to numbers - {e}")
+
+    col_x = col_x[np.isfinite(col_x)]
+    col_y = col_y[np.isfinite(col_y)]
+    min_len = min(len(col_x), len(col_y))
+    return col_x[:min_len], col_y[:min_len]
+
 
 class CrossEntropyGUI:
     def __init__(self, master):
         self.master = master
         master.title("Batch Cross Entropy Calculator")
-        master.geometry("650x500")
+        master.geometry("650x560")
 
         self.selected_cols = []
         self.file_columns = []
@@ -25,6 +59,38 @@ class CrossEntropyGUI:
         self.lbl_folder = ttk.Label(frame_path, text="")
         self.lbl_folder.pack(anchor='w', pady=5)
 
+        frame_workers = ttk.Frame(frame_path)
+        frame_workers.pack(anchor='w')
+        ttk.Label(frame_workers, text="Workers:").pack(side='left')
+        self.entry_workers = ttk.Entry(frame_workers, width=5)
+        self.entry_workers.insert(0, str(default_workers()))
+        self.entry_workers.pack(side='left', padx=5)
+
+        frame_bins = ttk.Frame(frame_path)
+        frame_bins.pack(anchor='w', pady=2)
+        ttk.Label(frame_bins, text="Binning:").pack(side='left')
+        self.combo_binning = ttk.Combobox(frame_bins, width=12, state="readonly",
+                                          values=["fixed width"] + list(ADAPTIVE_BINS))
+        self.combo_binning.set("fixed width")
+        self.combo_binning.pack(side='left', padx=5)
+        ttk.Label(frame_bins, text="Bin width:").pack(side='left')
+        self.entry_bin_width = ttk.Entry(frame_bins, width=8)
+        self.entry_bin_width.insert(0, "1")
+        self.entry_bin_width.pack(side='left', padx=5)
+
+        frame_window = ttk.Frame(frame_path)
+        frame_window.pack(anchor='w', pady=2)
+        self.whole_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frame_window, text="Whole recording (no windowing)", variable=self.whole_var).pack(side='left')
+        ttk.Label(frame_window, text="Window size:").pack(side='left', padx=(10, 0))
+        self.entry_window = ttk.Entry(frame_window, width=8)
+        self.entry_window.insert(0, "1000")
+        self.entry_window.pack(side='left', padx=5)
+        ttk.Label(frame_window, text="Overlap ratio (0-1):").pack(side='left')
+        self.entry_overlap = ttk.Entry(frame_window, width=5)
+        self.entry_overlap.insert(0, "0.5")
+        self.entry_overlap.pack(side='left', padx=5)
+
         frame_cols = ttk.Frame(frame_path)
         frame_cols.pack()
         for i in range(2):  # 只要兩個欄位
@@ -45,13 +111,14 @@ class CrossEntropyGUI:
         folder = filedialog.askdirectory()
         if folder:
             self.lbl_folder.config(text=folder)
-            files = [f for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
+            files = [f for f in os.listdir(folder) if is_data_file(f)]
             if files:
-                df = pd.read_excel(os.path.join(folder, files[0])) if files[0].endswith('xlsx') else pd.read_csv(os.path.join(folder, files[0]))
-                self.file_columns = df.columns.tolist()
+                index = SchemaIndex.scan([os.path.join(folder, f) for f in files])
+                self.file_columns = index.intersection()
                 for cb in self.combo_cols:
                     cb['values'] = [''] + self.file_columns
                     cb.set('')
+                self.log_message(index.report())
             else:
                 messagebox.showwarning("No Files", "No Excel or CSV files found in the folder.")
 
@@ -60,38 +127,7 @@ class CrossEntropyGUI:
         self.log.yview(tk.END)
 
     def calculate_cross_entropy(self, col_x, col_y):
-        if col_x.nunique() < 2:
-            return np.nan, f"Column 1 only has one unique value: {col_x.unique()}"
-        if col_y.nunique() < 2:
-            return np.nan, f"Column 2 only has one unique value: {col_y.unique()}"
-
-        value_counts_x = col_x.value_counts()
-        value_counts_y = col_y.value_counts()
-
-        prob_x = value_counts_x / len(col_x)
-        prob_y = value_counts_y / len(col_y)
-
-        prob_x, prob_y = prob_x.align(prob_y, fill_value=0)
-
-        nonzero_indices = prob_y > 0
-        if nonzero_indices.sum() == 0:
-            return np.nan, "No overlapping nonzero values between columns."
-
-        prob_x_filtered = prob_x[nonzero_indices]
-        prob_y_filtered = prob_y[nonzero_indices]
-
-        if prob_x_filtered.sum() == 0 or prob_y_filtered.sum() == 0:
-            return np.nan, "Zero sum after filtering probabilities."
-
-        prob_x_filtered = prob_x_filtered / prob_x_filtered.sum()
-        prob_y_filtered = prob_y_filtered / prob_y_filtered.sum()
-
-        epsilon = 1e-10
-        pred_prob = np.clip(prob_y_filtered.values, epsilon, 1. - epsilon)
-        true_prob = prob_x_filtered.values
-
-        cross_entropy_value = -np.sum(true_prob * np.log2(pred_prob))
-        return cross_entropy_value, None
+        return calculate_cross_entropy(col_x, col_y)
 
     def start_processing(self):
         folder = self.lbl_folder.cget("text")
@@ -101,59 +137,103 @@ class CrossEntropyGUI:
             messagebox.showerror("Missing Information", "Please select a folder and exactly two columns.")
             return
 
-        results = []
-        files = [f for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
-        for file in files:
-            try:
-                path = os.path.join(folder, file)
-                df = pd.read_excel(path) if file.endswith('xlsx') else pd.read_csv(path)
-
-                if selected_cols[0] not in df.columns or selected_cols[1] not in df.columns:
-                    self.log_message(f"{file}: Columns not found.")
-                    continue
-
-                try:
-                    df[selected_cols[0]] = df[selected_cols[0]].round().astype(int)
-                    df[selected_cols[1]] = df[selected_cols[1]].round().astype(int)
-                except Exception as e:
-                    self.log_message(f"{file}: Failed to convert columns to int - {e}")
-                    continue
-
-                col_x = df[selected_cols[0]].dropna()
-                col_y = df[selected_cols[1]].dropna()
-
-                min_len = min(len(col_x), len(col_y))
-                col_x = col_x.iloc[:min_len]
-                col_y = col_y.iloc[:min_len]
+        try:
+            workers = max(1, int(self.entry_workers.get()))
+            bin_width = float(self.entry_bin_width.get())
+            window_size = int(self.entry_window.get())
+            overlap = float(self.entry_overlap.get())
+        except ValueError:
+            messagebox.showerror("Error", "Workers and window size must be integers; bin width and overlap numbers.")
+            return
+        if bin_width <= 0:
+            messagebox.showerror("Error", "Bin width must be > 0.")
+            return
+        window = None
+        if not self.whole_var.get():
+            step = int(window_size * (1 - overlap))
+            if window_size < 2 or not (0 <= overlap < 1) or step < 1:
+                messagebox.showerror("Error", "Window size must be >=2, 0<=overlap<1 and the step >=1 sample.")
+                return
+            window = (window_size, step)
+
+        binning = self.combo_binning.get()
+        # Run off the Tk main thread so the window stays responsive on large folders
+        threading.Thread(target=self.process_files,
+                         args=(folder, selected_cols, workers, binning, bin_width, window), daemon=True).start()
+
+    def process_files(self, folder, selected_cols, workers=1, binning="fixed width", bin_width=1.0, window=None):
+        files = [f for f in os.listdir(folder) if is_data_file(f)]
+
+        def on_error(path, exc):
+            file = os.path.basename(path)
+            if isinstance(exc, SkipFile):
+                self.log_message(f"{file}: {exc}")
+            else:
+                self.log_message(f"Error processing {file}: {exc}")
+
+        # Parsing runs in the worker pool; the histograms of all files are then built in one batch
+        outcomes = BatchRunner(workers).run(
+            [os.path.join(folder, file) for file in files], plan_cross_entropy_file,
+            functools.partial(read_cross_entropy_pair, selected_cols=selected_cols),
+            lambda path, values: values[0], on_error=on_error)
+        loaded = [(file, pair) for file, pair in zip(files, outcomes) if pair is not None]
+        pairs = [pair for _, pair in loaded]
+        if not pairs:
+            messagebox.showwarning("No Data", "No valid files processed.")
+            return
 
-                cross_entropy_value, reason = self.calculate_cross_entropy(col_x, col_y)
+        if binning == "fixed width":
+            grid = BinGrid(bin_width)
+        else:
+            # Adaptive bins are derived once from every file's samples, so all files share one grid
+            grid = BinGrid.adaptive([s for pair in pairs for s in pair], binning)
+            self.log_message(f"Shared grid: {len(grid.edges) - 1} bins ({binning})")
 
+        results = []
+        windows = []
+        for (file, _), result in zip(loaded, batch_cross_entropy(pairs, grid, window)):
+            cross_entropy_value, reason, unique_x, unique_y = result
+            if window is None:
+                if reason:
+                    self.log_message(f"Processed {file}: Cross Entropy = nan ({reason})")
+                else:
+                    self.log_message(f"Processed {file}: Cross Entropy = {cross_entropy_value:.4f}")
                 results.append({
                     "File Name": file,
                     "Cross_Entropy": cross_entropy_value,
                     "Reason": reason if reason else "OK",
-                    "Unique_Col1": col_x.nunique(),
-                    "Unique_Col2": col_y.nunique()
+                    "Unique_Col1": unique_x,
+                    "Unique_Col2": unique_y
                 })
-
-                if reason:
-                    self.log_message(f"Processed {file}: Cross Entropy = nan ({reason})")
-                else:
-                    self.log_message(f"Processed {file}: Cross Entropy = {cross_entropy_value:.4f}")
-
-            except Exception as e:
-                self.log_message(f"Error processing {file}: {e}")
-
-        if results:
-            out_path = os.path.join(folder, "Cross_Entropy_Results.xlsx")
-            df_results = pd.DataFrame(results)
-            df_results.to_excel(out_path, index=False)
-            messagebox.showinfo("Completed", f"Results saved to {out_path}")
-
-            try:
-                os.startfile(folder)
-            except Exception as e:
-                self.log_message(f"Failed to open folder: {e}")
+                continue
+            # Windowed: one summary row per file plus the per-window series
+            size, step = window
+            row = {"File Name": file, "Windows": len(cross_entropy_value)}
+            for stat, value in summarize_windows(cross_entropy_value).items():
+                row[f"Cross_Entropy {stat}"] = value
+            results.append(row)
+            starts = np.arange(len(cross_entropy_value)) * step
+            windows.append(pd.DataFrame({
+                "File Name": file, "Window": np.arange(len(cross_entropy_value)), "Start": starts,
+                "End": starts + size, "Cross_Entropy": cross_entropy_value,
+                "Reason": [r if r else "OK" for r in reason], "Unique_Col1": unique_x, "Unique_Col2": unique_y
+            }))
+            self.log_message(f"Processed {file}: {len(cross_entropy_value)} windows, "
+                             f"mean Cross Entropy = {row['Cross_Entropy mean']:.4f}")
+
+        out_path = os.path.join(folder, "Cross_Entropy_Results.xlsx")
+        if windows:
+            with pd.ExcelWriter(out_path) as writer:
+                pd.DataFrame(results).to_excel(writer, sheet_name='Summary', index=False)
+                pd.concat(windows, ignore_index=True).to_excel(writer, sheet_name='Windows', index=False)
+        else:
+            pd.DataFrame(results).to_excel(out_path, index=False)
+        messagebox.showinfo("Completed", f"Results saved to {out_path}")
+
+        try:
+            os.startfile(folder)
+        except Exception as e:
+            self.log_message(f"Failed to open folder: {e}")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,16 +1,199 @@
 import os
 import threading
+import functools
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
 import pandas as pd
 import numpy as np
-from NLIDOOP3 import RecurrenceAnalysis
+from NLIDOOP3 import RecurrenceAnalysis, RQA_MEASURES
+from batch_runner import BatchRunner, SkipFile, default_workers, split_range
+from data_cache import read_table, is_data_file
+from schema_index import SchemaIndex
+
+
+def plan_nlid_file(path, col_x, col_y, m, tau, window_size, step, whole, settings, chunks):
+    """Read one file and split its NLID work into (kind, x, y, settings) units (runs in a worker)."""
+    df = read_table(path, [col_x, col_y], normalize=True)
+    cx = col_x.strip().upper()
+    cy = col_y.strip().upper()
+    if cx not in df.columns or cy not in df.columns:
+        raise SkipFile("missing selected columns.")
+
+    x = df[cx].dropna().values
+    y = df[cy].dropna().values
+    if m is None or tau is None:
+        # "auto": estimate this file's embedding, and report it to merge through an "embedding" unit
+        m, tau = estimate_file_embedding(x, y, m, tau, window_size, whole)
+        settings = dict(settings, m=m, tau=tau)
+        if not whole and window_size <= (m - 1) * tau:
+            raise SkipFile(f"window shorter than the estimated embedding span (m={m}, tau={tau}).")
+        return split_nlid_units(x, y, m, tau, window_size, step, whole, settings, chunks) + \
+            [("embedding", x[:0], y[:0], settings)]
+    return split_nlid_units(x, y, m, tau, window_size, step, whole, settings, chunks)
+
+
+def estimate_file_embedding(x, y, m, tau, window_size, whole):
+    """
+    Per-file m and tau for the "auto" option: tau from the first minimum of the average mutual information,
+    then m from Cao's method, each estimated on X and Y and the larger value kept.
+    A value that is not None is kept as given; in windowed mode tau is limited to a tenth of the window.
+    """
+    min_len = min(len(x), len(y))
+    x, y = x[:min_len], y[:min_len]
+    if tau is None:
+        max_lag = max(1, min(50, (min_len if whole else window_size) // 10))
+        tau = max(RecurrenceAnalysis.estimate_delay(x, max_lag), RecurrenceAnalysis.estimate_delay(y, max_lag))
+    if m is None:
+        m = max(RecurrenceAnalysis.estimate_dimension(x, tau), RecurrenceAnalysis.estimate_dimension(y, tau))
+    return m, tau
+
+
+def split_nlid_units(x, y, m, tau, window_size, step, whole, settings, chunks):
+    """
+    Trim x/y to a common length and split the NLID work into (kind, x, y, settings) units.
+    With settings["surrogates"] > 0, "surrogates" units follow the NLID units.
+    """
+    min_len = min(len(x), len(y))
+    x, y = x[:min_len], y[:min_len]
+    n_surrogates = settings.get("surrogates", 0)
+    if whole:
+        if min_len <= (m - 1) * tau:
+            raise SkipFile("data shorter than embedding span.")
+        units = [("whole", x, y, settings)]
+        M = min_len - (m - 1) * tau
+        # The surrogate test holds both N x N recurrence matrices and one distance matrix in memory
+        if n_surrogates and 10 * M * M <= settings["max_bytes"]:
+            # One recording: split the surrogates, each unit builds the two matrices once
+            units += [("surrogates", x, y, dict(settings, surrogates=last - first, seed=[settings["seed"], first]))
+                      for first, last in split_range(n_surrogates, chunks)]
+        return units
+    if min_len < window_size:
+        raise SkipFile("data shorter than window size.")
+
+    # Chunks of consecutive windows; each chunk carries only the samples its windows cover
+    n_windows = (min_len - window_size) // step + 1
+    ranges = split_range(n_windows, chunks)
+    units = [("windows", x[first * step:(last - 1) * step + window_size],
+              y[first * step:(last - 1) * step + window_size], settings)
+             for first, last in ranges]
+    if n_surrogates:
+        # Each chunk runs every surrogate on its own windows, so window matrices are built once
+        units += [("surrogates", x[first * step:(last - 1) * step + window_size],
+                   y[first * step:(last - 1) * step + window_size], dict(settings, seed=[settings["seed"], first]))
+                  for first, last in ranges]
+    return units
+
+
+def parse_grid(text, cast):
+    """Parse a comma-separated parameter list such as "2, 3, 4" into sorted unique values."""
+    values = sorted({cast(part) for part in text.split(',') if part.strip()})
+    if not values:
+        raise ValueError("empty parameter list")
+    return values
+
+
+def plan_nlid_sweep(path, col_x, col_y, window_sizes, overlap, settings, chunks):
+    """
+    Read one file and split a parameter sweep into ("sweep", x, y, settings) units:
+    one group of window chunks per window size; each unit covers every m, tau and threshold.
+    """
+    df = read_table(path, [col_x, col_y], normalize=True)
+    cx = col_x.strip().upper()
+    cy = col_y.strip().upper()
+    if cx not in df.columns or cy not in df.columns:
+        raise SkipFile("missing selected columns.")
+
+    x = df[cx].dropna().values
+    y = df[cy].dropna().values
+    min_len = min(len(x), len(y))
+    units = []
+    for window_size in window_sizes:
+        if min_len < window_size:
+            continue
+        step = int(window_size * (1 - overlap))
+        n_windows = (min_len - window_size) // step + 1
+        units += [("sweep", x[first * step:(last - 1) * step + window_size],
+                   y[first * step:(last - 1) * step + window_size],
+                   dict(settings, window_size=window_size, step=step))
+                  for first, last in split_range(n_windows, chunks)]
+    if not units:
+        raise SkipFile("data shorter than every window size.")
+    return units
+
+
+def compute_nlid_unit(unit):
+    """NLID for one work unit: the per-window arrays, or one value pair for a whole recording."""
+    kind, x, y, settings = unit
+    if kind == "embedding":
+        return {"m": settings["m"], "tau": settings["tau"]}
+    if kind == "sweep":
+        # Every (m, tau, threshold) of one window size from shared distance matrices
+        return settings["window_size"], RecurrenceAnalysis.sweep_nlid_windows(
+            x, y, settings["ms"], settings["taus"], settings["window_size"], settings["step"],
+            settings["thresholds"], settings["threshold_type"])
+    m, tau = settings["m"], settings["tau"]
+    threshold, threshold_type, engine = settings["threshold"], settings["threshold_type"], settings["engine"]
+    if kind == "surrogates":
+        # Surrogate NLIDs of Y, shape (surrogates, windows); a whole recording is a single window
+        whole = settings["whole"]
+        xy, yx = RecurrenceAnalysis.surrogate_nlid_windows(
+            x, y, m, tau, len(x) if whole else settings["window_size"], 1 if whole else settings["step"],
+            settings["surrogates"], settings["surrogate_kind"], threshold, threshold_type, settings["seed"],
+            settings["max_bytes"] if whole else 2 ** 20)
+        return {"xy": xy, "yx": yx}
+    if kind == "windows":
+        if settings.get("recurrence"):
+            # RQA needs the recurrence matrices, so NLID comes from the same batched matrices
+            return RecurrenceAnalysis.compute_nlid_rqa_windows(
+                x, y, m, tau, settings["window_size"], settings["step"], threshold, threshold_type,
+                recurrence=settings["recurrence"])
+        return RecurrenceAnalysis.compute_nlid_windows(
+            x, y, m, tau, settings["window_size"], settings["step"],
+            threshold=threshold, threshold_type=threshold_type, engine=engine)
+
+    # Whole recording: sparse KD-tree matrices, the fused O(N)-memory kernel,
+    # or a tiled, memory-bounded N x N pass
+    ps_x = RecurrenceAnalysis(x, m, tau).reconstruct_phase_space()
+    ps_y = RecurrenceAnalysis(y, m, tau).reconstruct_phase_space()
+    recurrence = settings.get("recurrence")
+    if recurrence:
+        # One dense distance matrix at a time plus the N x N recurrence matrices (and the cross matrix);
+        # RQA is left out (None) when they do not fit the memory budget
+        M = len(ps_x)
+        if (11 if "cross" in recurrence else 10) * M * M > settings["max_bytes"]:
+            return compute_nlid_unit(("whole", x, y, dict(settings, recurrence=()))) + (None,)
+        AR_X = RecurrenceAnalysis.compute_reconstruction_matrix(ps_x, threshold, threshold_type)
+        AR_Y = RecurrenceAnalysis.compute_reconstruction_matrix(ps_y, threshold, threshold_type)
+        matrices = {"X": (AR_X, 1, True), "Y": (AR_Y, 1, True)}
+        if "joint" in recurrence:
+            matrices["joint"] = (AR_X & AR_Y, 1, True)
+        if "cross" in recurrence:
+            # Cross recurrence between the standardized channels; no line of identity to exclude
+            CR = RecurrenceAnalysis.compute_cross_recurrence_matrix(
+                RecurrenceAnalysis(RecurrenceAnalysis.standardize(x), m, tau).reconstruct_phase_space(),
+                RecurrenceAnalysis(RecurrenceAnalysis.standardize(y), m, tau).reconstruct_phase_space(),
+                threshold, threshold_type)
+            matrices["cross"] = (CR, 0, False)
+        rqa = {name: RecurrenceAnalysis.rqa_measures(matrices[name][0], theiler=matrices[name][1],
+                                                     symmetric=matrices[name][2])
+               for name in recurrence}
+        return RecurrenceAnalysis.calculate_nlid(AR_X, AR_Y) + (rqa,)
+    if engine == "fused":
+        return RecurrenceAnalysis.calculate_nlid_fused(ps_x, ps_y, threshold=threshold, threshold_type=threshold_type)
+    if engine == "sparse":
+        return RecurrenceAnalysis.calculate_nlid(
+            RecurrenceAnalysis.compute_sparse_recurrence_matrix(ps_x, threshold, threshold_type),
+            RecurrenceAnalysis.compute_sparse_recurrence_matrix(ps_y, threshold, threshold_type))
+    return RecurrenceAnalysis.calculate_nlid_tiled(
+        ps_x, ps_y, threshold=threshold, threshold_type=threshold_type,
+        max_bytes=settings["max_bytes"], dtype=settings["dtype"])
+
 
 class NLIDApp:
     def __init__(self, master):
         self.master = master
         master.title("NLID 批次分析工具（支援參數輸入與滑動窗口）")
-        master.geometry("900x650")
+        master.geometry("900x920")
 
         container = ttk.Frame(master, padding=10)
         container.pack(fill='both', expand=True)
@@ -40,11 +223,11 @@ class NLIDApp:
         param_frame = ttk.Labelframe(container, text="Parameters", padding=10)
         param_frame.pack(fill='x', pady=5)
         ttk.Label(param_frame, text="Embedding dimension (m):").grid(row=0, column=0, sticky='w')
-        self.entry_m = ttk.Entry(param_frame, width=10)
+        self.entry_m = ttk.Entry(param_frame, width=10)  # "auto" estimates m per file
         self.entry_m.insert(0, "3")
         self.entry_m.grid(row=0, column=1, sticky='w', padx=5)
         ttk.Label(param_frame, text="Delay (tau):").grid(row=1, column=0, sticky='w')
-        self.entry_tau = ttk.Entry(param_frame, width=10)
+        self.entry_tau = ttk.Entry(param_frame, width=10)  # "auto" estimates tau per file
         self.entry_tau.insert(0, "1")
         self.entry_tau.grid(row=1, column=1, sticky='w', padx=5)
         ttk.Label(param_frame, text="Window size:").grid(row=2, column=0, sticky='w')
@@ -55,6 +238,53 @@ class NLIDApp:
         self.entry_overlap = ttk.Entry(param_frame, width=10)
         self.entry_overlap.insert(0, "0.5")
         self.entry_overlap.grid(row=3, column=1, sticky='w', padx=5)
+        self.whole_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Whole recording (no windowing)", variable=self.whole_var).grid(row=4, column=0, columnspan=2, sticky='w')
+        ttk.Label(param_frame, text="Memory budget (MB):").grid(row=5, column=0, sticky='w')
+        self.entry_memory = ttk.Entry(param_frame, width=10)
+        self.entry_memory.insert(0, "256")
+        self.entry_memory.grid(row=5, column=1, sticky='w', padx=5)
+        self.float32_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Use float32 distances (faster, approximate)", variable=self.float32_var).grid(row=6, column=0, columnspan=2, sticky='w')
+        ttk.Label(param_frame, text="Threshold type:").grid(row=7, column=0, sticky='w')
+        self.combo_threshold_type = ttk.Combobox(param_frame, state="readonly", width=10,
+                                                 values=["dynamic", "static", "fixed_rr"])
+        self.combo_threshold_type.set("dynamic")
+        self.combo_threshold_type.grid(row=7, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Threshold (fixed_rr: recurrence rate):").grid(row=8, column=0, sticky='w')
+        self.entry_threshold = ttk.Entry(param_frame, width=10)
+        self.entry_threshold.insert(0, "0.1")
+        self.entry_threshold.grid(row=8, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Engine:").grid(row=9, column=0, sticky='w')
+        self.combo_engine = ttk.Combobox(param_frame, state="readonly", width=10,
+                                         values=["auto", "batch", "rolling", "sparse", "fused"])
+        self.combo_engine.set("auto")
+        self.combo_engine.grid(row=9, column=1, sticky='w', padx=5)
+        # "auto" stays bit-identical to batch; the fused kernel sums in a different order
+        ttk.Label(param_frame, text="fused: within ~1e-7 of batch").grid(row=9, column=2, sticky='w')
+        ttk.Label(param_frame, text="Workers:").grid(row=10, column=0, sticky='w')
+        self.entry_workers = ttk.Entry(param_frame, width=10)
+        self.entry_workers.insert(0, str(default_workers()))
+        self.entry_workers.grid(row=10, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Surrogates per file (0 = off):").grid(row=11, column=0, sticky='w')
+        self.entry_surrogates = ttk.Entry(param_frame, width=10)
+        self.entry_surrogates.insert(0, "0")
+        self.entry_surrogates.grid(row=11, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Surrogate type:").grid(row=12, column=0, sticky='w')
+        self.combo_surrogate = ttk.Combobox(param_frame, state="readonly", width=10, values=["shuffle", "phase"])
+        self.combo_surrogate.set("shuffle")
+        self.combo_surrogate.grid(row=12, column=1, sticky='w', padx=5)
+        self.sweep_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Parameter sweep (comma-separated m, tau, window size and threshold)",
+                        variable=self.sweep_var).grid(row=13, column=0, columnspan=2, sticky='w')
+        rqa_frame = ttk.Frame(param_frame)
+        rqa_frame.grid(row=14, column=0, columnspan=2, sticky='w')
+        self.rqa_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rqa_frame, text="RQA of X and Y", variable=self.rqa_var).pack(side='left')
+        self.joint_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rqa_frame, text="Joint recurrence (JRQA)", variable=self.joint_var).pack(side='left', padx=10)
+        self.cross_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rqa_frame, text="Cross recurrence (CRQA)", variable=self.cross_var).pack(side='left')
 
         # Progress and log
         progress_frame = ttk.Frame(container)
@@ -81,17 +311,16 @@ class NLIDApp:
         if not os.path.isdir(folder):
             messagebox.showerror("Invalid folder", "Please select a valid folder first.")
             return
-        files = [f for f in os.listdir(folder) if f.lower().endswith((".xls", ".xlsx", ".csv"))]
+        files = [f for f in os.listdir(folder) if is_data_file(f)]
         if not files:
             messagebox.showwarning("No files found", "No Excel/CSV files in the folder.")
             return
         try:
-            path = os.path.join(folder, files[0])
-            df = pd.read_excel(path) if path.endswith(('.xls', '.xlsx')) else pd.read_csv(path)
-            cols = [''] + list(df.columns.str.strip())
+            index = SchemaIndex.scan([os.path.join(folder, f) for f in files])
+            cols = [''] + [col.strip() for col in index.intersection()]
             self.combo_col_x['values'] = cols
             self.combo_col_y['values'] = cols
-            messagebox.showinfo("Columns Loaded", f"Loaded columns from {files[0]}")
+            messagebox.showinfo("Columns Loaded", index.report())
         except Exception as e:
             messagebox.showerror("Load Error", str(e))
 
@@ -103,81 +332,241 @@ class NLIDApp:
         folder = self.entry_folder.get()
         col_x = self.combo_col_x.get()
         col_y = self.combo_col_y.get()
+        if self.sweep_var.get():
+            self.start_sweep(folder, col_x, col_y)
+            return
         try:
-            m = int(self.entry_m.get())
-            tau = int(self.entry_tau.get())
+            m = self.parse_embedding(self.entry_m.get())
+            tau = self.parse_embedding(self.entry_tau.get())
             window_size = int(self.entry_window.get())
             overlap = float(self.entry_overlap.get())
+            memory_mb = float(self.entry_memory.get())
+            threshold = float(self.entry_threshold.get())
+            workers = int(self.entry_workers.get())
+            surrogates = int(self.entry_surrogates.get())
         except ValueError:
-            messagebox.showerror("Invalid input", "m, tau, window size must be integers and overlap a float.")
+            messagebox.showerror("Invalid input", "m, tau (or \"auto\"), window size, workers and surrogates must be integers; overlap, memory budget and threshold floats.")
+            return
+        if workers < 1 or surrogates < 0:
+            messagebox.showerror("Invalid input", "Workers must be >=1 and surrogates >=0.")
+            return
+        threshold_type = self.combo_threshold_type.get()
+        if threshold_type == "fixed_rr" and not (0 < threshold <= 1):
+            messagebox.showerror("Invalid input", "Recurrence rate must be in (0, 1].")
             return
         if not os.path.isdir(folder) or not col_x or not col_y:
             messagebox.showerror("Missing info", "Ensure folder and two columns are selected.")
             return
-        if window_size <= 0 or not (0 <= overlap < 1):
+        whole = self.whole_var.get()
+        if memory_mb <= 0:
+            messagebox.showerror("Invalid input", "Memory budget must be >0 MB.")
+            return
+        if not whole and (window_size <= 0 or not (0 <= overlap < 1)):
             messagebox.showerror("Invalid window settings", "Window size must be >0 and 0<=overlap<1.")
             return
-        threading.Thread(target=self.process_files, args=(folder, col_x, col_y, m, tau, window_size, overlap), daemon=True).start()
+        if not whole and (int(window_size * (1 - overlap)) < 1 or
+                          (m is not None and tau is not None and window_size <= (m - 1) * tau)):
+            messagebox.showerror("Invalid window settings", "Window step must be >=1 sample and window size > (m-1)*tau.")
+            return
+        dtype = np.float32 if self.float32_var.get() else np.float64
+        recurrence = (("X", "Y") if self.rqa_var.get() else ()) + \
+            (("joint",) if self.joint_var.get() else ()) + (("cross",) if self.cross_var.get() else ())
+        threading.Thread(target=self.process_files,
+                         args=(folder, col_x, col_y, m, tau, window_size, overlap, whole, int(memory_mb * 2 ** 20), dtype,
+                               threshold, threshold_type, self.combo_engine.get(), workers,
+                               surrogates, self.combo_surrogate.get(), None, recurrence),
+                         daemon=True).start()
+
+    @staticmethod
+    def parse_embedding(text):
+        """An m or tau entry: a positive integer, or None for "auto"."""
+        if text.strip().lower() == "auto":
+            return None
+        value = int(text)
+        if value < 1:
+            raise ValueError("m and tau must be >=1")
+        return value
+
+    def start_sweep(self, folder, col_x, col_y):
+        try:
+            ms = parse_grid(self.entry_m.get(), int)
+            taus = parse_grid(self.entry_tau.get(), int)
+            window_sizes = parse_grid(self.entry_window.get(), int)
+            thresholds = parse_grid(self.entry_threshold.get(), float)
+            overlap = float(self.entry_overlap.get())
+            workers = int(self.entry_workers.get())
+        except ValueError:
+            messagebox.showerror("Invalid input", "Sweep lists must be comma-separated numbers: integers for m, tau and window size, floats for threshold.")
+            return
+        threshold_type = self.combo_threshold_type.get()
+        if workers < 1 or min(ms) < 1 or min(taus) < 1 or min(window_sizes) < 1 or not (0 <= overlap < 1):
+            messagebox.showerror("Invalid input", "m, tau, window sizes and workers must be >=1 and 0<=overlap<1.")
+            return
+        if threshold_type == "fixed_rr" and not all(0 < th <= 1 for th in thresholds):
+            messagebox.showerror("Invalid input", "Recurrence rates must be in (0, 1].")
+            return
+        if int(min(window_sizes) * (1 - overlap)) < 1:
+            messagebox.showerror("Invalid window settings", "Window step must be >=1 sample for every window size.")
+            return
+        if self.whole_var.get():
+            messagebox.showerror("Invalid input", "The parameter sweep works on windows; clear \"Whole recording\".")
+            return
+        if not os.path.isdir(folder) or not col_x or not col_y:
+            messagebox.showerror("Missing info", "Ensure folder and two columns are selected.")
+            return
+        threading.Thread(target=self.process_sweep,
+                         args=(folder, col_x, col_y, ms, taus, window_sizes, overlap, thresholds,
+                               threshold_type, workers),
+                         daemon=True).start()
 
-    def process_files(self, folder, col_x, col_y, m, tau, window_size, overlap):
-        files = [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(('.xlsx', '.csv'))]
+    def process_sweep(self, folder, col_x, col_y, ms, taus, window_sizes, overlap, thresholds,
+                      threshold_type="dynamic", workers=1):
+        """Average NLID of every file for each (m, tau, window size, threshold), saved as one tidy table."""
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if is_data_file(f)]
         self.progress['maximum'] = len(files)
         self.progress['value'] = 0
-        results = []
+        cx = col_x.strip().upper()
+        cy = col_y.strip().upper()
+        settings = dict(ms=ms, taus=taus, thresholds=thresholds, threshold_type=threshold_type)
+        plan = functools.partial(plan_nlid_sweep, col_x=col_x, col_y=col_y, window_sizes=window_sizes,
+                                 overlap=overlap, settings=settings, chunks=2 * workers)
+
+        def merge(file, partials):
+            # Chunks of one window size come back in order; concatenate them per configuration
+            windows = {}
+            for window_size, part in partials:
+                for (m, tau, threshold), (xy, yx) in part.items():
+                    windows.setdefault((m, tau, window_size, threshold), []).append((xy, yx))
+            rows = []
+            for (m, tau, window_size, threshold), chunks in sorted(windows.items()):
+                nlid_xy = np.concatenate([xy for xy, _ in chunks])
+                nlid_yx = np.concatenate([yx for _, yx in chunks])
+                rows.append({
+                    "檔名": os.path.basename(file),
+                    "m": m, "tau": tau, "Window size": window_size, "Threshold": threshold,
+                    "Windows": len(nlid_xy),
+                    f"Avg NLID({cx}|{cy})": np.mean(nlid_xy),
+                    f"Avg NLID({cy}|{cx})": np.mean(nlid_yx)
+                })
+            return rows
 
-        for file in files:
+        def on_file_done(file, rows):
+            self.log_message(f"Processed: {os.path.basename(file)} ({len(rows)} configurations)")
+            self.progress['value'] += 1
+
+        def on_error(file, exc):
             basename = os.path.basename(file)
-            try:
-                df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
-                df.columns = df.columns.str.strip().str.upper()
-                cx = col_x.strip().upper()
-                cy = col_y.strip().upper()
-
-                if cx not in df.columns or cy not in df.columns:
-                    self.log_message(f"{basename}: missing selected columns.")
-                    continue
-
-                x = df[cx].dropna().values
-                y = df[cy].dropna().values
-                min_len = min(len(x), len(y))
-                if min_len < window_size:
-                    self.log_message(f"{basename}: data shorter than window size.")
-                    continue
-
-                # Sliding window
-                step = int(window_size * (1 - overlap))
-                nlid_xy_list = []
-                nlid_yx_list = []
-                for start in range(0, min_len - window_size + 1, step):
-                    x_win = x[start:start + window_size]
-                    y_win = y[start:start + window_size]
-
-                    ra_x = RecurrenceAnalysis(x_win, m=m, tau=tau)
-                    ps_x = ra_x.reconstruct_phase_space()
-                    ra_y = RecurrenceAnalysis(y_win, m=m, tau=tau)
-                    ps_y = ra_y.reconstruct_phase_space()
-
-                    AR_X = RecurrenceAnalysis.compute_reconstruction_matrix(ps_x, threshold=0.1, threshold_type="dynamic")
-                    AR_Y = RecurrenceAnalysis.compute_reconstruction_matrix(ps_y, threshold=0.1, threshold_type="dynamic")
-
-                    nlid_xy, nlid_yx = RecurrenceAnalysis.calculate_nlid(AR_X, AR_Y)
-                    nlid_xy_list.append(nlid_xy)
-                    nlid_yx_list.append(nlid_yx)
-
-                # Compute average NLID
+            if isinstance(exc, SkipFile):
+                self.log_message(f"{basename}: {exc}")
+            else:
+                self.log_message(f"Error {basename}: {exc}")
+            self.progress['value'] += 1
+
+        outcomes = BatchRunner(workers).run(files, plan, compute_nlid_unit, merge, on_file_done, on_error)
+        results = [row for rows in filter(None, outcomes) for row in rows]
+
+        if results:
+            output_path = os.path.join(folder, "NLID_Sweep.xlsx")
+            pd.DataFrame(results).to_excel(output_path, index=False)
+            self.log_message(f"Sweep results saved to {output_path}")
+            messagebox.showinfo("Done", f"Sweep completed. Saved to: {output_path}")
+        else:
+            messagebox.showwarning("No Data", "No valid files processed.")
+
+    def process_files(self, folder, col_x, col_y, m, tau, window_size, overlap,
+                      whole=False, max_bytes=256 * 2 ** 20, dtype=np.float64,
+                      threshold=0.1, threshold_type="dynamic", engine="auto", workers=1,
+                      surrogates=0, surrogate_kind="shuffle", seed=None, recurrence=()):
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if is_data_file(f)]
+        self.progress['maximum'] = len(files)
+        self.progress['value'] = 0
+        cx = col_x.strip().upper()
+        cy = col_y.strip().upper()
+        step = int(window_size * (1 - overlap))
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy % 2 ** 32)
+        settings = dict(m=m, tau=tau, window_size=window_size, step=step, threshold=threshold,
+                        threshold_type=threshold_type, engine=engine, max_bytes=max_bytes, dtype=dtype,
+                        whole=whole, surrogates=surrogates, surrogate_kind=surrogate_kind, seed=seed,
+                        recurrence=tuple(recurrence))
+        # Split each recording into ~2 chunks per worker so long files keep every core busy
+        plan = functools.partial(plan_nlid_file, col_x=col_x, col_y=col_y, m=m, tau=tau,
+                                 window_size=window_size, step=step, whole=whole,
+                                 settings=settings, chunks=2 * workers)
+
+        def merge(file, partials):
+            # Surrogate units (and the "auto" embedding) come back as dicts after the NLID units
+            surrogate_parts = [part for part in partials if isinstance(part, dict) and "xy" in part]
+            embedding = [part for part in partials if isinstance(part, dict) and "m" in part]
+            partials = [part for part in partials if not isinstance(part, dict)]
+            if whole:
+                avg_xy, avg_yx = partials[0][:2]
+            else:
+                # Windows come back chunk by chunk in order; average over all of them
+                nlid_xy_list = np.concatenate([part[0] for part in partials])
+                nlid_yx_list = np.concatenate([part[1] for part in partials])
                 avg_xy = np.mean(nlid_xy_list)
                 avg_yx = np.mean(nlid_yx_list)
+            row = {"檔名": os.path.basename(file)}
+            if embedding:
+                row.update(embedding[0])
+            row.update({
+                f"Avg NLID({cx}|{cy})": avg_xy,
+                f"Avg NLID({cy}|{cx})": avg_yx
+            })
+            if surrogates:
+                # Each surrogate is averaged over the windows like the observed value, then ranked against it
+                if whole and surrogate_parts:
+                    null_xy = np.concatenate([part["xy"][:, 0] for part in surrogate_parts])
+                    null_yx = np.concatenate([part["yx"][:, 0] for part in surrogate_parts])
+                elif surrogate_parts:
+                    null_xy = np.concatenate([part["xy"] for part in surrogate_parts], axis=1).mean(axis=1)
+                    null_yx = np.concatenate([part["yx"] for part in surrogate_parts], axis=1).mean(axis=1)
+                else:
+                    null_xy = null_yx = np.empty(0)
+                row[f"p NLID({cx}|{cy})"] = (RecurrenceAnalysis.surrogate_p_value(avg_xy, null_xy)
+                                             if len(null_xy) else np.nan)
+                row[f"p NLID({cy}|{cx})"] = (RecurrenceAnalysis.surrogate_p_value(avg_yx, null_yx)
+                                             if len(null_yx) else np.nan)
+                row["Surrogates"] = len(null_xy)
+            if recurrence:
+                # RQA comes after the NLID arrays of each unit: one dict per matrix, averaged over the windows
+                labels = {"X": cx, "Y": cy, "joint": "JR", "cross": "CR"}
+                for key in recurrence:
+                    name = labels[key]
+                    chunks = [part[2][key] for part in partials if part[2] is not None]
+                    for measure in RQA_MEASURES:
+                        values = np.concatenate([np.atleast_1d(chunk[measure]) for chunk in chunks]) if chunks else []
+                        row[f"{measure}({name})"] = (np.nanmean(values) if len(values) and not np.isnan(values).all()
+                                                     else np.nan)
+            return row, (1 if whole else len(nlid_xy_list))
 
-                results.append({
-                    "檔名": basename,
-                    f"Avg NLID({cx}|{cy})": avg_xy,
-                    f"Avg NLID({cy}|{cx})": avg_yx
-                })
-                self.log_message(f"Processed: {basename} (windows: {len(nlid_xy_list)})")
-            except Exception as e:
-                self.log_message(f"Error {basename}: {e}")
+        def on_file_done(file, result):
+            row, count = result
+            if recurrence and whole and all(np.isnan(value) for key, value in row.items() if key.startswith("RR(")):
+                self.log_message(f"{os.path.basename(file)}: RQA skipped (recording exceeds the memory budget)")
+            if surrogates and not row["Surrogates"]:
+                self.log_message(f"{os.path.basename(file)}: surrogates skipped (recording exceeds the memory budget)")
+            embedding = f", m={row['m']}, tau={row['tau']}" if "m" in row else ""
+            if whole:
+                self.log_message(f"Processed: {os.path.basename(file)} (whole recording{embedding})")
+            else:
+                self.log_message(f"Processed: {os.path.basename(file)} (windows: {count}{embedding})")
+            self.progress['value'] += 1
+
+        def on_error(file, exc):
+            basename = os.path.basename(file)
+            if isinstance(exc, SkipFile):
+                self.log_message(f"{basename}: {exc}")
+            else:
+                self.log_message(f"Error {basename}: {exc}")
             self.progress['value'] += 1
 
+        outcomes = BatchRunner(workers).run(files, plan, compute_nlid_unit, merge, on_file_done, on_error)
+        results = [row for row, _ in filter(None, outcomes)]
+
+        if surrogates:
+            self.log_message(f"Surrogate test: {surrogates} {surrogate_kind} surrogates per file, seed {seed}")
         if results:
             result_df = pd.DataFrame(results)
             output_path = os.path.join(folder, "NLID_Results_Avg.xlsx")
@@ -1,5 +1,20 @@
+import tempfile
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy import sparse
+from scipy.spatial import cKDTree, ConvexHull, QhullError
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba 为可选依赖，没有时融合内核退回到 NumPy 实现
+    njit = None
+    prange = range
+
+# rqa_measures 输出的指标（按此顺序）
+RQA_MEASURES = ("RR", "DET", "L_mean", "L_max", "ENTR", "LAM", "TT", "V_max", "TREND")
+
+# 单字节 popcount 查表（NumPy < 2.0 没有 np.bitwise_count 时使用）
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
 class RecurrenceAnalysis:
     def __init__(self, data, m, tau):
@@ -26,27 +41,472 @@ class RecurrenceAnalysis:
         return self.phase_space
 
     @staticmethod
-    def compute_reconstruction_matrix(phase_space, threshold=None, threshold_type="dynamic"):
+    def embed_windows(data, m, tau, window_size, step):
+        """
+        以零拷贝的步幅视图重构所有滑动窗口的相空间。
+        :param data: 输入的一维时间序列
+        :param m: 嵌入维度
+        :param tau: 时间延迟
+        :param window_size: 窗口长度（样本数）
+        :param step: 窗口步长（样本数）
+        :return: 形状为 (窗口数, M, m) 的只读视图，M = window_size - (m - 1) * tau
+        """
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        M = window_size - (m - 1) * tau
+        if M <= 0:
+            raise ValueError("窗口长度不足以容纳 (m - 1) * tau + 1 个样本")
+        if step <= 0:
+            raise ValueError("窗口步长必须为正整数")
+        n_windows = max(0, (len(data) - window_size) // step + 1)
+        itemsize = data.strides[0]
+        return np.lib.stride_tricks.as_strided(
+            data, shape=(n_windows, M, m),
+            strides=(step * itemsize, itemsize, tau * itemsize), writeable=False
+        )
+
+    @staticmethod
+    def _augment(phase_space):
+        # ||a||² + ||b||² - 2a·b 写成增广向量 [a, ||a||², 1] 与 [-2b, 1, ||b||²] 的内积，
+        # 一次矩阵乘法即可得到整个平方距离矩阵，省去广播相加产生的中间数组
+        phase_space = np.asarray(phase_space, dtype=np.float64)
+        squared_norms = np.sum(phase_space**2, axis=-1, keepdims=True)
+        ones = np.ones_like(squared_norms)
+        left = np.concatenate([phase_space, squared_norms, ones], axis=-1)
+        right = np.concatenate([-2 * phase_space, ones, squared_norms], axis=-1)
+        return left, right
+
+    @staticmethod
+    def compute_squared_distance_matrix(phase_space, out=None):
+        """
+        用 Gram 技巧计算平方欧氏距离矩阵，支持 (..., M, m) 的批量输入。
+        :param phase_space: 相空间矩阵或按窗口堆叠的相空间
+        :param out: 可选的输出缓冲区，形状为 (..., M, M)
+        :return: 平方距离矩阵（舍入误差可能带来极小的负值）
+        """
+        left, right = RecurrenceAnalysis._augment(phase_space)
+        return np.matmul(left, np.swapaxes(right, -1, -2), out=out)
+
+    @staticmethod
+    def compute_cross_squared_distance_matrix(phase_space_x, phase_space_y, out=None):
+        """
+        用同一 Gram 技巧计算两组相空间点之间的平方欧氏距离 ||x_i - y_j||²（交叉重现图的距离），
+        支持 (..., M, m) 的批量输入。
+        :param phase_space_x: X 的相空间（行）
+        :param phase_space_y: Y 的相空间（列），嵌入维度须与 X 相同
+        :param out: 可选的输出缓冲区，形状为 (..., M_x, M_y)
+        :return: 平方距离矩阵
+        """
+        left, _ = RecurrenceAnalysis._augment(phase_space_x)
+        _, right = RecurrenceAnalysis._augment(phase_space_y)
+        return np.matmul(left, np.swapaxes(right, -1, -2), out=out)
+
+    @staticmethod
+    def compute_distance_matrix(phase_space):
+        """
+        计算欧氏距离矩阵，支持 (..., M, m) 的批量输入。
+        :param phase_space: 相空间矩阵或按窗口堆叠的相空间
+        :return: 形状为 (..., M, M) 的距离矩阵
+        """
+        distance_matrix = RecurrenceAnalysis.compute_squared_distance_matrix(phase_space)
+        np.maximum(distance_matrix, 0, out=distance_matrix)
+        return np.sqrt(distance_matrix, out=distance_matrix)
+
+    @staticmethod
+    def threshold_value(distance_matrix, threshold, threshold_type="dynamic"):
+        """
+        计算距离阈值；批量输入时每个矩阵各自计算动态阈值。
+        :param distance_matrix: 形状为 (..., M, M) 的距离矩阵
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"（threshold 为目标重现率）
+        :return: 可直接与距离矩阵广播比较的阈值
+        """
+        if threshold_type == "static":
+            return threshold
+        if threshold_type == "dynamic":
+            d_max = np.max(distance_matrix, axis=(-2, -1), keepdims=True)
+            d_min = np.min(distance_matrix, axis=(-2, -1), keepdims=True)
+            return (d_max - d_min) * threshold
+        if threshold_type == "fixed_rr":
+            return RecurrenceAnalysis.rate_limit(distance_matrix, threshold)[..., None, None]
+        raise ValueError(f"未知的阈值类型: {threshold_type}")
+
+    @staticmethod
+    def rate_limit(matrix, rate):
+        """
+        固定重现率阈值：取每个矩阵中第 k 小的元素（k = ceil(rate·N²)，含对角线），
+        用 np.partition 做部分选择，不需要完整排序。
+        :param matrix: 形状为 (..., N, N) 的距离或平方距离矩阵
+        :param rate: 目标重现率，0 < rate <= 1
+        :return: 形状为 (...) 的阈值，满足 matrix <= 阈值 的元素约占 rate
+        """
+        if not 0 < rate <= 1:
+            raise ValueError("重现率必须在 (0, 1] 之间")
+        flat = matrix.reshape(matrix.shape[:-2] + (-1,))
+        k = RecurrenceAnalysis._rate_rank(flat.shape[-1], rate)
+        return np.partition(flat, k - 1, axis=-1)[..., k - 1]
+
+    @staticmethod
+    def _rate_rank(n_pairs, rate):
+        return int(min(n_pairs, max(1, np.ceil(rate * n_pairs))))
+
+    @staticmethod
+    def compute_reconstruction_matrix(phase_space, threshold=None, threshold_type="dynamic", packed=False):
         """
         计算重建矩阵 R(i, j)。
         :param phase_space: 相空间矩阵
         :param threshold: 静态或动态的阈值
-        :param threshold_type: "static" 或 "dynamic"
-        :return: 重建矩阵或二值化矩阵
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param packed: 为 True 时返回按位打包的重建矩阵（见 pack_recurrence_matrix）
+        :return: 距离矩阵，或布尔重建矩阵 / 打包后的 uint8 位矩阵
         """
-        squared_norms = np.sum(phase_space**2, axis=1, keepdims=True)
-        distance_matrix = np.sqrt(
-            np.maximum(0, squared_norms + squared_norms.T - 2 * np.dot(phase_space, phase_space.T))
-        )
+        distance_matrix = RecurrenceAnalysis.compute_distance_matrix(phase_space)
 
-        if threshold_type == "static" and threshold is not None:
-            return (distance_matrix <= threshold).astype(int)
-        elif threshold_type == "dynamic" and threshold is not None:
-            dTH = (np.max(distance_matrix) - np.min(distance_matrix)) * threshold
-            return (distance_matrix <= dTH).astype(int)
+        if threshold_type in ("static", "dynamic", "fixed_rr") and threshold is not None:
+            dTH = RecurrenceAnalysis.threshold_value(distance_matrix, threshold, threshold_type)
+            if packed:
+                # 直接按列比较写入连续缓冲区，省去再转置一次布尔矩阵
+                columns = np.empty(distance_matrix.shape, dtype=bool)
+                np.less_equal(np.swapaxes(distance_matrix, -1, -2), dTH, out=columns)
+                return np.packbits(columns, axis=-1)
+            return distance_matrix <= dTH
 
         return distance_matrix
 
+    @staticmethod
+    def compute_cross_recurrence_matrix(phase_space_x, phase_space_y, threshold=0.1, threshold_type="dynamic",
+                                        packed=False):
+        """
+        交叉重现矩阵 CR(i, j) = [||x_i - y_j|| <= dTH]，阈值规则与 compute_reconstruction_matrix 相同
+        （dynamic 按交叉距离矩阵的最大/最小值）。两个通道的量纲不同时宜先标准化。
+        :param phase_space_x: X 的相空间，形状为 (..., M, m)
+        :param phase_space_y: Y 的相空间，形状相同
+        :param threshold: 静态或动态的阈值；fixed_rr 时为目标重现率
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param packed: 为 True 时返回按列打包的位矩阵（见 pack_recurrence_matrix）
+        :return: 布尔矩阵（不对称），或打包后的 uint8 位矩阵
+        """
+        squared = RecurrenceAnalysis.compute_cross_squared_distance_matrix(phase_space_x, phase_space_y)
+        matrix = RecurrenceAnalysis.threshold_squared(squared, threshold, threshold_type)
+        return RecurrenceAnalysis.pack_recurrence_matrix(matrix) if packed else matrix
+
+    @staticmethod
+    def compute_joint_recurrence_matrix(phase_space_x, phase_space_y, threshold=0.1, threshold_type="dynamic",
+                                        packed=False):
+        """
+        联合重现矩阵 JR = R_X ∧ R_Y：两个通道在时刻 i、j 同时重现。
+        打包时直接对两个位矩阵按位与，结果仍是按列打包的位矩阵。
+        :param phase_space_x: X 的相空间，形状为 (..., M, m)
+        :param phase_space_y: Y 的相空间，形状相同
+        :param threshold: 两个通道各自使用的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param packed: 为 True 时返回打包后的位矩阵
+        :return: 布尔矩阵，或打包后的 uint8 位矩阵
+        """
+        AR_X = RecurrenceAnalysis.compute_reconstruction_matrix(phase_space_x, threshold, threshold_type, packed)
+        AR_Y = RecurrenceAnalysis.compute_reconstruction_matrix(phase_space_y, threshold, threshold_type, packed)
+        return np.bitwise_and(AR_X, AR_Y, out=AR_X)
+
+    @staticmethod
+    def pack_recurrence_matrix(matrix):
+        """
+        把二值化重建矩阵按位打包（每字节 8 个元素，内存为 int64 矩阵的 1/64）。
+        打包后第 j 行存放原矩阵第 j 列的 N 个比特（对称矩阵即按行打包），
+        这样列和就是每行的 popcount。
+        :param matrix: 形状为 (..., N, N) 的二值化矩阵
+        :return: 形状为 (..., N, ceil(N / 8)) 的 uint8 数组
+        """
+        matrix = np.asarray(matrix)
+        columns = np.empty(matrix.shape[:-2] + (matrix.shape[-1], matrix.shape[-2]), dtype=bool)
+        np.not_equal(np.swapaxes(matrix, -1, -2), 0, out=columns)
+        return np.packbits(columns, axis=-1)
+
+    @staticmethod
+    def unpack_recurrence_matrix(bits, n):
+        """
+        pack_recurrence_matrix 的逆运算。
+        :param bits: 打包后的 uint8 位矩阵
+        :param n: 原矩阵的行数
+        :return: 形状为 (..., n, N) 的布尔矩阵
+        """
+        columns = np.unpackbits(bits, axis=-1, count=n).astype(bool)
+        return np.swapaxes(columns, -1, -2)
+
+    @staticmethod
+    def popcount(bits):
+        """
+        统计打包位矩阵每行中 1 的个数（即原矩阵的列和）。
+        :param bits: 形状为 (..., N, nbytes) 的 uint8 数组
+        :return: 形状为 (..., N) 的 int32 数组
+        """
+        if hasattr(np, "bitwise_count"):
+            return np.bitwise_count(bits).sum(axis=-1, dtype=np.int32)
+        return _POPCOUNT_TABLE[bits].sum(axis=-1, dtype=np.int32)
+
+    @staticmethod
+    def threshold_squared(squared, threshold, threshold_type="dynamic", out=None):
+        """
+        在平方距离上二值化，省去逐元素开方；动态阈值只需对每个矩阵的最大/最小值开方。
+        :param squared: 形状为 (..., M, M) 的平方距离矩阵
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param out: 可选的布尔输出缓冲区
+        :return: 布尔重建矩阵
+        """
+        flat = squared.reshape(squared.shape[:-2] + (-1,))
+        if threshold_type == "fixed_rr":
+            # 开方单调，平方距离上的第 k 小即距离上的第 k 小
+            limit = RecurrenceAnalysis.rate_limit(squared, threshold)
+        elif threshold_type == "dynamic":
+            limit = RecurrenceAnalysis.squared_limit(np.max(flat, axis=-1), np.min(flat, axis=-1),
+                                                     threshold, threshold_type)
+        else:
+            limit = RecurrenceAnalysis.squared_limit(None, None, threshold, threshold_type)
+        return np.less_equal(squared, limit[..., None, None], out=out)
+
+    @staticmethod
+    def squared_limit(squared_max, squared_min, threshold, threshold_type="dynamic"):
+        """
+        由平方距离的最大/最小值求出平方距离上的比较上限。
+        :param squared_max: 平方距离的最大值（静态阈值时不使用）
+        :param squared_min: 平方距离的最小值（静态阈值时不使用）
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static" 或 "dynamic"
+        :return: 上限 limit，满足 d <= dTH 等价于 d² <= limit
+        """
+        if threshold_type == "dynamic":
+            d_max = np.sqrt(np.maximum(squared_max, 0))
+            d_min = np.sqrt(np.maximum(squared_min, 0))
+            dTH = (d_max - d_min) * threshold
+        elif threshold_type == "static":
+            dTH = np.asarray(threshold, dtype=np.float64)
+        else:
+            raise ValueError(f"未知的阈值类型: {threshold_type}")
+        # 负阈值时没有任何点满足 d <= dTH
+        return np.where(dTH >= 0, np.square(dTH), -np.inf)
+
+    @staticmethod
+    def _augmented_windows(data, m, tau, window_size, step, transpose=False):
+        # 整条序列只做一次增广嵌入，各窗口是其上的零拷贝步幅视图；
+        # rows @ columns 得到平方距离矩阵，transpose=True 时交换两侧得到其转置
+        left, right = RecurrenceAnalysis._augment(
+            RecurrenceAnalysis(data, m, tau).reconstruct_phase_space())
+        if transpose:
+            left, right = right, left
+        right = np.ascontiguousarray(right.T)
+        n_windows, M, _ = RecurrenceAnalysis.embed_windows(data, m, tau, window_size, step).shape
+        row = left.strides[0]
+        rows = np.lib.stride_tricks.as_strided(
+            left, shape=(n_windows, M, m + 2), strides=(step * row, row, left.strides[1]), writeable=False)
+        columns = np.lib.stride_tricks.as_strided(
+            right, shape=(n_windows, m + 2, M), strides=(step * right.strides[1],) + right.strides,
+            writeable=False)
+        return rows, columns
+
+    @staticmethod
+    def iter_recurrence_windows(x, y, m, tau, window_size, step, threshold=0.1,
+                                threshold_type="dynamic", max_batch_bytes=2**20, packed=False):
+        """
+        分批产生所有滑动窗口的 X、Y 二值化重建矩阵。
+        每批的距离计算和阈值比较都是对 (B, M, M) 数组的整体运算；
+        产生的数组是复用的缓冲区，只在下一次迭代前有效。
+        :param x: 一维时间序列 X
+        :param y: 一维时间序列 Y（超出较短序列的部分被截去）
+        :param m: 嵌入维度
+        :param tau: 时间延迟
+        :param window_size: 窗口长度（样本数）
+        :param step: 窗口步长（样本数）
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param max_batch_bytes: 每批工作缓冲区的大致内存（字节），宜与 CPU 缓存同量级
+        :param packed: 为 True 时产生按位打包的矩阵（见 pack_recurrence_matrix）
+        :return: 生成器，依次产生 (起始窗口序号, AR_X 批, AR_Y 批)
+        """
+        n = min(len(x), len(y))
+        # 打包时直接计算转置的距离矩阵，按行比较、打包即得到按列打包的结果
+        rows_x, columns_x = RecurrenceAnalysis._augmented_windows(
+            np.asarray(x)[:n], m, tau, window_size, step, transpose=packed)
+        rows_y, columns_y = RecurrenceAnalysis._augmented_windows(
+            np.asarray(y)[:n], m, tau, window_size, step, transpose=packed)
+        n_windows, M = rows_x.shape[0], rows_x.shape[1]
+        if n_windows == 0:
+            return
+
+        # 每个窗口需要一块 M×M 的 float64 工作区，外加布尔矩阵（打包时为一块比较缓冲区和两块位矩阵）
+        per_window = 8 * M * M + (M * M + M * ((M + 7) // 8) * 2 if packed else 2 * M * M)
+        batch = min(n_windows, max(1, int(max_batch_bytes // per_window)))
+        work = np.empty((batch, M, M), dtype=np.float64)
+        if packed:
+            mask = np.empty((batch, M, M), dtype=bool)
+            AR_X = np.empty((batch, M, (M + 7) // 8), dtype=np.uint8)
+            AR_Y = np.empty((batch, M, (M + 7) // 8), dtype=np.uint8)
+        else:
+            AR_X = np.empty((batch, M, M), dtype=bool)
+            AR_Y = np.empty((batch, M, M), dtype=bool)
+
+        for start in range(0, n_windows, batch):
+            b = min(batch, n_windows - start)
+            for rows, columns, AR in ((rows_x, columns_x, AR_X), (rows_y, columns_y, AR_Y)):
+                np.matmul(rows[start:start + b], columns[start:start + b], out=work[:b])
+                if packed:
+                    RecurrenceAnalysis.threshold_squared(work[:b], threshold, threshold_type, out=mask[:b])
+                    AR[:b] = np.packbits(mask[:b], axis=-1)
+                else:
+                    RecurrenceAnalysis.threshold_squared(work[:b], threshold, threshold_type, out=AR[:b])
+            yield start, AR_X[:b], AR_Y[:b]
+
+    @staticmethod
+    def standardize(data):
+        """z 分数标准化（标准差为 0 时只去均值），用于量纲不同的两个通道之间的交叉重现。"""
+        data = np.asarray(data, dtype=np.float64)
+        spread = data.std()
+        return (data - data.mean()) / (spread if spread > 0 else 1.0)
+
+    @staticmethod
+    def iter_cross_recurrence_windows(x, y, m, tau, window_size, step, threshold=0.1,
+                                      threshold_type="dynamic", max_batch_bytes=2**20, packed=False):
+        """
+        分批产生所有滑动窗口的交叉重现矩阵 CR(i, j) = [||x_i - y_j|| <= dTH]。
+        与 iter_recurrence_windows 共用整条序列的增广嵌入：行取 X 的增广向量，列取 Y 的，
+        每批一次矩阵乘法得到 (B, M, M) 的交叉平方距离。产生的数组是复用的缓冲区，只在下一次迭代前有效。
+        两个通道的量纲不同时，调用前宜先用 standardize 标准化。
+        :param packed: 为 True 时产生按列打包的位矩阵（直接计算转置的距离矩阵再按行打包）
+        :return: 生成器，依次产生 (起始窗口序号, CR 批)
+        """
+        n = min(len(x), len(y))
+        rows_x, columns_x = RecurrenceAnalysis._augmented_windows(
+            np.asarray(x)[:n], m, tau, window_size, step, transpose=packed)
+        rows_y, columns_y = RecurrenceAnalysis._augmented_windows(
+            np.asarray(y)[:n], m, tau, window_size, step, transpose=packed)
+        # 打包时增广的两侧已交换：Y 的行乘 X 的列即 CR 的转置
+        rows, columns = (rows_y, columns_x) if packed else (rows_x, columns_y)
+        n_windows, M = rows.shape[0], rows.shape[1]
+        if n_windows == 0:
+            return
+
+        per_window = 8 * M * M + (M * M + M * ((M + 7) // 8) if packed else M * M)
+        batch = min(n_windows, max(1, int(max_batch_bytes // per_window)))
+        work = np.empty((batch, M, M), dtype=np.float64)
+        mask = np.empty((batch, M, M), dtype=bool)
+        if packed:
+            CR = np.empty((batch, M, (M + 7) // 8), dtype=np.uint8)
+        for start in range(0, n_windows, batch):
+            b = min(batch, n_windows - start)
+            np.matmul(rows[start:start + b], columns[start:start + b], out=work[:b])
+            RecurrenceAnalysis.threshold_squared(work[:b], threshold, threshold_type, out=mask[:b])
+            if packed:
+                CR[:b] = np.packbits(mask[:b], axis=-1)
+                yield start, CR[:b]
+            else:
+                yield start, mask[:b]
+
+    @staticmethod
+    def compute_nlid_windows(x, y, m, tau, window_size, step, threshold=0.1,
+                             threshold_type="dynamic", max_batch_bytes=2**20, engine="auto"):
+        """
+        一次性计算整条序列所有滑动窗口的 NLID。
+        :param x: 一维时间序列 X
+        :param y: 一维时间序列 Y（超出较短序列的部分被截去）
+        :param m: 嵌入维度
+        :param tau: 时间延迟
+        :param window_size: 窗口长度（样本数）
+        :param step: 窗口步长（样本数）
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param max_batch_bytes: 每批工作缓冲区的大致内存（字节）
+        :param engine: "batch"（批量整窗计算）、"rolling"（增量复用重叠部分，见 RollingRecurrence）、
+                       "sparse"（逐窗口用 KD 树构造稀疏矩阵，适合长窗口、小阈值）、
+                       "fused"（numba 融合内核，各窗口并行、不构造矩阵；float32 逐列累加的顺序与 batch 不同，
+                       结果与 batch 相差约 1e-7，恰好落在阈值上的点对也可能不同；没有 numba 或 fixed_rr 时同 batch）
+                       或 "auto"（窗口点数不少于 RollingRecurrence.MIN_SIZE 且重叠率高于 0.9 时用 rolling，
+                       其余用 batch，两者结果逐位相同；fused 只在显式指定时使用）
+        :return: (NLID(X|Y) 数组, NLID(Y|X) 数组)，每个窗口一个值
+        """
+        M = window_size - (m - 1) * tau
+        if engine == "auto":
+            if M >= RollingRecurrence.MIN_SIZE and step * 10 < M:
+                engine = "rolling"
+            else:
+                engine = "batch"
+        if engine == "rolling":
+            return RollingRecurrence.compute_nlid_windows(x, y, m, tau, window_size, step,
+                                                          threshold, threshold_type)
+        if engine == "fused" and njit is not None and threshold_type in ("static", "dynamic"):
+            n = min(len(x), len(y))
+            n_windows = RecurrenceAnalysis.embed_windows(np.asarray(x)[:n], m, tau, window_size, step).shape[0]
+            ps_x = RecurrenceAnalysis(np.asarray(x)[:n], m, tau).reconstruct_phase_space()
+            ps_y = RecurrenceAnalysis(np.asarray(y)[:n], m, tau).reconstruct_phase_space()
+            nlid_xy = np.zeros(n_windows, dtype=np.float32)
+            nlid_yx = np.zeros(n_windows, dtype=np.float32)
+            _fused_window_nlid(np.ascontiguousarray(ps_x.T), np.ascontiguousarray(ps_y.T), M, step,
+                               float(threshold), threshold_type == "dynamic", nlid_xy, nlid_yx)
+            return nlid_xy, nlid_yx
+        if engine == "fused":
+            engine = "batch"
+        if engine == "sparse":
+            n = min(len(x), len(y))
+            windows_x = RecurrenceAnalysis.embed_windows(np.asarray(x)[:n], m, tau, window_size, step)
+            windows_y = RecurrenceAnalysis.embed_windows(np.asarray(y)[:n], m, tau, window_size, step)
+            nlid_xy = np.zeros(len(windows_x), dtype=np.float32)
+            nlid_yx = np.zeros(len(windows_x), dtype=np.float32)
+            for w, (ps_x, ps_y) in enumerate(zip(windows_x, windows_y)):
+                nlid_xy[w], nlid_yx[w] = RecurrenceAnalysis.calculate_nlid(
+                    RecurrenceAnalysis.compute_sparse_recurrence_matrix(ps_x, threshold, threshold_type),
+                    RecurrenceAnalysis.compute_sparse_recurrence_matrix(ps_y, threshold, threshold_type))
+            return nlid_xy, nlid_yx
+        if engine != "batch":
+            raise ValueError(f"未知的计算引擎: {engine}")
+
+        n = min(len(x), len(y))
+        n_windows = RecurrenceAnalysis.embed_windows(np.asarray(x)[:n], m, tau, window_size, step).shape[0]
+        nlid_xy = np.zeros(n_windows, dtype=np.float32)
+        nlid_yx = np.zeros(n_windows, dtype=np.float32)
+        for start, AR_X, AR_Y in RecurrenceAnalysis.iter_recurrence_windows(
+                x, y, m, tau, window_size, step, threshold, threshold_type, max_batch_bytes, packed=True):
+            stop = start + len(AR_X)
+            nlid_xy[start:stop], nlid_yx[start:stop] = RecurrenceAnalysis.calculate_nlid_batch(
+                AR_X, AR_Y, packed=True)
+        return nlid_xy, nlid_yx
+
+    @staticmethod
+    def compute_nlid_rqa_windows(x, y, m, tau, window_size, step, threshold=0.1, threshold_type="dynamic",
+                                 max_batch_bytes=2**20, l_min=2, v_min=2, theiler=1, recurrence=("X", "Y")):
+        """
+        一次性计算所有滑动窗口的 NLID，以及所选重现矩阵的 RQA 指标（见 rqa_measures）：
+        "X"、"Y" 为各自的重现矩阵，"joint" 为联合重现矩阵 R_X ∧ R_Y（JRQA），
+        "cross" 为两个标准化通道之间的交叉重现矩阵（CRQA，不对称，主对角线计入对角线）。
+        NLID、X、Y 和联合重现都由同一批二值化重建矩阵得到，NLID 的结果与 engine="batch" 相同；
+        交叉重现另做一次同样分批的矩阵乘法。
+        :param l_min: 对角线的最小长度
+        :param v_min: 竖线的最小长度
+        :param theiler: Theiler 窗口，|i - j| < theiler 的点不计入线段（交叉重现不使用）
+        :param recurrence: 要计算 RQA 的矩阵，"X"、"Y"、"joint"、"cross" 的任意组合
+        :return: (NLID(X|Y) 数组, NLID(Y|X) 数组, {矩阵名: RQA})，RQA 为 {指标名: 每个窗口一个值的数组}
+        """
+        n = min(len(x), len(y))
+        n_windows = RecurrenceAnalysis.embed_windows(np.asarray(x)[:n], m, tau, window_size, step).shape[0]
+        nlid_xy = np.zeros(n_windows, dtype=np.float32)
+        nlid_yx = np.zeros(n_windows, dtype=np.float32)
+        rqa = {name: {measure: np.full(n_windows, np.nan) for measure in RQA_MEASURES} for name in recurrence}
+
+        def store(name, start, matrices, theiler, symmetric):
+            for measure, values in RecurrenceAnalysis.rqa_measures(matrices, l_min, v_min, theiler, symmetric).items():
+                rqa[name][measure][start:start + len(matrices)] = values
+
+        for start, AR_X, AR_Y in RecurrenceAnalysis.iter_recurrence_windows(
+                x, y, m, tau, window_size, step, threshold, threshold_type, max_batch_bytes):
+            stop = start + len(AR_X)
+            nlid_xy[start:stop], nlid_yx[start:stop] = RecurrenceAnalysis.calculate_nlid_batch(AR_X, AR_Y)
+            for name, AR in (("X", AR_X), ("Y", AR_Y)):
+                if name in rqa:
+                    store(name, start, AR, theiler, True)
+            if "joint" in rqa:
+                store("joint", start, AR_X & AR_Y, theiler, True)
+        if "cross" in rqa:
+            for start, CR in RecurrenceAnalysis.iter_cross_recurrence_windows(
+                    RecurrenceAnalysis.standardize(np.asarray(x)[:n]), RecurrenceAnalysis.standardize(np.asarray(y)[:n]),
+                    m, tau, window_size, step, threshold, threshold_type, max_batch_bytes):
+                store("cross", start, CR, 0, False)
+        return nlid_xy, nlid_yx, rqa
 
     @staticmethod
     def visualize_recurrence_plot(matrix, title, xlabel, ylabel):
@@ -62,28 +522,1221 @@ class RecurrenceAnalysis:
         plt.show()
 
     @staticmethod
-    def calculate_nlid(AR_EEG1_BW, AR_EEG2_BW):
+    def calculate_nlid(AR_EEG1_BW, AR_EEG2_BW, packed=False):
         """
         计算 NLID 指标。
+        :param packed: 输入是否为 pack_recurrence_matrix 打包后的位矩阵
+                       （也接受 compute_sparse_recurrence_matrix 得到的稀疏矩阵）
         """
-        N = AR_EEG1_BW.shape[1]
+        NLID_XY_avg, NLID_YX_avg = RecurrenceAnalysis.calculate_nlid_batch(AR_EEG1_BW, AR_EEG2_BW, packed=packed)
+        return NLID_XY_avg, NLID_YX_avg
 
-        # 初始化为浮点数组
-        NLID_YX = np.zeros(N, dtype=np.float32)
-        NLID_XY = np.zeros(N, dtype=np.float32)
+    @staticmethod
+    def _column_sums(matrix):
+        # 布尔矩阵按 uint8 视图做整数累加，比逐元素转换成 float32 再求和快；计数在 2**24 以内时结果完全相同
+        if matrix.dtype == bool:
+            counts = np.einsum('...ij->...j', matrix.view(np.uint8), dtype=np.int32, casting='unsafe')
+            return counts.astype(np.float32)
+        return np.sum(matrix, axis=-2, dtype=np.float32)
 
-        # 批量矩阵操作
-        IP = AR_EEG1_BW * AR_EEG2_BW
-        number_of_1 = np.sum(IP, axis=0, dtype=np.float32)
-        number_of_EEG1 = np.sum(AR_EEG1_BW, axis=0, dtype=np.float32)
-        number_of_EEG2 = np.sum(AR_EEG2_BW, axis=0, dtype=np.float32)
+    @staticmethod
+    def calculate_nlid_batch(AR_EEG1_BW, AR_EEG2_BW, column_order=None, packed=False):
+        """
+        计算 NLID 指标，支持形状为 (..., N, N) 的按窗口堆叠的重建矩阵。
+        :param column_order: 可选的列顺序；矩阵行列按同一置换存放时（如环形缓冲区），
+                             按时间顺序取列可使求平均的累加顺序与未置换时一致
+        :param packed: 输入是否为打包后的位矩阵；此时联合重现由按位与加 popcount 得到
+                       （scipy.sparse 矩阵会自动识别，只支持单个矩阵）
+        :return: (NLID(X|Y), NLID(Y|X))，前导维度与输入一致
+        """
+        if sparse.issparse(AR_EEG1_BW) or sparse.issparse(AR_EEG2_BW):
+            # 稀疏矩阵：联合重现只在两者共有的非零位置上
+            number_of_1 = RecurrenceAnalysis._sparse_column_sums(
+                sparse.csr_matrix(AR_EEG1_BW).multiply(AR_EEG2_BW))
+            number_of_EEG1 = RecurrenceAnalysis._sparse_column_sums(AR_EEG1_BW)
+            number_of_EEG2 = RecurrenceAnalysis._sparse_column_sums(AR_EEG2_BW)
+        elif packed:
+            number_of_1 = RecurrenceAnalysis.popcount(AR_EEG1_BW & AR_EEG2_BW).astype(np.float32)
+            number_of_EEG1 = RecurrenceAnalysis.popcount(AR_EEG1_BW).astype(np.float32)
+            number_of_EEG2 = RecurrenceAnalysis.popcount(AR_EEG2_BW).astype(np.float32)
+        else:
+            # 批量矩阵操作（按列求和即对倒数第二个轴求和）
+            IP = AR_EEG1_BW * AR_EEG2_BW
+            number_of_1 = RecurrenceAnalysis._column_sums(IP)
+            number_of_EEG1 = RecurrenceAnalysis._column_sums(AR_EEG1_BW)
+            number_of_EEG2 = RecurrenceAnalysis._column_sums(AR_EEG2_BW)
+        if column_order is not None:
+            number_of_1 = number_of_1[..., column_order]
+            number_of_EEG1 = number_of_EEG1[..., column_order]
+            number_of_EEG2 = number_of_EEG2[..., column_order]
+        return RecurrenceAnalysis.nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2)
+
+    @staticmethod
+    def nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2):
+        """
+        由逐列的联合重现数与 X、Y 各自的重现数计算 NLID。
+        :return: (NLID(X|Y), NLID(Y|X))，对最后一个轴求平均
+        """
+        number_of_1 = np.asarray(number_of_1, dtype=np.float32)
+        number_of_EEG1 = np.asarray(number_of_EEG1, dtype=np.float32)
+        number_of_EEG2 = np.asarray(number_of_EEG2, dtype=np.float32)
 
-        # 避免类型错误，确保输出类型为浮点数
+        # 初始化为浮点数组，避免类型错误
+        NLID_YX = np.zeros(number_of_1.shape, dtype=np.float32)
+        NLID_XY = np.zeros(number_of_1.shape, dtype=np.float32)
         NLID_YX = np.divide(number_of_1, number_of_EEG1, where=number_of_EEG1 > 0, out=NLID_YX)
         NLID_XY = np.divide(number_of_1, number_of_EEG2, where=number_of_EEG2 > 0, out=NLID_XY)
 
-        NLID_YX_avg = np.mean(NLID_YX)
-        NLID_XY_avg = np.mean(NLID_XY)
+        NLID_YX_avg = np.mean(NLID_YX, axis=-1)
+        NLID_XY_avg = np.mean(NLID_XY, axis=-1)
 
         return NLID_XY_avg, NLID_YX_avg
 
+    @staticmethod
+    def iter_distance_tiles(phase_space, block, dtype=np.float64):
+        """
+        按列块逐块产生平方距离矩阵，任何时刻只占用 block×N 的内存。
+        块按转置存放：第 j 行是第 j 个点到所有点的平方距离，即原矩阵的第 j 列。
+        dtype 为 float32 时先对相空间去均值（距离不变，但范数变小，Gram 技巧的舍入误差随之变小）。
+        :param phase_space: 形状为 (N, m) 的相空间矩阵
+        :param block: 每块的列数
+        :param dtype: np.float64 或 np.float32
+        :return: 生成器，依次产生 (起始列, 结束列, 形状为 (结束列 - 起始列, N) 的平方距离块)；
+                 产生的块是复用的缓冲区，只在下一次迭代前有效
+        """
+        phase_space = np.asarray(phase_space, dtype=np.float64)
+        if np.dtype(dtype) == np.float32:
+            phase_space = phase_space - phase_space.mean(axis=0)
+        left, right = RecurrenceAnalysis._augment(phase_space)
+        rows = right.astype(dtype)
+        columns = np.ascontiguousarray(left.T, dtype=dtype)
+        N = len(phase_space)
+        tile = np.empty((min(block, N), N), dtype=dtype)
+        for start in range(0, N, block):
+            stop = min(N, start + block)
+            yield start, stop, np.matmul(rows[start:stop], columns, out=tile[:stop - start])
+
+    @staticmethod
+    def calculate_nlid_tiled(phase_space_x, phase_space_y, threshold=0.1, threshold_type="dynamic",
+                             max_bytes=256 * 2**20, dtype=np.float64, spill_dir=None):
+        """
+        分块计算整段记录的 NLID，内存占用受 max_bytes 限制，不需要完整的 N×N 矩阵。
+        动态阈值时先扫描一遍求距离的最大/最小值，第二遍再逐块二值化、打包并用 popcount 计数；
+        每块包含完整的若干列，列计数在块内即可完成。
+        float64 时结果与 compute_reconstruction_matrix + calculate_nlid 相同。
+
+        float32 模式的精度：相空间去均值后，记 u = 2⁻²⁴ ≈ 6.0e-8，
+        平方距离的误差满足 |d̂² − d²| ≤ 4(m + 2)·u·(‖a‖² + ‖b‖²)（a、b 为去均值后的两个点）。
+        只有平方距离与阈值平方相差小于该界的点对才可能被判为不同，
+        对像素量级的注视坐标而言 NLID 的偏差通常在 1e-4 以内。
+
+        :param phase_space_x: X 的相空间矩阵，形状为 (N, m)
+        :param phase_space_y: Y 的相空间矩阵，形状为 (N, m)
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"（半径由 KD 树计数求出，见 sparse_threshold）
+        :param max_bytes: 距离块与比较缓冲区允许使用的大致内存（字节）
+        :param dtype: np.float64 或 np.float32（速度更快、内存减半）
+        :param spill_dir: 给定时第一遍把距离块写入该目录下的临时内存映射文件，第二遍直接读回而不重算；
+                          需要 2·N²·itemsize 字节的磁盘空间，计算结束后自动删除
+        :return: (NLID(X|Y), NLID(Y|X))
+        """
+        if len(phase_space_x) != len(phase_space_y):
+            raise ValueError("X 与 Y 的相空间点数必须相同")
+        N = len(phase_space_x)
+        itemsize = np.dtype(dtype).itemsize
+        # 每列需要 X、Y 各一行距离、各一行比较结果
+        block = int(min(N, max(1, max_bytes // (N * (2 * itemsize + 2)))))
+
+        limits = []
+        spills = []
+        spill_files = []
+        try:
+            for phase_space in (phase_space_x, phase_space_y):
+                spill = None
+                if threshold_type == "dynamic":
+                    if spill_dir is not None:
+                        spill_file = tempfile.TemporaryFile(dir=spill_dir)
+                        spill_files.append(spill_file)
+                        spill = np.memmap(spill_file, dtype=dtype, mode="w+", shape=(N, N))
+                    squared_max, squared_min = -np.inf, np.inf
+                    for start, stop, tile in RecurrenceAnalysis.iter_distance_tiles(phase_space, block, dtype):
+                        squared_max = max(squared_max, float(tile.max()))
+                        squared_min = min(squared_min, float(tile.min()))
+                        if spill is not None:
+                            spill[start:stop] = tile
+                    limits.append(RecurrenceAnalysis.squared_limit(squared_max, squared_min,
+                                                                   threshold, threshold_type))
+                elif threshold_type == "fixed_rr":
+                    radius = RecurrenceAnalysis.sparse_threshold(phase_space, threshold, threshold_type)
+                    limits.append(RecurrenceAnalysis.squared_limit(None, None, radius, "static"))
+                else:
+                    limits.append(RecurrenceAnalysis.squared_limit(None, None, threshold, threshold_type))
+                spills.append(spill)
+
+            number_of_1 = np.zeros(N, dtype=np.int32)
+            number_of_EEG1 = np.zeros(N, dtype=np.int32)
+            number_of_EEG2 = np.zeros(N, dtype=np.int32)
+            mask = np.empty((block, N), dtype=bool)
+            tiles = [
+                RecurrenceAnalysis._iter_spilled_tiles(spill, block) if spill is not None
+                else RecurrenceAnalysis.iter_distance_tiles(phase_space, block, dtype)
+                for phase_space, spill in zip((phase_space_x, phase_space_y), spills)
+            ]
+            for (start, stop, tile_x), (_, _, tile_y) in zip(*tiles):
+                b = stop - start
+                bits_x = np.packbits(np.less_equal(tile_x, limits[0], out=mask[:b]), axis=-1)
+                bits_y = np.packbits(np.less_equal(tile_y, limits[1], out=mask[:b]), axis=-1)
+                number_of_EEG1[start:stop] = RecurrenceAnalysis.popcount(bits_x)
+                number_of_EEG2[start:stop] = RecurrenceAnalysis.popcount(bits_y)
+                number_of_1[start:stop] = RecurrenceAnalysis.popcount(np.bitwise_and(bits_x, bits_y, out=bits_x))
+        finally:
+            # 先释放内存映射，再关闭（并删除）临时文件
+            spills.clear()
+            for spill_file in spill_files:
+                spill_file.close()
+
+        return RecurrenceAnalysis.nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2)
+
+    @staticmethod
+    def _iter_spilled_tiles(spill, block):
+        N = spill.shape[0]
+        for start in range(0, N, block):
+            stop = min(N, start + block)
+            yield start, stop, np.asarray(spill[start:stop])
+
+    @staticmethod
+    def compute_sparse_recurrence_matrix(phase_space, threshold=0.1, threshold_type="dynamic", tree=None):
+        """
+        用 KD 树的半径查询构造稀疏重建矩阵，内存与重现点数成正比而不是 N²。
+        只枚举距离不超过阈值的点对，稀疏（阈值小）时耗时接近 N log N。
+        :param phase_space: 形状为 (N, m) 的相空间矩阵
+        :param threshold: 静态或动态的阈值；fixed_rr 时为目标重现率
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param tree: 可选的、已在 phase_space 上建好的 cKDTree
+        :return: (N, N) 的 CSR 布尔矩阵（对称，含对角线）
+        """
+        phase_space = np.asarray(phase_space, dtype=np.float64)
+        N = len(phase_space)
+        if tree is None:
+            tree = cKDTree(phase_space)
+        radius = RecurrenceAnalysis.sparse_threshold(phase_space, threshold, threshold_type, tree)
+        if radius < 0:
+            return sparse.csr_matrix((N, N), dtype=bool)
+        pairs = tree.query_pairs(radius, output_type="ndarray")
+        diagonal = np.arange(N)
+        rows = np.concatenate([pairs[:, 0], pairs[:, 1], diagonal])
+        cols = np.concatenate([pairs[:, 1], pairs[:, 0], diagonal])
+        data = np.ones(len(rows), dtype=bool)
+        return sparse.csr_matrix((data, (rows, cols)), shape=(N, N))
+
+    @staticmethod
+    def sparse_threshold(phase_space, threshold, threshold_type="dynamic", tree=None):
+        """
+        不构造距离矩阵求出距离阈值。
+        dynamic：对角线距离为 0，故 dTH = 直径 × threshold，直径由凸包顶点求出；
+        fixed_rr：用 count_neighbors 统计半径内的有序点对数（含对角线），求满足点对数 >= ceil(rate·N²)
+        的最小半径；点对数与目标的相对差在 1e-6 以内（N 较小时即与稠密的 rate_limit 相同）。
+        :param phase_space: 形状为 (N, m) 的相空间矩阵
+        :param threshold: 静态或动态的阈值；fixed_rr 时为目标重现率
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param tree: 可选的 cKDTree（fixed_rr 时使用）
+        :return: 距离阈值（负值表示没有任何重现点）
+        """
+        if threshold_type == "static":
+            return float(threshold)
+        if threshold_type == "dynamic":
+            return RecurrenceAnalysis.diameter(phase_space) * threshold
+        if threshold_type != "fixed_rr":
+            raise ValueError(f"未知的阈值类型: {threshold_type}")
+        if not 0 < threshold <= 1:
+            raise ValueError("重现率必须在 (0, 1] 之间")
+
+        phase_space = np.asarray(phase_space, dtype=np.float64)
+        N = len(phase_space)
+        if tree is None:
+            tree = cKDTree(phase_space)
+        k = RecurrenceAnalysis._rate_rank(N * N, threshold)
+        low, count_low = 0.0, tree.count_neighbors(tree, 0.0)
+        if count_low >= k:
+            return low
+        # 初值：抽样点的第 ceil(k / N) 近邻距离的中位数，不够则倍增直到点对数不少于 k
+        neighbors = min(N, -(-k // N))
+        sample = phase_space[np.linspace(0, N - 1, min(N, 256)).astype(int)]
+        high = float(np.median(tree.query(sample, k=[neighbors])[0]))
+        if high <= 0:
+            high = RecurrenceAnalysis.diameter(phase_space)
+        count_high = tree.count_neighbors(tree, high)
+        while count_high < k:
+            low, count_low = high, count_high
+            high *= 2
+            count_high = tree.count_neighbors(tree, high)
+
+        # 不变式 count(low) < k <= count(high)。点对数大致按半径的幂次增长，
+        # 在 (log r, log count) 上做 Illinois 试位法；点对数与 k 的相对差不超过 1e-6 即停止
+        f_low, f_high = np.log(count_low / k), np.log(count_high / k)
+        side = 0
+        while count_high - k > k * 1e-6 and high - low > 1e-12 * high:
+            if low > 0:
+                x_low, x_high = np.log(low), np.log(high)
+                radius = np.exp(x_low - f_low * (x_high - x_low) / (f_high - f_low))
+            else:
+                radius = high / 2
+            margin = (high - low) * 1e-6
+            radius = min(max(radius, low + margin), high - margin)
+            count = tree.count_neighbors(tree, radius)
+            if count >= k:
+                high, count_high, f_high = radius, count, np.log(count / k)
+                if side == 1:
+                    f_low /= 2
+                side = 1
+            else:
+                low, count_low, f_low = radius, count, np.log(count / k)
+                if side == -1:
+                    f_high /= 2
+                side = -1
+        return high
+
+    @staticmethod
+    def diameter(phase_space, max_bytes=64 * 2**20):
+        """
+        相空间点集的直径（最大两两距离）。
+        低维时最远点对必在凸包顶点之中，只需比较顶点；高维或退化时按块扫描全部点对。
+        :param phase_space: 形状为 (N, m) 的相空间矩阵
+        :param max_bytes: 按块扫描时允许使用的大致内存（字节）
+        :return: 直径
+        """
+        phase_space = np.asarray(phase_space, dtype=np.float64)
+        N, m = phase_space.shape
+        if N < 2:
+            return 0.0
+        if m == 1:
+            return float(np.ptp(phase_space))
+        if m <= 4 and N > m + 1:
+            try:
+                phase_space = phase_space[ConvexHull(phase_space).vertices]
+            except QhullError:
+                pass
+        N = len(phase_space)
+        block = int(min(N, max(1, max_bytes // (8 * N))))
+        squared_max = max(float(tile.max())
+                          for _, _, tile in RecurrenceAnalysis.iter_distance_tiles(phase_space, block))
+        return float(np.sqrt(max(squared_max, 0.0)))
+
+    @staticmethod
+    def _sparse_column_sums(matrix):
+        matrix = sparse.csr_matrix(matrix)
+        matrix.eliminate_zeros()
+        return np.bincount(matrix.indices, minlength=matrix.shape[1]).astype(np.float32)
+
+    @staticmethod
+    def calculate_nlid_fused(phase_space_x, phase_space_y, threshold=0.1, threshold_type="dynamic"):
+        """
+        融合内核计算整段记录的 NLID：逐列现算 X、Y 的距离、比较阈值并直接累加三个列计数，
+        不构造任何距离或重建矩阵，额外内存 O(N)，各列并行计算。
+        距离按坐标差直接计算（不经 Gram 技巧），恰好落在阈值上、相差一个舍入误差的点对可能与稠密路径不同。
+        没有安装 numba 时退回到 calculate_nlid_tiled。
+        :param phase_space_x: X 的相空间矩阵，形状为 (N, m)
+        :param phase_space_y: Y 的相空间矩阵，形状为 (N, m)
+        :param threshold: 静态或动态的阈值；fixed_rr 时为目标重现率
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"（半径见 sparse_threshold）
+        :return: (NLID(X|Y), NLID(Y|X))
+        """
+        if njit is None:
+            return RecurrenceAnalysis.calculate_nlid_tiled(phase_space_x, phase_space_y, threshold, threshold_type)
+        if len(phase_space_x) != len(phase_space_y):
+            raise ValueError("X 与 Y 的相空间点数必须相同")
+        limits = []
+        for phase_space in (phase_space_x, phase_space_y):
+            phase_space = np.asarray(phase_space, dtype=np.float64)
+            if threshold_type == "dynamic":
+                squared_max, squared_min = _fused_extrema(np.ascontiguousarray(phase_space.T))
+                limits.append(RecurrenceAnalysis.squared_limit(squared_max, squared_min, threshold, threshold_type))
+            elif threshold_type == "fixed_rr":
+                radius = RecurrenceAnalysis.sparse_threshold(phase_space, threshold, threshold_type)
+                limits.append(RecurrenceAnalysis.squared_limit(None, None, radius, "static"))
+            else:
+                limits.append(RecurrenceAnalysis.squared_limit(None, None, threshold, threshold_type))
+        N = len(phase_space_x)
+        number_of_1 = np.zeros(N, dtype=np.int64)
+        number_of_EEG1 = np.zeros(N, dtype=np.int64)
+        number_of_EEG2 = np.zeros(N, dtype=np.int64)
+        _fused_column_counts(np.ascontiguousarray(np.asarray(phase_space_x, dtype=np.float64).T),
+                             np.ascontiguousarray(np.asarray(phase_space_y, dtype=np.float64).T),
+                             float(limits[0]), float(limits[1]), number_of_1, number_of_EEG1, number_of_EEG2)
+        return RecurrenceAnalysis.nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2)
+
+
+    @staticmethod
+    def surrogate_nlid(AR_X, AR_Y, permutations):
+        """
+        打乱型替代数据的 NLID：打乱 Y 的相空间点的顺序，等价于以同一置换重排 Y 重建矩阵的行和列，
+        因此直接在已有的矩阵上计算，不重新计算距离。阈值（动态或固定重现率）对置换不变。
+        X、Y 各自的列计数只算一次，每组替代数据只需重新统计联合重现数。
+        :param AR_X: 形状为 (..., M, M) 的布尔重建矩阵（对称）
+        :param AR_Y: 形状相同的布尔重建矩阵
+        :param permutations: 形状为 (S, ..., M) 的置换，每组替代数据、每个矩阵各一个
+        :return: (NLID(X|Y), NLID(Y|X))，形状为 (S, ...)
+        """
+        AR_X = np.asarray(AR_X, dtype=bool)
+        AR_Y = np.asarray(AR_Y, dtype=bool)
+        permutations = np.asarray(permutations, dtype=np.int64)
+        count_x = RecurrenceAnalysis._column_sums(AR_X)
+        count_y = RecurrenceAnalysis._column_sums(AR_Y)
+        M = AR_X.shape[-1]
+        flat_x = np.ascontiguousarray(AR_X.reshape(-1, M, M)).view(np.uint8)
+        flat_y = np.ascontiguousarray(AR_Y.reshape(-1, M, M)).view(np.uint8)
+        nlid_xy = np.empty(permutations.shape[:-1], dtype=np.float32)
+        nlid_yx = np.empty(permutations.shape[:-1], dtype=np.float32)
+        joint = np.empty((len(flat_x), M), dtype=np.int64)
+        for s, perm in enumerate(permutations):
+            flat_perm = np.ascontiguousarray(perm.reshape(-1, M))
+            if njit is not None:
+                _permuted_joint_counts(flat_x, flat_y, flat_perm, joint)
+            else:
+                # 矩阵对称：第 j 列的联合重现数 = sum_i R_X[j, i] & R_Y[π(j), π(i)]
+                permuted = np.take_along_axis(flat_y[np.arange(len(flat_y))[:, None], flat_perm],
+                                              flat_perm[:, None, :], axis=-1)
+                joint[:] = np.einsum('bji,bji->bj', flat_x, permuted, dtype=np.int64)
+            nlid_xy[s], nlid_yx[s] = RecurrenceAnalysis.nlid_from_counts(
+                joint.reshape(count_x.shape), count_x, np.take_along_axis(count_y, perm, axis=-1))
+        return nlid_xy, nlid_yx
+
+    @staticmethod
+    def phase_randomize(data, rng, axis=-1):
+        """
+        相位随机化替代数据：保留功率谱（直流与 Nyquist 分量不变），各频率的相位换成均匀随机值。
+        :param data: 实数数组，沿 axis 为时间
+        :param rng: numpy.random.Generator
+        :return: 与 data 形状相同的替代序列
+        """
+        data = np.asarray(data, dtype=np.float64)
+        n = data.shape[axis]
+        spectrum = np.fft.rfft(data, axis=axis)
+        spectrum = np.moveaxis(spectrum, axis, -1)
+        phases = np.exp(2j * np.pi * rng.random(spectrum.shape))
+        phases[..., 0] = 1
+        if n % 2 == 0:
+            phases[..., -1] = 1
+        surrogate = np.fft.irfft(spectrum * phases, n=n, axis=-1)
+        return np.moveaxis(surrogate, -1, axis)
+
+    @staticmethod
+    def surrogate_nlid_windows(x, y, m, tau, window_size, step, n_surrogates, kind="shuffle", threshold=0.1,
+                               threshold_type="dynamic", seed=None, max_batch_bytes=2**20):
+        """
+        替代数据检验：每个窗口的 X、Y 重建矩阵只算一次，再对 Y 生成 n_surrogates 组替代数据求 NLID。
+        shuffle：打乱每个窗口内 Y 的相空间点（见 surrogate_nlid），不重新计算距离；
+        phase：每个窗口的 Y 各自做相位随机化（见 phase_randomize），只重新计算 Y 的矩阵。
+        整段记录即 window_size 取序列长度的单个窗口。
+        :param x: 一维时间序列 X
+        :param y: 一维时间序列 Y（超出较短序列的部分被截去）
+        :param m: 嵌入维度
+        :param tau: 时间延迟
+        :param window_size: 窗口长度（样本数）
+        :param step: 窗口步长（样本数）
+        :param n_surrogates: 替代数据的组数
+        :param kind: "shuffle" 或 "phase"
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param seed: 随机数种子
+        :param max_batch_bytes: 每批窗口工作缓冲区的大致内存（字节）
+        :return: (NLID(X|Y), NLID(Y|X))，形状为 (n_surrogates, 窗口数)
+        """
+        if kind not in ("shuffle", "phase"):
+            raise ValueError(f"未知的替代数据类型: {kind}")
+        rng = np.random.default_rng(seed)
+        n = min(len(x), len(y))
+        y = np.asarray(y, dtype=np.float64)[:n]
+        M = window_size - (m - 1) * tau
+        n_windows = RecurrenceAnalysis.embed_windows(np.asarray(x)[:n], m, tau, window_size, step).shape[0]
+        nlid_xy = np.zeros((n_surrogates, n_windows), dtype=np.float32)
+        nlid_yx = np.zeros((n_surrogates, n_windows), dtype=np.float32)
+        for start, AR_X, AR_Y in RecurrenceAnalysis.iter_recurrence_windows(
+                x, y, m, tau, window_size, step, threshold, threshold_type, max_batch_bytes):
+            stop = start + len(AR_X)
+            if kind == "shuffle":
+                permutations = rng.permuted(np.broadcast_to(np.arange(M), (n_surrogates, stop - start, M)), axis=-1)
+                nlid_xy[:, start:stop], nlid_yx[:, start:stop] = RecurrenceAnalysis.surrogate_nlid(
+                    AR_X, AR_Y, permutations)
+                continue
+            segments = np.lib.stride_tricks.sliding_window_view(y, window_size)[start * step:stop * step:step]
+            for s in range(n_surrogates):
+                surrogate = RecurrenceAnalysis.phase_randomize(segments, rng)
+                phase_space = np.lib.stride_tricks.sliding_window_view(
+                    surrogate, (m - 1) * tau + 1, axis=-1)[..., ::tau]
+                AR_S = RecurrenceAnalysis.threshold_squared(
+                    RecurrenceAnalysis.compute_squared_distance_matrix(phase_space), threshold, threshold_type)
+                nlid_xy[s, start:stop], nlid_yx[s, start:stop] = RecurrenceAnalysis.calculate_nlid_batch(AR_X, AR_S)
+        return nlid_xy, nlid_yx
+
+    @staticmethod
+    def surrogate_p_value(observed, surrogates):
+        """
+        单侧经验 p 值 (1 + #{替代数据 >= 观测值}) / (1 + 替代数据组数)。
+        :param observed: 观测到的统计量
+        :param surrogates: 替代数据的统计量数组
+        """
+        surrogates = np.asarray(surrogates)
+        return (1 + np.count_nonzero(surrogates >= observed)) / (1 + len(surrogates))
+
+    @staticmethod
+    def sweep_nlid_windows(x, y, ms, taus, window_size, step, thresholds, threshold_type="dynamic",
+                           max_batch_bytes=16 * 2**20):
+        """
+        参数扫描：对同一窗口长度一次求出所有 (m, tau, 阈值) 组合下各窗口的 NLID。
+        窗口内 m 维、延迟 tau 的平方距离是 m 个延迟分量的差的平方之和，第 p 个分量
+        (x[i + p·tau] - x[j + p·tau])² 正是一维平方距离矩阵沿对角线平移 p·tau 的子矩阵。
+        因此每个窗口只计算一次一维的距离矩阵，各 tau 从 m=1 开始逐维累加平移的子矩阵（点数少 tau 个，即左上角），
+        不必对每个 (m, tau) 重新嵌入和计算距离；所有阈值都由同一个距离矩阵二值化，一次扫描即统计出各阈值的列计数。
+        距离按坐标差逐分量累加，与融合内核（engine="fused"）的结果相同。
+        :param x: 一维时间序列 X
+        :param y: 一维时间序列 Y（超出较短序列的部分被截去）
+        :param ms: 嵌入维度列表
+        :param taus: 时间延迟列表
+        :param window_size: 窗口长度（样本数）
+        :param step: 窗口步长（样本数）
+        :param thresholds: 阈值列表
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param max_batch_bytes: 每批窗口工作缓冲区的大致内存（字节）
+        :return: {(m, tau, 阈值): (NLID(X|Y) 数组, NLID(Y|X) 数组)}，每个窗口一个值；
+                 窗口容纳不下 (m - 1) * tau + 1 个样本的组合不出现在结果中
+        """
+        n = min(len(x), len(y))
+        x = np.asarray(x, dtype=np.float64)[:n]
+        y = np.asarray(y, dtype=np.float64)[:n]
+        W = window_size
+        grid = {int(tau): sorted({int(m) for m in ms if W - (int(m) - 1) * int(tau) > 0}) for tau in taus}
+        grid = {tau: tau_ms for tau, tau_ms in grid.items() if tau_ms}
+        thresholds = np.unique(np.asarray(thresholds, dtype=np.float64))
+        n_windows = max(0, (n - W) // step + 1)
+        results = {(m, tau, th): (np.zeros(n_windows, dtype=np.float32), np.zeros(n_windows, dtype=np.float32))
+                   for tau, tau_ms in grid.items() for m in tau_ms for th in thresholds}
+        if not n_windows or not grid:
+            return results
+
+        segments_x = np.lib.stride_tricks.sliding_window_view(x, W)[::step]
+        segments_y = np.lib.stride_tricks.sliding_window_view(y, W)[::step]
+        # 两个一维距离矩阵、两个累加缓冲区；有 numba 时累加缓冲区只使用下三角
+        batch = min(n_windows, max(1, int(max_batch_bytes // (32 * W * W))))
+        base_x, base_y = np.empty((batch, W, W)), np.empty((batch, W, W))
+        squared_x, squared_y = np.empty((batch, W, W)), np.empty((batch, W, W))
+        extrema_x, extrema_y = np.empty((batch, 2)), np.empty((batch, 2))
+        for start in range(0, n_windows, batch):
+            b = min(batch, n_windows - start)
+            for segments, base in ((segments_x, base_x), (segments_y, base_y)):
+                seg = segments[start:start + b]
+                np.subtract(seg[:, :, None], seg[:, None, :], out=base[:b])
+                np.square(base[:b], out=base[:b])
+            for tau, tau_ms in grid.items():
+                for m in range(1, tau_ms[-1] + 1):
+                    M = W - (m - 1) * tau
+                    lag = (m - 1) * tau
+                    for base, squared, extrema in ((base_x, squared_x, extrema_x), (base_y, squared_y, extrema_y)):
+                        if njit is not None:
+                            _sweep_accumulate(base[:b], squared[:b], lag, M, m == 1, extrema[:b])
+                        elif m == 1:
+                            squared[:b] = base[:b]
+                        else:
+                            squared[:b, :M, :M] += base[:b, lag:lag + M, lag:lag + M]
+                    if m not in tau_ms:
+                        continue
+                    nlid_xy, nlid_yx = RecurrenceAnalysis._sweep_nlid(
+                        squared_x[:b, :M, :M], squared_y[:b, :M, :M], thresholds, threshold_type,
+                        (extrema_x[:b], extrema_y[:b]) if njit is not None else None)
+                    for t, th in enumerate(thresholds):
+                        results[(m, tau, th)][0][start:start + b] = nlid_xy[:, t]
+                        results[(m, tau, th)][1][start:start + b] = nlid_yx[:, t]
+        return results
+
+    @staticmethod
+    def _sweep_nlid(squared_x, squared_y, thresholds, threshold_type, extrema=None):
+        # 一批窗口的平方距离（视图）在所有阈值下的 NLID，形状为 (窗口数, 阈值数)；
+        # extrema 不为 None 时矩阵只有下三角有效，extrema 为累加时求出的各窗口 (最大值, 最小值)
+        extrema = extrema or (None, None)
+        limits_x = RecurrenceAnalysis._sweep_limits(squared_x, thresholds, threshold_type, extrema[0])
+        limits_y = RecurrenceAnalysis._sweep_limits(squared_y, thresholds, threshold_type, extrema[1])
+        B, M = squared_x.shape[0], squared_x.shape[-1]
+        joint = np.zeros((B, len(thresholds), M), dtype=np.int64)
+        count_x = np.zeros_like(joint)
+        count_y = np.zeros_like(joint)
+        if njit is not None:
+            _sweep_column_counts(squared_x, squared_y, limits_x, limits_y, joint, count_x, count_y)
+        else:
+            for t in range(len(thresholds)):
+                hit_x = squared_x <= limits_x[:, t, None, None]
+                hit_y = squared_y <= limits_y[:, t, None, None]
+                joint[:, t] = RecurrenceAnalysis._column_sums(hit_x & hit_y)
+                count_x[:, t] = RecurrenceAnalysis._column_sums(hit_x)
+                count_y[:, t] = RecurrenceAnalysis._column_sums(hit_y)
+        return RecurrenceAnalysis.nlid_from_counts(joint, count_x, count_y)
+
+    @staticmethod
+    def _sweep_limits(squared, thresholds, threshold_type, extrema=None):
+        # 每个窗口、每个阈值在平方距离上的比较上限，形状为 (窗口数, 阈值数)
+        if threshold_type == "fixed_rr":
+            if extrema is not None:
+                # 只有下三角有效：镜像出完整的矩阵再做部分选择
+                lower = np.tril(squared)
+                squared = lower + np.swapaxes(np.tril(squared, -1), -1, -2)
+            return np.stack([RecurrenceAnalysis.rate_limit(squared, th) for th in thresholds], axis=-1)
+        if threshold_type == "dynamic":
+            if extrema is None:
+                extrema = np.stack([squared.max(axis=(-2, -1)), squared.min(axis=(-2, -1))], axis=-1)
+            return RecurrenceAnalysis.squared_limit(extrema[:, :1], extrema[:, 1:], thresholds[None, :],
+                                                    threshold_type)
+        limits = RecurrenceAnalysis.squared_limit(None, None, thresholds, threshold_type)
+        return np.broadcast_to(limits, (len(squared), len(thresholds))).copy()
+
+    @staticmethod
+    def _run_length_histogram(lines):
+        # 把 (B, 行数, L) 布尔数组每一行中连续 True 的长度按批统计成 (B, L + 1) 的直方图：
+        # 每行两端补 False 后整体展平，一次 diff 找出所有段的起点和终点（段不会跨行）
+        B, rows, L = lines.shape
+        padded = np.zeros((B, rows, L + 2), dtype=np.int8)
+        padded[:, :, 1:-1] = lines
+        edges = np.diff(padded.ravel())
+        starts = np.flatnonzero(edges == 1)
+        lengths = np.flatnonzero(edges == -1) - starts
+        batch = starts // (rows * (L + 2))
+        return np.bincount(batch * (L + 1) + lengths, minlength=B * (L + 1)).reshape(B, L + 1)
+
+    @staticmethod
+    def _shear(matrix):
+        # 错切视图 sheared[b, k, i] = matrix[b, i, i + k]（越界处为 False）：右侧补 M 列 False 后，
+        # 沿对角线方向取步幅即可，只需一次复制
+        B, M, _ = matrix.shape
+        padded = np.zeros((B, M, 2 * M), dtype=bool)
+        padded[:, :, :M] = matrix
+        s_b, s_i, s_j = padded.strides
+        return np.lib.stride_tricks.as_strided(padded, shape=(B, M, M), strides=(s_b, s_j, s_i + s_j),
+                                               writeable=False)
+
+    @staticmethod
+    def line_length_histograms(matrix, theiler=1, symmetric=True):
+        """
+        重现矩阵的对角线和竖线长度直方图，对一批矩阵一次完成（数组游程编码，不逐线循环）。
+        对角线：以步幅视图把矩阵错切，使各条对角线成为行，再统计游程；symmetric 时只扫上三角并计两次。
+        :param matrix: 形状为 (M, M) 或 (B, M, M) 的布尔重现矩阵
+        :param theiler: Theiler 窗口，|i - j| < theiler 的点不计入线段（1 即去掉主对角线 LOI）
+        :param symmetric: 矩阵是否对称（单一序列的重现矩阵）；交叉重现矩阵需为 False
+        :return: (对角线直方图, 竖线直方图, 各对角线的重现率)，直方图形状为 (..., M + 1)，第 l 项为长度 l 的线段数；
+                 重现率形状为 (..., M)，第 k 项为偏移 k 的对角线（symmetric 时为上三角）上的重现率，
+                 Theiler 窗口内为 NaN
+        """
+        matrix = np.asarray(matrix, dtype=bool)
+        single = matrix.ndim == 2
+        if single:
+            matrix = matrix[None]
+        B, M, _ = matrix.shape
+        first = max(theiler, 1)
+        sheared = RecurrenceAnalysis._shear(matrix)[:, first:]
+        diagonal = RecurrenceAnalysis._run_length_histogram(sheared)
+        if symmetric:
+            diagonal *= 2
+        else:
+            lower = RecurrenceAnalysis._shear(np.swapaxes(matrix, -1, -2))[:, first:]
+            diagonal += RecurrenceAnalysis._run_length_histogram(lower)
+        if theiler <= 0:
+            diagonal += RecurrenceAnalysis._run_length_histogram(np.diagonal(matrix, axis1=-2, axis2=-1)[:, None, :])
+        diagonal_rate = np.full((B, M), np.nan)
+        diagonal_rate[:, first:] = sheared.sum(axis=-1) / (M - np.arange(first, M))
+        if theiler <= 0:
+            diagonal_rate[:, 0] = np.diagonal(matrix, axis1=-2, axis2=-1).mean(axis=-1)
+
+        # 竖线：按列扫描，Theiler 窗口内的点先去掉
+        vertical_lines = np.swapaxes(matrix, -1, -2)
+        if theiler > 0:
+            band = np.abs(np.arange(M)[:, None] - np.arange(M)[None, :]) < theiler
+            vertical_lines = vertical_lines & ~band
+        vertical = RecurrenceAnalysis._run_length_histogram(vertical_lines)
+        if single:
+            return diagonal[0], vertical[0], diagonal_rate[0]
+        return diagonal, vertical, diagonal_rate
+
+    @staticmethod
+    def rqa_measures(matrix, l_min=2, v_min=2, theiler=1, symmetric=True):
+        """
+        由重现矩阵计算递归量化分析 (RQA) 指标，一批矩阵一次完成：
+        RR（重现率）、DET（确定性）、L_mean / L_max（对角线平均 / 最长长度）、ENTR（对角线长度的 Shannon 熵）、
+        LAM（层状性）、TT（捕获时间，即竖线平均长度）、V_max（最长竖线）、
+        TREND（各对角线重现率对偏移的回归斜率，不计最外侧 10% 的短对角线）。
+        :param matrix: 形状为 (M, M) 或 (B, M, M) 的布尔重现矩阵
+        :param l_min: 对角线的最小长度
+        :param v_min: 竖线的最小长度
+        :param theiler: Theiler 窗口，见 line_length_histograms
+        :param symmetric: 见 line_length_histograms
+        :return: {指标名: 数组}（单个矩阵时为标量）；没有相应线段时为 NaN
+        """
+        matrix = np.asarray(matrix, dtype=bool)
+        diagonal, vertical, diagonal_rate = RecurrenceAnalysis.line_length_histograms(matrix, theiler, symmetric)
+        M = matrix.shape[-1]
+        lengths = np.arange(M + 1)
+        result = {"RR": matrix.sum(axis=(-2, -1)) / (M * M)}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            long_lines = diagonal * (lengths >= l_min)
+            result["DET"] = (long_lines * lengths).sum(axis=-1) / (diagonal * lengths).sum(axis=-1)
+            result["L_mean"] = (long_lines * lengths).sum(axis=-1) / long_lines.sum(axis=-1)
+            result["L_max"] = np.where(diagonal.any(axis=-1), M - np.argmax(diagonal[..., ::-1] > 0, axis=-1), np.nan)
+            p = long_lines / long_lines.sum(axis=-1, keepdims=True)
+            result["ENTR"] = -np.where(p > 0, p * np.log(p), 0.0).sum(axis=-1)
+            result["ENTR"] = np.where(long_lines.any(axis=-1), result["ENTR"], np.nan)
+            long_vertical = vertical * (lengths >= v_min)
+            result["LAM"] = (long_vertical * lengths).sum(axis=-1) / (vertical * lengths).sum(axis=-1)
+            result["TT"] = (long_vertical * lengths).sum(axis=-1) / long_vertical.sum(axis=-1)
+            result["V_max"] = np.where(vertical.any(axis=-1), M - np.argmax(vertical[..., ::-1] > 0, axis=-1), np.nan)
+            # TREND：偏移 theiler..M - M // 10 - 1 上的最小二乘斜率
+            first, last = max(theiler, 0), M - max(M // 10, 1)
+            offsets = np.arange(first, last, dtype=np.float64)
+            rates = diagonal_rate[..., first:last]
+            centered = offsets - offsets.mean() if len(offsets) else offsets
+            result["TREND"] = ((rates - rates.mean(axis=-1, keepdims=True)) * centered).sum(axis=-1) / (centered ** 2).sum()
+        return {name: result[name] for name in RQA_MEASURES}
+
+    @staticmethod
+    def mutual_information(data, max_lag, bins=None):
+        """
+        平均互信息 (AMI) I(x_t; x_{t+lag})，lag = 0..max_lag，以等宽直方图估计。
+        序列只量化一次；各延迟的样本对由补齐的步幅视图给出，所有延迟的联合直方图由一次 bincount 得到。
+        超出序列末端的样本落在额外的一格，不计入，因此每个延迟都使用全部 N - lag 个样本对。
+        :param data: 一维时间序列
+        :param max_lag: 最大延迟
+        :param bins: 直方图格数，默认为 sqrt(N / 5)（限制在 4~64 之间）
+        :return: 长度为 max_lag + 1 的数组（单位 nat）
+        """
+        data = np.asarray(data, dtype=np.float64)
+        n = len(data)
+        max_lag = int(min(max_lag, n - 2))
+        if max_lag < 0:
+            raise ValueError("序列太短，无法估计互信息")
+        if bins is None:
+            bins = int(np.clip(np.sqrt(n / 5), 4, 64))
+        low, high = data.min(), data.max()
+        codes = np.zeros(n, dtype=np.int64) if high == low else \
+            np.minimum(((data - low) / (high - low) * bins).astype(np.int64), bins - 1)
+        # 第 lag 行是 codes[lag:] 后接 lag 个“越界”格 bins
+        padded = np.concatenate((codes, np.full(max_lag, bins, dtype=np.int64)))
+        shifted = np.lib.stride_tricks.sliding_window_view(padded, n)[:max_lag + 1]
+        cells = bins + 1
+        index = (np.arange(max_lag + 1)[:, None] * cells + codes[None, :]) * cells + shifted
+        joint = np.bincount(index.ravel(), minlength=(max_lag + 1) * cells * cells)
+        joint = joint.reshape(max_lag + 1, cells, cells)[:, :bins, :bins].astype(np.float64)
+        joint /= (n - np.arange(max_lag + 1))[:, None, None]
+        p_now = joint.sum(axis=2, keepdims=True)
+        p_later = joint.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            terms = joint * np.log(joint / (p_now * p_later))
+        return np.where(joint > 0, terms, 0.0).sum(axis=(1, 2))
+
+    @staticmethod
+    def estimate_delay(data, max_lag=None, bins=None):
+        """
+        以平均互信息的第一个局部极小值选择时间延迟 tau；没有局部极小值时取 AMI 首次降到 AMI(0)/e 以下的延迟，
+        仍没有则取 AMI 最小的延迟。
+        :param data: 一维时间序列
+        :param max_lag: 最大候选延迟，默认为 min(50, N // 10)
+        :param bins: 见 mutual_information
+        :return: tau（>= 1 的整数）
+        """
+        n = len(data)
+        if max_lag is None:
+            max_lag = min(50, n // 10)
+        max_lag = max(1, int(max_lag))
+        ami = RecurrenceAnalysis.mutual_information(data, max_lag, bins)
+        if len(ami) < 2:
+            return 1
+        minima = np.flatnonzero((ami[1:-1] < ami[:-2]) & (ami[1:-1] <= ami[2:])) + 1
+        if len(minima):
+            return int(minima[0])
+        below = np.flatnonzero(ami[1:] < ami[0] / np.e) + 1
+        if len(below):
+            return int(below[0])
+        return int(np.argmin(ami[1:]) + 1)
+
+    @staticmethod
+    def iter_embedding_statistics(data, tau, max_m=10, rtol=15.0, atol=2.0, max_points=1000):
+        """
+        逐个维度 m = 1..max_m + 1 产生 Cao 方法的 E(m)、E*(m) 和 Kennel 的假近邻 (FNN) 比例。
+        m 维的最近邻（最大范数）找到后，m + 1 维的距离由 m 维的距离和新增的一个分量得到。
+        有 numba 时由一个内核一次求出所有维度的最近邻：点对的最大范数距离随维度逐个分量累积，
+        超过各维度当前最近距离的上界即停止（部分距离剪枝）；没有 numba 时每个 m 建一棵 cKDTree 查询，
+        调用方得到答案后即可停止，不必为更高的维度建树。与自身完全重合的近邻（距离为 0）改用下一个距离大于 0 的近邻；
+        距离相同的近邻两种实现可能选到不同的点。
+        这些量都是对各参考点的平均，点数超过 max_points 时只取等间隔的 max_points 个参考点
+        （近邻仍在所有点中搜索），长序列的耗时因此与长度大致成正比而不是平方。
+        :param data: 一维时间序列
+        :param tau: 时间延迟
+        :param max_m: 最大候选嵌入维度（E 多求一维，供 E1(max_m) 使用）
+        :param rtol: FNN 的距离增长比例阈值
+        :param atol: FNN 的绝对阈值（新距离 / 序列标准差）
+        :param max_points: 参考点数的上限
+        :return: 产生 (m, E, E*, FNN 比例)；序列不够长的维度为 NaN
+        """
+        data = np.asarray(data, dtype=np.float64)
+        n = len(data)
+        spread = np.std(data)
+        # m 维的点还需要第 m + 1 个分量，故取 n - m·tau 个点；至少 3 个点的维度才计算
+        dims = min(max_m + 1, max(0, (n - 3) // tau))
+        if not dims:
+            return
+        reference = np.unique(np.linspace(0, n - tau - 1, min(n - tau, max_points)).astype(np.int64))
+        if njit is not None:
+            all_distances = np.full((dims, len(reference)), np.inf)
+            all_neighbors = np.zeros((dims, len(reference)), dtype=np.int64)
+            _embedding_neighbors(data, tau, reference, all_distances, all_neighbors)
+        for m in range(1, dims + 1):
+            N = n - m * tau
+            inside = reference < N
+            if njit is not None:
+                distance, neighbor = all_distances[m - 1, inside], all_neighbors[m - 1, inside]
+            else:
+                points = np.lib.stride_tricks.sliding_window_view(data, (m - 1) * tau + 1)[:N, ::tau]
+                distance, neighbor = RecurrenceAnalysis._nearest_distinct(points, reference[inside])
+            usable = (distance > 0) & np.isfinite(distance)
+            if not usable.any():
+                yield m, np.nan, np.nan, np.nan
+                continue
+            rows, distance, neighbor = reference[inside][usable], distance[usable], neighbor[usable]
+            extra = np.abs(data[rows + m * tau] - data[neighbor + m * tau])
+            # m + 1 维（最大范数）的近邻距离
+            grown = np.maximum(distance, extra)
+            yield (m, np.mean(grown / distance), np.mean(extra),
+                   np.mean((extra / distance > rtol) | (grown > atol * spread)))
+
+    @staticmethod
+    def embedding_dimension_statistics(data, tau, max_m=10, rtol=15.0, atol=2.0, max_points=1000):
+        """
+        m = 1..max_m 的 Cao 统计量 E1、E2 和 FNN 比例（见 iter_embedding_statistics）。
+        :return: {"m": 维度数组, "E1": ..., "E2": ..., "fnn": ...}，E1/E2 在 m 处为 E(m+1)/E(m)；
+                 序列不够长的维度为 NaN
+        """
+        E = np.full(max_m + 1, np.nan)
+        E_star = np.full(max_m + 1, np.nan)
+        fnn = np.full(max_m + 1, np.nan)
+        for m, e, e_star, fraction in RecurrenceAnalysis.iter_embedding_statistics(
+                data, tau, max_m, rtol, atol, max_points):
+            E[m - 1], E_star[m - 1], fnn[m - 1] = e, e_star, fraction
+        with np.errstate(invalid='ignore', divide='ignore'):
+            E1 = E[1:] / E[:-1]
+            E2 = E_star[1:] / E_star[:-1]
+        return {"m": np.arange(1, max_m + 1), "E1": E1, "E2": E2, "fnn": fnn[:-1]}
+
+    @staticmethod
+    def _nearest_distinct(points, reference):
+        # 参考点（points 的行号）在所有点中的最近邻（最大范数，距离大于 0）；没有这样的近邻时距离为 0
+        tree = cKDTree(points)
+        points = points[reference]
+        distances, neighbors = tree.query(points, k=2, p=np.inf)
+        distance, neighbor = distances[:, 1], neighbors[:, 1]
+        repeated = np.flatnonzero(distance == 0)
+        if len(repeated):
+            # 有重合点（如量化的数据）时再多查几个近邻，取第一个距离大于 0 的
+            more_distances, more_neighbors = tree.query(points[repeated], k=min(tree.n, 16), p=np.inf)
+            usable = more_distances > 0
+            column = np.argmax(usable, axis=1)
+            distance[repeated] = np.where(usable.any(axis=1), more_distances[np.arange(len(repeated)), column], 0)
+            neighbor[repeated] = more_neighbors[np.arange(len(repeated)), column]
+        return distance, neighbor
+
+    @staticmethod
+    def estimate_dimension(data, tau, max_m=10, method="cao", saturation=0.9, fnn_tolerance=0.05):
+        """
+        选择嵌入维度 m，满足条件即停止，不再计算更高的维度。
+        cao：E1(m) = E(m+1)/E(m) 首次达到 saturation（E1 趋于 1，再增加维度不再改变近邻关系）的 m；
+        fnn：假近邻比例首次不超过 fnn_tolerance 的 m。
+        都达不到时取 E1 最大（或 FNN 比例最小）的 m。
+        :param data: 一维时间序列
+        :param tau: 时间延迟
+        :param max_m: 最大候选嵌入维度
+        :param method: "cao" 或 "fnn"
+        :return: m（>= 1 的整数）
+        """
+        if method not in ("cao", "fnn"):
+            raise ValueError(f"未知的方法: {method}")
+        scores = {}
+        previous = np.nan
+        for m, E, _, fnn in RecurrenceAnalysis.iter_embedding_statistics(data, tau, max_m):
+            if method == "fnn" and m <= max_m:
+                scores[m] = -fnn
+                if fnn <= fnn_tolerance:
+                    return m
+            elif method == "cao" and m > 1:
+                scores[m - 1] = E / previous
+                if scores[m - 1] >= saturation:
+                    return m - 1
+            previous = E
+        scores = {m: score for m, score in scores.items() if not np.isnan(score)}
+        return max(scores, key=scores.get) if scores else 1
+
+    @staticmethod
+    def estimate_embedding(data, max_lag=None, max_m=10, method="cao"):
+        """
+        自动选择嵌入参数：先以平均互信息选 tau（见 estimate_delay），再以 Cao 方法或 FNN 选 m（见 estimate_dimension）。
+        :param data: 一维时间序列
+        :return: (m, tau)
+        """
+        tau = RecurrenceAnalysis.estimate_delay(data, max_lag)
+        return RecurrenceAnalysis.estimate_dimension(data, tau, max_m, method), tau
+
+
+class RollingRecurrence:
+    """
+    滑动窗口的增量重现分析。
+    窗口前进时保留与上一窗口共享的距离子矩阵，只计算新进入的点对应的行和列。
+    点存放在环形缓冲区中（第 k 个点位于槽 k % size），矩阵的行列与时间顺序相差同一个循环移位；
+    列和对同时作用于行列的置换不变，因此无需搬移矩阵。
+    动态阈值所需的最大/最小值也增量维护：forward_max[i] 记录点 i 与窗口内所有不早于它的点之间
+    的最大平方距离。窗口只会从头部移出较早的点、从尾部加入较晚的点，
+    所以每个点的“向后”集合只增不减，整窗最大值就是各点 forward_max 的最大值（最小值同理）。
+    """
+
+    # 窗口较小时阈值比较与列求和占主导，整窗批量计算更快
+    MIN_SIZE = 512
+
+    def __init__(self, size, m):
+        """
+        :param size: 窗口内的相空间点数 M
+        :param m: 嵌入维度
+        """
+        self.size = size
+        self.m = m
+        self.left = np.zeros((size, m + 2), dtype=np.float64)
+        self.right = np.zeros((m + 2, size), dtype=np.float64)
+        self.squared = np.zeros((size, size), dtype=np.float64)
+        self.forward_max = np.full(size, -np.inf)
+        self.forward_min = np.full(size, np.inf)
+        self.count = 0
+
+    @property
+    def ready(self):
+        """窗口是否已填满。"""
+        return self.count >= self.size
+
+    @property
+    def order(self):
+        """按时间顺序排列的槽位序号。"""
+        if not self.ready:
+            return np.arange(self.count)
+        return (self.count + np.arange(self.size)) % self.size
+
+    def push(self, points):
+        """
+        按时间顺序加入新的相空间点，窗口已满时最旧的点被移出。
+        :param points: 形状为 (k, m) 的新相空间点
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.m)
+        if len(points) > self.size:
+            self.count += len(points) - self.size
+            points = points[-self.size:]
+        # 环形缓冲区回绕处拆成两段，每段的槽位都是连续切片
+        while len(points):
+            head = self.count % self.size
+            k = min(len(points), self.size - head)
+            self._push_slice(points[:k], slice(head, head + k))
+            points = points[k:]
+
+    def _push_slice(self, points, slots):
+        k = len(points)
+        left, right = RecurrenceAnalysis._augment(points)
+        self.left[slots] = left
+        self.right[:, slots] = right.T
+
+        # 只计算新点对应的行和列，其余 (M - k)² 个距离沿用上一窗口；
+        # 矩阵按转置存放（squared[j, i] 为点 i 与点 j 的距离），比较后按行打包即为按列打包
+        rows = left @ self.right
+        columns = self.left @ right.T
+        self.squared[:, slots] = rows.T
+        self.squared[slots, :] = columns.T
+
+        # 旧点：向后集合新增了这 k 个点（行、列两个方向的舍入结果都计入，与整窗取最值一致）；
+        # 新点的槽位在下面整体覆盖
+        np.maximum(self.forward_max, np.maximum(rows.max(axis=0), columns.max(axis=1)), out=self.forward_max)
+        np.minimum(self.forward_min, np.minimum(rows.min(axis=0), columns.min(axis=1)), out=self.forward_min)
+        # 新点：向后集合是不早于它的新点（含自身）
+        block = self.squared[slots, slots]
+        later = np.triu(np.ones((k, k), dtype=bool))
+        self.forward_max[slots] = np.where(later, np.maximum(block, block.T), -np.inf).max(axis=1)
+        self.forward_min[slots] = np.where(later, np.minimum(block, block.T), np.inf).min(axis=1)
+        self.count += k
+
+    def squared_limit(self, threshold, threshold_type="dynamic"):
+        """
+        当前窗口在平方距离上的比较上限（见 RecurrenceAnalysis.squared_limit）。
+        """
+        if threshold_type == "fixed_rr":
+            # 重现率对行列置换不变，直接在槽位顺序的矩阵上选择
+            return RecurrenceAnalysis.rate_limit(self.squared, threshold)
+        valid = self.order
+        return RecurrenceAnalysis.squared_limit(self.forward_max[valid].max(), self.forward_min[valid].min(),
+                                                threshold, threshold_type)
+
+    def recurrence_matrix(self, threshold, threshold_type="dynamic", out=None, packed=False):
+        """
+        当前窗口的重建矩阵（行列按槽位顺序，窗口须已填满）。
+        :param out: 可选的 M×M 布尔缓冲区，用于存放比较结果（按转置存放）
+        :param packed: 为 True 时返回按列打包的位矩阵（见 RecurrenceAnalysis.pack_recurrence_matrix）
+        :return: 布尔重建矩阵，或打包后的 uint8 位矩阵
+        """
+        columns = np.less_equal(self.squared, self.squared_limit(threshold, threshold_type), out=out)
+        if packed:
+            return np.packbits(columns, axis=-1)
+        return columns.T
+
+    @staticmethod
+    def compute_nlid_windows(x, y, m, tau, window_size, step, threshold=0.1, threshold_type="dynamic"):
+        """
+        增量计算整条序列所有滑动窗口的 NLID，结果与 RecurrenceAnalysis.compute_nlid_windows 相同。
+        每个窗口只计算 min(step, M) 个新点的距离，重叠率为 1 - step / M 时距离计算量约降为原来的 step / M。
+        参数含义同 RecurrenceAnalysis.compute_nlid_windows。
+        :return: (NLID(X|Y) 数组, NLID(Y|X) 数组)，每个窗口一个值
+        """
+        n = min(len(x), len(y))
+        ps_x = RecurrenceAnalysis(np.asarray(x)[:n], m, tau).reconstruct_phase_space()
+        ps_y = RecurrenceAnalysis(np.asarray(y)[:n], m, tau).reconstruct_phase_space()
+        n_windows, M, _ = RecurrenceAnalysis.embed_windows(np.asarray(x)[:n], m, tau, window_size, step).shape
+        nlid_xy = np.zeros(n_windows, dtype=np.float32)
+        nlid_yx = np.zeros(n_windows, dtype=np.float32)
+
+        rolling_x = RollingRecurrence(M, m)
+        rolling_y = RollingRecurrence(M, m)
+        mask = np.empty((M, M), dtype=bool)
+        pushed = 0
+        for w in range(n_windows):
+            start = w * step
+            first_new = max(pushed, start)
+            rolling_x.push(ps_x[first_new:start + M])
+            rolling_y.push(ps_y[first_new:start + M])
+            pushed = start + M
+            bits_x = rolling_x.recurrence_matrix(threshold, threshold_type, out=mask, packed=True)
+            bits_y = rolling_y.recurrence_matrix(threshold, threshold_type, out=mask, packed=True)
+            nlid_xy[w], nlid_yx[w] = RecurrenceAnalysis.calculate_nlid_batch(
+                bits_x, bits_y, rolling_x.order, packed=True)
+        return nlid_xy, nlid_yx
+
+
+# ---- numba 融合内核：逐点对现算距离，只累加计数，不构造矩阵 ----
+
+def _squared_to_column(points, start, stop, j, out):
+    # 第 start..stop-1 个点到第 j 个点的平方距离；points 为转置后的相空间 (m, N)，
+    # 按坐标逐行累加，内层循环读连续内存
+    n = stop - start
+    for i in range(n):
+        out[i] = 0.0
+    for p in range(points.shape[0]):
+        centre = points[p, j]
+        row = points[p, start:stop]
+        for i in range(n):
+            diff = row[i] - centre
+            out[i] += diff * diff
+
+
+def _column_blocks(N):
+    # 按列分块并行：每块只分配一次 O(N) 的缓冲区
+    return (N + 255) // 256
+
+
+def _fused_extrema(points):
+    # 所有点对平方距离的最大/最小值；最小值就是对角线上的 0，只需求最大值（每列看 i < j 的一半）
+    N = points.shape[1]
+    block_max = np.zeros(_column_blocks(N))
+    for b in prange(len(block_max)):
+        squared = np.empty(N)
+        high = 0.0
+        for j in range(b * 256, min(N, (b + 1) * 256)):
+            _squared_to_column(points, 0, j, j, squared)
+            for i in range(j):
+                high = max(high, squared[i])
+        block_max[b] = high
+    return block_max.max(), 0.0
+
+
+def _fused_column_counts(points_x, points_y, limit_x, limit_y, number_of_1, number_of_EEG1, number_of_EEG2):
+    # 每列独立计数，各线程只写自己负责的列，无需同步
+    N = points_x.shape[1]
+    for b in prange(_column_blocks(N)):
+        squared_x = np.empty(N)
+        squared_y = np.empty(N)
+        for j in range(b * 256, min(N, (b + 1) * 256)):
+            _squared_to_column(points_x, 0, N, j, squared_x)
+            _squared_to_column(points_y, 0, N, j, squared_y)
+            joint = 0
+            count_x = 0
+            count_y = 0
+            for i in range(N):
+                hit_x = np.int64(squared_x[i] <= limit_x)
+                hit_y = np.int64(squared_y[i] <= limit_y)
+                count_x += hit_x
+                count_y += hit_y
+                joint += hit_x & hit_y
+            number_of_1[j] = joint
+            number_of_EEG1[j] = count_x
+            number_of_EEG2[j] = count_y
+
+
+def _window_limit(points, start, M, threshold, dynamic, buffer):
+    if not dynamic:
+        return threshold * threshold if threshold >= 0 else -np.inf
+    high = 0.0
+    low = 0.0  # 对角线上的平方距离为 0
+    for j in range(start + 1, start + M):
+        _squared_to_column(points, start, j, j, buffer)
+        for i in range(j - start):
+            high = max(high, buffer[i])
+    d_th = (np.sqrt(high) - np.sqrt(low)) * threshold
+    return d_th * d_th if d_th >= 0 else -np.inf
+
+
+def _fused_window_nlid(points_x, points_y, M, step, threshold, dynamic, nlid_xy, nlid_yx):
+    # points 为转置后的相空间 (m, N)；窗口间并行，
+    # 窗口内按对称性只算 i < j 的一半，同时累加到第 i、j 两列；每个窗口只占用 O(M) 的内存
+    for w in prange(len(nlid_xy)):
+        start = w * step
+        squared_x = np.empty(M)
+        squared_y = np.empty(M)
+        limit_x = _window_limit(points_x, start, M, threshold, dynamic, squared_x)
+        limit_y = _window_limit(points_y, start, M, threshold, dynamic, squared_y)
+        # 对角线：平方距离为 0
+        diagonal_x = 1 if limit_x >= 0 else 0
+        diagonal_y = 1 if limit_y >= 0 else 0
+        joint = np.full(M, diagonal_x * diagonal_y, dtype=np.int64)
+        count_x = np.full(M, diagonal_x, dtype=np.int64)
+        count_y = np.full(M, diagonal_y, dtype=np.int64)
+        for j in range(1, M):
+            _squared_to_column(points_x, start, start + j, start + j, squared_x)
+            _squared_to_column(points_y, start, start + j, start + j, squared_y)
+            row_x = 0
+            row_y = 0
+            row_joint = 0
+            # 内层无分支，便于编译器向量化
+            for i in range(j):
+                hit_x = np.int64(squared_x[i] <= limit_x)
+                hit_y = np.int64(squared_y[i] <= limit_y)
+                hit = hit_x & hit_y
+                count_x[i] += hit_x
+                count_y[i] += hit_y
+                joint[i] += hit
+                row_x += hit_x
+                row_y += hit_y
+                row_joint += hit
+            count_x[j] += row_x
+            count_y[j] += row_y
+            joint[j] += row_joint
+        total_yx = np.float32(0)
+        total_xy = np.float32(0)
+        for j in range(M):
+            if count_x[j] > 0:
+                total_yx += np.float32(joint[j]) / np.float32(count_x[j])
+            if count_y[j] > 0:
+                total_xy += np.float32(joint[j]) / np.float32(count_y[j])
+        nlid_yx[w] = total_yx / np.float32(M)
+        nlid_xy[w] = total_xy / np.float32(M)
+
+
+
+def _permuted_joint_counts(rx, ry, perm, joint):
+    # 每个 (矩阵, 列) 独立：按置换从 R_Y 的第 π(j) 行取元素，与 R_X 的第 j 行逐点相与
+    B, M = perm.shape
+    for t in prange(B * M):
+        b = t // M
+        j = t % M
+        pj = perm[b, j]
+        total = 0
+        for i in range(M):
+            total += rx[b, j, i] & ry[b, pj, perm[b, i]]
+        joint[b, j] = total
+
+
+
+def _embedding_neighbors(data, tau, reference, distances, neighbors):
+    # 参考点在各维度（第 k 行为 k + 1 维，点数 n - (k + 1)·tau）中距离大于 0 的最近邻，暴力搜索所有点。
+    # 点对的最大范数距离随维度只增不减：达到各维度当前最近距离的最大值后，更高的维度都不可能更新，提前结束
+    n = len(data)
+    for r in prange(len(reference)):
+        i = reference[r]
+        dims = 0
+        while dims < distances.shape[0] and i < n - (dims + 1) * tau:
+            dims += 1
+        bound = np.inf
+        for j in range(n):
+            if j == i:
+                continue
+            d = 0.0
+            for k in range(dims):
+                if j >= n - (k + 1) * tau:
+                    break
+                d = max(d, abs(data[i + k * tau] - data[j + k * tau]))
+                if d >= bound:
+                    break
+                if 0 < d < distances[k, r]:
+                    distances[k, r] = d
+                    neighbors[k, r] = j
+                    bound = 0.0
+                    for q in range(dims):
+                        bound = max(bound, distances[q, r])
+
+
+def _sweep_accumulate(base, squared, lag, M, first, extrema):
+    # 把平移 lag 的一维平方距离加到 M×M 左上角的下三角（first 时直接复制），同时求出各窗口的最大/最小值
+    B = base.shape[0]
+    for b in prange(B):
+        high = -np.inf
+        low = np.inf
+        for j in range(M):
+            for i in range(j + 1):
+                v = base[b, j + lag, i + lag]
+                if not first:
+                    v += squared[b, j, i]
+                squared[b, j, i] = v
+                high = max(high, v)
+                low = min(low, v)
+        extrema[b, 0] = high
+        extrema[b, 1] = low
+
+
+def _sweep_column_counts(squared_x, squared_y, limits_x, limits_y, joint, count_x, count_y):
+    # 每个窗口独立；矩阵对称，只扫描下三角，每个点对同时计入两列（与融合内核相同的写法）。
+    # 第 j 行在各阈值间重复使用，留在缓存中；内层无分支，便于编译器向量化
+    B = limits_x.shape[0]
+    T = limits_x.shape[1]
+    M = squared_x.shape[2]
+    for b in prange(B):
+        for j in range(M):
+            row_x = squared_x[b, j]
+            row_y = squared_y[b, j]
+            for k in range(T):
+                limit_x = limits_x[b, k]
+                limit_y = limits_y[b, k]
+                col_x = count_x[b, k]
+                col_y = count_y[b, k]
+                col_joint = joint[b, k]
+                total_x = 0
+                total_y = 0
+                total_joint = 0
+                for i in range(j):
+                    hit_x = np.int64(row_x[i] <= limit_x)
+                    hit_y = np.int64(row_y[i] <= limit_y)
+                    hit = hit_x & hit_y
+                    col_x[i] += hit_x
+                    col_y[i] += hit_y
+                    col_joint[i] += hit
+                    total_x += hit_x
+                    total_y += hit_y
+                    total_joint += hit
+                # 对角线
+                hit_x = np.int64(row_x[j] <= limit_x)
+                hit_y = np.int64(row_y[j] <= limit_y)
+                col_x[j] += total_x + hit_x
+                col_y[j] += total_y + hit_y
+                col_joint[j] += total_joint + (hit_x & hit_y)
+
+if njit is not None:
+    # cache=True：编译结果写入磁盘缓存，批次工具的每个工作进程不必各自重新编译
+    _squared_to_column = njit(cache=True)(_squared_to_column)
+    _column_blocks = njit(cache=True)(_column_blocks)
+    _fused_extrema = njit(parallel=True, cache=True)(_fused_extrema)
+    _fused_column_counts = njit(parallel=True, cache=True)(_fused_column_counts)
+    _window_limit = njit(cache=True)(_window_limit)
+    _fused_window_nlid = njit(parallel=True, cache=True)(_fused_window_nlid)
+    _permuted_joint_counts = njit(parallel=True, cache=True)(_permuted_joint_counts)
+    _embedding_neighbors = njit(parallel=True, cache=True)(_embedding_neighbors)
+    _sweep_accumulate = njit(parallel=True, cache=True)(_sweep_accumulate)
+    _sweep_column_counts = njit(parallel=True, cache=True)(_sweep_column_counts)
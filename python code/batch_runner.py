@@ -0,0 +1,130 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+class SkipFile(Exception):
+    """
+    规划阶段发现文件不适合计算（缺少所选的列、数据太短等）时抛出，
+    与真正的错误区分开，便于各工具按原来的格式记录日志。
+    """
+
+
+def default_workers():
+    """默认的工作进程数：CPU 核数。"""
+    return os.cpu_count() or 1
+
+
+def split_range(n, parts):
+    """
+    把 [0, n) 尽量均匀地切成不超过 parts 段。
+    :param n: 元素个数
+    :param parts: 段数上限
+    :return: [(start, stop), ...]，按顺序排列且不含空段
+    """
+    parts = max(1, min(int(parts), n))
+    bounds = [n * k // parts for k in range(parts + 1)]
+    return [(bounds[k], bounds[k + 1]) for k in range(parts) if bounds[k] < bounds[k + 1]]
+
+
+def _limit_worker_threads():
+    # 工作进程内的 numba 并行内核只用一个线程，避免进程数 × 线程数超过核数
+    try:
+        import numba
+    except ImportError:
+        return
+    numba.set_num_threads(1)
+
+
+class BatchRunner:
+    """
+    批次工具共用的并行执行器。
+    每个文件先在工作进程中“规划”（读文件、检查所选的列，把计算拆成若干工作单元），
+    各单元再提交到同一个进程池；所有文件的单元共用一个任务队列，空闲进程总是取下一个单元，
+    长记录被拆成多段后不会在批次末尾只剩一个核在忙。
+    同一文件的单元全部完成后按单元顺序合并，结果按输入文件的顺序返回，与完成先后无关。
+    plan 和 work 必须是模块顶层函数（或其 functools.partial），以便传给子进程。
+    子进程一律用 spawn 方式启动（与 Windows 上的行为一致）：父进程里已经起了 numba/BLAS 线程时 fork 并不安全。
+    """
+
+    def __init__(self, workers=None):
+        """
+        :param workers: 工作进程数；None 时取 CPU 核数，1 时在当前线程内顺序执行（不启动子进程）
+        """
+        self.workers = max(1, int(workers or default_workers()))
+
+    def run(self, files, plan, work, merge=None, on_file_done=None, on_error=None):
+        """
+        处理一批文件。
+        :param files: 文件路径列表；结果按此顺序返回
+        :param plan: plan(path) -> 工作单元列表（在工作进程中执行）；可抛出 SkipFile 跳过该文件
+        :param work: work(unit) -> 部分结果（在工作进程中执行）
+        :param merge: merge(path, partials) -> 该文件的结果（在调用线程中执行，partials 按单元顺序排列）；
+                      None 时直接返回 partials 列表
+        :param on_file_done: on_file_done(path, result)，每个文件完成时在调用线程中回调（按完成顺序）
+        :param on_error: on_error(path, exc)，文件规划、计算或合并出错时回调；该文件其余的单元被丢弃
+        :return: 与 files 一一对应的结果列表，出错或跳过的文件为 None
+        """
+        files = list(files)
+        results = [None] * len(files)
+
+        def finish(index, partials):
+            try:
+                result = merge(files[index], partials) if merge is not None else partials
+            except Exception as exc:
+                fail(index, exc)
+                return
+            results[index] = result
+            if on_file_done is not None:
+                on_file_done(files[index], result)
+
+        def fail(index, exc):
+            if on_error is not None:
+                on_error(files[index], exc)
+
+        if self.workers == 1:
+            for index, path in enumerate(files):
+                try:
+                    partials = [work(unit) for unit in plan(path)]
+                except Exception as exc:
+                    fail(index, exc)
+                    continue
+                finish(index, partials)
+            return results
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_limit_worker_threads) as pool:
+            # future -> (文件序号, 单元序号)；单元序号为 None 表示规划任务
+            pending = {pool.submit(plan, path): (index, None) for index, path in enumerate(files)}
+            partials = {}
+            remaining = {}
+            failed = set()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, slot = pending.pop(future)
+                    if index in failed:
+                        continue
+                    try:
+                        value = future.result()
+                    except Exception as exc:
+                        failed.add(index)
+                        for other, (other_index, _) in pending.items():
+                            if other_index == index:
+                                other.cancel()
+                        fail(index, exc)
+                        continue
+                    if slot is None:
+                        units = list(value)
+                        partials[index] = [None] * len(units)
+                        remaining[index] = len(units)
+                        for k, unit in enumerate(units):
+                            pending[pool.submit(work, unit)] = (index, k)
+                        if not units:
+                            finish(index, [])
+                    else:
+                        partials[index][slot] = value
+                        remaining[index] -= 1
+                        if remaining[index] == 0:
+                            finish(index, partials.pop(index))
+        return results
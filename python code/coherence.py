@@ -1,16 +1,133 @@
 import os
+import threading
+import functools
 import pandas as pd
 import numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from scipy import signal
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from batch_runner import BatchRunner, default_workers
+from coherence_engine import coherence_matrix, band_means, parse_bands, DEFAULT_BANDS
+from data_cache import read_table, is_data_file
+from schema_index import SchemaIndex
+
+
+def calculate_coherence(X, Y, fs=1000, nperseg=None):
+    f, Cxy = signal.coherence(X, Y, fs=fs, nperseg=nperseg)
+    return f, Cxy, np.mean(Cxy)
+
+
+# Curves are stored in one long-format table: npz is columnar and readable by every tool, csv for other programs
+CURVE_FORMATS = ("npz", "csv")
+# Above this many curves the comparison plot has no legend (it would cover the axes)
+MAX_LEGEND_ENTRIES = 20
+
+
+def plan_coherence_file(path, selected_cols, fs, plot_single=False):
+    """
+    Read one file; the whole file is a single work unit ({column: values}, fs, (plot path, title) or None),
+    trimmed to a common length. The single-file chart goes next to the data file.
+    """
+    df = read_table(path, selected_cols)
+
+    cols = [df[col].dropna() for col in selected_cols]
+    min_len = min(len(col) for col in cols)
+    plot = (os.path.splitext(path)[0] + "_Coherence.png", f"Coherence - {os.path.basename(path)}") if plot_single else None
+    return [({name: col.iloc[:min_len].to_numpy() for name, col in zip(selected_cols, cols)}, fs, plot)]
+
+
+def compute_coherence_unit(unit):
+    """Coherence for every pair of the selected columns; each column is segmented and FFT'd once."""
+    channels, fs, plot = unit
+    freqs, pairs = coherence_matrix(channels, fs=fs)
+    if plot is not None:
+        # Rendered in the worker, so charts are drawn in parallel and never on the GUI thread
+        render_coherence_plot(plot[0], freqs, pairs, plot[1])
+    return freqs, pairs
+
+
+def _new_axes(figsize):
+    # Figure + Agg canvas without pyplot: no global figure state, safe in worker processes and threads
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _finish_plot(fig, ax, title, target):
+    ax.set_title(title)
+    ax.set_xlabel("Frequency (Hz)")
+    ax.set_ylabel("Coherence")
+    ax.grid()
+    fig.tight_layout()
+    fig.savefig(target)
+
+
+def render_coherence_plot(target, freqs, pairs, title):
+    """One file's coherence curves, one line per pair."""
+    fig, ax = _new_axes((10, 6))
+    for pair, Cxy in pairs.items():
+        ax.plot(freqs, Cxy, label=f"{pair[0]} - {pair[1]}")
+    if len(pairs) > 1:
+        ax.legend()
+    _finish_plot(fig, ax, title, target)
+
+
+def render_comparison_plot(target, curves):
+    """All files' curves drawn as a single LineCollection instead of one plot call per curve."""
+    labels = []
+    lines = []
+    for file, (freqs, pairs) in curves.items():
+        for pair, coh in pairs.items():
+            labels.append(file if len(pairs) == 1 else f"{file} {pair[0]}-{pair[1]}")
+            lines.append(np.column_stack([freqs, coh]))
+    if len(lines) <= MAX_LEGEND_ENTRIES:
+        colors = matplotlib.colormaps["tab20"](np.arange(len(lines)) % 20)
+    else:
+        colors = matplotlib.colormaps["viridis"](np.linspace(0, 1, len(lines)))
+    fig, ax = _new_axes((12, 8))
+    ax.add_collection(LineCollection(lines, colors=colors, linewidths=1))
+    ax.autoscale()
+    if len(lines) <= MAX_LEGEND_ENTRIES:
+        ax.legend([Line2D([], [], color=color) for color in colors], labels)
+    _finish_plot(fig, ax, "Coherence Curves Comparison", target)
+
+
+def write_curves(target, curves, curve_format="npz"):
+    """
+    Write every curve to one long-format table: File Name, Channel A, Channel B, Frequency (Hz), Coherence.
+    """
+    parts = [(file, pair, freqs, coh) for file, (freqs, pairs) in curves.items() for pair, coh in pairs.items()]
+    sizes = [len(freqs) for _, _, freqs, _ in parts]
+    table = {
+        "File Name": np.repeat([file for file, _, _, _ in parts], sizes),
+        "Channel A": np.repeat([pair[0] for _, pair, _, _ in parts], sizes),
+        "Channel B": np.repeat([pair[1] for _, pair, _, _ in parts], sizes),
+        "Frequency (Hz)": np.concatenate([freqs for _, _, freqs, _ in parts]),
+        "Coherence": np.concatenate([coh for _, _, _, coh in parts]),
+    }
+    if curve_format == "npz":
+        np.savez(target, **table)
+    else:
+        pd.DataFrame(table).to_csv(target, index=False)
+
+
+def pair_label(pair, pairs):
+    """A single pair keeps the old "Coherence" column name."""
+    return "Coherence" if len(pairs) == 1 else f"Coherence({pair[0]}, {pair[1]})"
+
 
 class CoherenceAnalysisGUI:
+    MAX_COLS = 5
+
     def __init__(self, master):
         self.master = master
         master.title("Batch Coherence Calculator")
-        master.geometry("800x620")
+        master.geometry("800x720")
 
         self.selected_cols = []
         self.file_columns = []
@@ -28,7 +145,7 @@ class CoherenceAnalysisGUI:
 
         frame_cols = ttk.Frame(frame_path)
         frame_cols.pack()
-        for i in range(2):  # 兩個欄位
+        for i in range(self.MAX_COLS):  # 兩個欄位為單一配對，更多欄位時計算所有配對
             ttk.Label(frame_cols, text=f"Column {i+1}:").grid(row=i, column=0, sticky='e')
             cb = ttk.Combobox(frame_cols, width=30, state="readonly")
             cb.grid(row=i, column=1, padx=5, pady=2)
@@ -43,8 +160,21 @@ class CoherenceAnalysisGUI:
         self.entry_fs.insert(0, "1000")
         self.entry_fs.pack(side='left', padx=5)
 
+        ttk.Label(frame_sampling, text="Workers:").pack(side='left')
+        self.entry_workers = ttk.Entry(frame_sampling, width=5)
+        self.entry_workers.insert(0, str(default_workers()))
+        self.entry_workers.pack(side='left', padx=5)
+
+        ttk.Label(frame_sampling, text="Bands (Hz):").pack(side='left')
+        self.entry_bands = ttk.Entry(frame_sampling, width=24)
+        self.entry_bands.insert(0, ", ".join(f"{low:g}-{high:g}" for low, high in DEFAULT_BANDS))
+        self.entry_bands.pack(side='left', padx=5)
+
         self.var_save_curve = tk.BooleanVar(value=False)
         ttk.Checkbutton(frame_sampling, text="Save Coherence Curves", variable=self.var_save_curve).pack(side='left', padx=10)
+        self.combo_curve_format = ttk.Combobox(frame_sampling, width=5, state="readonly", values=list(CURVE_FORMATS))
+        self.combo_curve_format.set("npz")
+        self.combo_curve_format.pack(side='left')
 
         self.var_plot_single = tk.BooleanVar(value=False)
         ttk.Checkbutton(frame_sampling, text="Plot Single File Charts", variable=self.var_plot_single).pack(side='left', padx=10)
@@ -65,14 +195,14 @@ class CoherenceAnalysisGUI:
         folder = filedialog.askdirectory()
         if folder:
             self.lbl_folder.config(text=folder)
-            files = [f for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
+            files = [f for f in os.listdir(folder) if is_data_file(f)]
             if files:
-                path = os.path.join(folder, files[0])
-                df = pd.read_excel(path) if path.endswith(('xlsx', 'xls')) else pd.read_csv(path)
-                self.file_columns = df.columns.tolist()
+                index = SchemaIndex.scan([os.path.join(folder, f) for f in files])
+                self.file_columns = index.intersection()
                 for cb in self.combo_cols:
                     cb['values'] = [''] + self.file_columns
                     cb.set('')
+                self.log_message(index.report())
             else:
                 messagebox.showwarning("No Files", "No Excel or CSV files found in the folder.")
 
@@ -81,8 +211,7 @@ class CoherenceAnalysisGUI:
         self.log.yview(tk.END)
 
     def calculate_coherence(self, X, Y, fs=1000, nperseg=None):
-        f, Cxy = signal.coherence(X, Y, fs=fs, nperseg=nperseg)
-        return f, Cxy, np.mean(Cxy)
+        return calculate_coherence(X, Y, fs=fs, nperseg=nperseg)
 
     def start_processing(self):
         folder = self.lbl_folder.cget("text")
@@ -93,56 +222,68 @@ class CoherenceAnalysisGUI:
         except ValueError:
             messagebox.showerror("Error", "Sampling rate must be a number.")
             return
+        try:
+            workers = max(1, int(self.entry_workers.get()))
+        except ValueError:
+            messagebox.showerror("Error", "Workers must be a number.")
+            return
 
-        if not folder or len(selected_cols) != 2:
-            messagebox.showerror("Missing Information", "Please select a folder and exactly two columns.")
+        try:
+            bands = parse_bands(self.entry_bands.get())
+        except ValueError:
+            messagebox.showerror("Error", "Bands must look like 0-1, 1-4, 4-8.")
+            return
+
+        if not folder or len(selected_cols) < 2 or len(set(selected_cols)) != len(selected_cols):
+            messagebox.showerror("Missing Information", "Please select a folder and at least two different columns.")
             return
 
         save_curves = self.var_save_curve.get()
         plot_single = self.var_plot_single.get()
         plot_all = self.var_plot_all.get()
+        curve_format = self.combo_curve_format.get()
+
+        threading.Thread(target=self.process_files,
+                         args=(folder, selected_cols, fs, workers, bands, save_curves, curve_format, plot_single,
+                               plot_all), daemon=True).start()
+
+    def process_files(self, folder, selected_cols, fs, workers=1, bands=DEFAULT_BANDS, save_curves=False,
+                      curve_format="npz", plot_single=False, plot_all=False):
+        files = [f for f in os.listdir(folder) if is_data_file(f)]
+
+        def on_file_done(path, result):
+            file = os.path.basename(path)
+            f, pairs = result
+            if len(pairs) == 1:
+                (Cxy,) = pairs.values()
+                self.log_message(f"Processed {file}: Coherence = {np.mean(Cxy):.4f}")
+            else:
+                self.log_message(f"Processed {file}: " + ", ".join(
+                    f"{a}-{b} = {np.mean(Cxy):.4f}" for (a, b), Cxy in pairs.items()))
+
+        def on_error(path, exc):
+            self.log_message(f"Error processing {os.path.basename(path)}: {exc}")
+
+        # 各檔案在工作行程中計算（單筆圖表也在工作行程中繪製），結果依檔案順序合併
+        outcomes = BatchRunner(workers).run(
+            [os.path.join(folder, file) for file in files],
+            functools.partial(plan_coherence_file, selected_cols=selected_cols, fs=fs, plot_single=plot_single),
+            compute_coherence_unit, lambda path, values: values[0], on_file_done, on_error)
 
         results = []
         curves = {}
-        files = [f for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
-        for file in files:
-            try:
-                path = os.path.join(folder, file)
-                df = pd.read_excel(path) if path.endswith(('xlsx', 'xls')) else pd.read_csv(path)
-
-                col_x = df[selected_cols[0]].dropna()
-                col_y = df[selected_cols[1]].dropna()
-
-                min_len = min(len(col_x), len(col_y))
-                col_x = col_x.iloc[:min_len]
-                col_y = col_y.iloc[:min_len]
-
-                f, Cxy, coh_value = self.calculate_coherence(col_x, col_y, fs=fs)
-
-                results.append({
-                    "File Name": file,
-                    "Coherence": coh_value
-                })
-
-                curves[file] = (f, Cxy)
-
-                self.log_message(f"Processed {file}: Coherence = {coh_value:.4f}")
-
-                # 單筆畫圖
-                if plot_single:
-                    plt.figure(figsize=(10, 6))
-                    plt.plot(f, Cxy)
-                    plt.title(f"Coherence - {file}")
-                    plt.xlabel("Frequency (Hz)")
-                    plt.ylabel("Coherence")
-                    plt.grid()
-                    plt.tight_layout()
-                    single_plot_path = os.path.join(folder, f"{os.path.splitext(file)[0]}_Coherence.png")
-                    plt.savefig(single_plot_path)
-                    plt.close()
-
-            except Exception as e:
-                self.log_message(f"Error processing {file}: {e}")
+        for file, result in zip(files, outcomes):
+            if result is None:
+                continue
+            f, pairs = result
+            row = {"File Name": file}
+            for pair, Cxy in pairs.items():
+                label = pair_label(pair, pairs)
+                row[label] = np.mean(Cxy)
+                for (low, high), value in band_means(f, Cxy, bands).items():
+                    row[f"{label} {low:g}-{high:g} Hz"] = value
+            results.append(row)
+            curves[file] = (f, pairs)
 
         # 儲存Summary
         if results:
@@ -150,29 +291,15 @@ class CoherenceAnalysisGUI:
             df_results = pd.DataFrame(results)
             df_results.to_excel(out_summary, index=False)
 
-        # 儲存曲線
+        # 儲存曲線（單一長格式檔案）
         if save_curves and curves:
-            out_curves = os.path.join(folder, "Coherence_Curves.xlsx")
-            with pd.ExcelWriter(out_curves) as writer:
-                for file, (freqs, coh) in curves.items():
-                    df_curve = pd.DataFrame({"Frequency (Hz)": freqs, "Coherence": coh})
-                    safe_sheet = file[:30].replace('/', '_').replace('\\', '_').replace('?', '_')
-                    df_curve.to_excel(writer, sheet_name=safe_sheet, index=False)
+            out_curves = os.path.join(folder, f"Coherence_Curves.{curve_format}")
+            write_curves(out_curves, curves, curve_format)
+            self.log_message(f"Curves saved to {out_curves}")
 
         # 多筆畫在同一張比較圖
         if plot_all and curves:
-            plt.figure(figsize=(12, 8))
-            for file, (freqs, coh) in curves.items():
-                plt.plot(freqs, coh, label=file)
-            plt.title("Coherence Curves Comparison")
-            plt.xlabel("Frequency (Hz)")
-            plt.ylabel("Coherence")
-            plt.grid()
-            plt.legend()
-            plt.tight_layout()
-            plot_path = os.path.join(folder, "Coherence_Comparison.png")
-            plt.savefig(plot_path)
-            plt.close()
+            render_comparison_plot(os.path.join(folder, "Coherence_Comparison.png"), curves)
 
         messagebox.showinfo("Completed", "All tasks completed!")
 
@@ -0,0 +1,104 @@
+import itertools
+import numpy as np
+from scipy import signal
+
+# 默认的频带（Hz），GUI 中可修改
+DEFAULT_BANDS = ((0, 1), (1, 4), (4, 8), (8, 13), (13, 30))
+
+
+def welch_parameters(n, nperseg=None, noverlap=None):
+    """
+    与 scipy.signal.welch / coherence 相同的分段参数：nperseg 默认 256，超过序列长度时取序列长度；
+    noverlap 默认为 nperseg // 2。
+    :param n: 序列长度
+    :return: (nperseg, noverlap)
+    """
+    nperseg = min(int(nperseg or 256), n)
+    noverlap = nperseg // 2 if noverlap is None else int(noverlap)
+    if noverlap >= nperseg:
+        raise ValueError("noverlap must be less than nperseg.")
+    return nperseg, noverlap
+
+
+def segment_spectra(channels, fs=1.0, nperseg=None, noverlap=None, window='hann'):
+    """
+    所有通道一次分段、去均值、加窗，再以一次 rfft 求出各段的频谱。
+    各通道的自谱和任意两通道的互谱都由这些分段频谱得到，不必对每一对重新分段和 FFT。
+    :param channels: {通道名: 数组}，长度必须相同
+    :param fs: 采样率
+    :param nperseg: 每段长度，见 welch_parameters
+    :param noverlap: 段间重叠
+    :param window: 窗函数（scipy.signal.get_window 的参数）
+    :return: (频率, {通道名: (段数, 频率数) 的复数数组}, 谱密度的比例系数)
+    """
+    names = list(channels)
+    data = np.vstack([np.asarray(channels[name], dtype=np.float64) for name in names])
+    nperseg, noverlap = welch_parameters(data.shape[1], nperseg, noverlap)
+    step = nperseg - noverlap
+    segments = np.lib.stride_tricks.sliding_window_view(data, nperseg, axis=1)[:, ::step]
+    win = signal.get_window(window, nperseg)
+    # detrend='constant'：每段先减去均值
+    spectra = np.fft.rfft((segments - segments.mean(axis=-1, keepdims=True)) * win, axis=-1)
+    # scaling='density' 的单边谱：除直流（以及偶数长度时的 Nyquist）外乘 2
+    scale = np.full(spectra.shape[-1], 2.0 / (fs * (win * win).sum()))
+    scale[0] /= 2
+    if nperseg % 2 == 0:
+        scale[-1] /= 2
+    freqs = np.fft.rfftfreq(nperseg, 1 / fs)
+    return freqs, dict(zip(names, spectra)), scale
+
+
+def cross_spectral_density(spectra_x, spectra_y, scale):
+    """由分段频谱求互谱密度 Pxy（与 scipy.signal.csd 相同，段间取平均）。"""
+    return (np.conj(spectra_x) * spectra_y).mean(axis=0) * scale
+
+
+def coherence_matrix(channels, fs=1.0, nperseg=None, noverlap=None, pairs=None):
+    """
+    所有通道两两之间的幅度平方相干 Cxy = |Pxy|^2 / (Pxx * Pyy)，结果与逐对调用 scipy.signal.coherence 相同。
+    :param channels: {通道名: 数组}，长度必须相同
+    :param fs: 采样率
+    :param nperseg: 每段长度，见 welch_parameters
+    :param noverlap: 段间重叠
+    :param pairs: 需要的 (通道, 通道) 列表；None 时为所有组合（按通道顺序）
+    :return: (频率, {(通道a, 通道b): 相干曲线})
+    """
+    freqs, spectra, scale = segment_spectra(channels, fs, nperseg, noverlap)
+    pairs = list(itertools.combinations(spectra, 2)) if pairs is None else [tuple(pair) for pair in pairs]
+    auto = {name: np.abs(spectra[name]) ** 2 for name in {name for pair in pairs for name in pair}}
+    power = {name: values.mean(axis=0) * scale for name, values in auto.items()}
+    result = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for a, b in pairs:
+            cross = cross_spectral_density(spectra[a], spectra[b], scale)
+            result[(a, b)] = np.abs(cross) ** 2 / power[a] / power[b]
+    return freqs, result
+
+
+def band_means(freqs, values, bands=DEFAULT_BANDS):
+    """
+    各频带 [低, 高) 内的平均值；频带内没有频率点时为 NaN。
+    :return: {(低, 高): 平均值}
+    """
+    result = {}
+    for low, high in bands:
+        inside = (freqs >= low) & (freqs < high)
+        result[(low, high)] = values[inside].mean() if inside.any() else np.nan
+    return result
+
+
+def parse_bands(text):
+    """
+    解析 "0-1, 1-4, 4-8" 形式的频带设置。
+    :return: ((低, 高), ...)
+    """
+    bands = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        low, high = (float(v) for v in part.split('-'))
+        if not low < high:
+            raise ValueError(f"Invalid band: {part}")
+        bands.append((low, high))
+    return tuple(bands)
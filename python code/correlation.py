@@ -1,15 +1,79 @@
 import os
 import threading
+import functools
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
 import pandas as pd
 import numpy as np
+from batch_runner import BatchRunner, SkipFile, default_workers
+from data_cache import read_table, is_data_file
+from schema_index import SchemaIndex
+from correlation_engine import correlation_matrix, pairs_of, streaming_correlation, windowed_correlation
+from entropy_engine import summarize_windows
+
+# Calculation modes: load each file whole, or read it in chunks with a one-pass co-moment update
+MODES = ("In-memory", "Streaming (chunked)")
+
+
+def pearson_correlation(X, Y):
+    if len(X) == len(Y):
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        dx = X - X.mean()
+        dy = Y - Y.mean()
+        return np.dot(dx, dy) / np.sqrt(np.dot(dx, dx) * np.dot(dy, dy))
+    else:
+        raise ValueError("X 與 Y 的長度不相等")
+
+
+def plan_pearson_file(path, cols, window=None):
+    """
+    Read one file; the whole file is a single work unit holding every selected column, with non-numeric
+    cells turned into NaN. Rows stay aligned: each pair uses the rows where both of its columns have values
+    (the same rule as the streaming mode); pairs with fewer than two such rows come out as NaN.
+    """
+    df = read_table(path, cols, normalize=True)
+    missing = [col for col in cols if col not in df.columns]
+    if missing:
+        raise SkipFile(f"missing selected columns: {', '.join(missing)}.")
+
+    columns = {col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64) for col in cols}
+    if sum(not np.isnan(values).all() for values in columns.values()) < 2:
+        raise SkipFile("not enough data.")
+    return [(columns, window)]
+
+
+def compute_pearson_unit(unit):
+    columns, window = unit
+    # Missing values are handled pair by pair inside the engine, so one column's gaps never shift another pair
+    if window is not None:
+        return windowed_correlation(columns, *window)
+    return pairs_of(*correlation_matrix(columns))
+
+
+def plan_pearson_stream(path, cols, chunk_rows=100000):
+    """Streaming mode: the unit is just the path; the worker reads it chunk by chunk."""
+    return [(path, tuple(cols), chunk_rows)]
+
+
+def compute_pearson_stream_unit(unit):
+    path, cols, chunk_rows = unit
+    try:
+        names, matrix, counts = streaming_correlation(path, cols, chunk_rows, normalize=True)
+    except KeyError as exc:
+        raise SkipFile(exc.args[0]) from None
+    if not counts.any():
+        raise SkipFile("not enough data.")
+    return pairs_of(names, matrix)
+
 
 class PearsonApp:
+    MAX_COLS = 5
+
     def __init__(self, master):
         self.master = master
         master.title("Pearson Correlation Calculator")
-        master.geometry("800x600")
+        master.geometry("800x750")
 
         container = ttk.Frame(master, padding=10)
         container.pack(fill='both', expand=True)
@@ -26,7 +90,7 @@ class PearsonApp:
 
         input_frame.columnconfigure(1, weight=1)
 
-        column_frame = ttk.Labelframe(container, text="Select 2 Columns", padding=10)
+        column_frame = ttk.Labelframe(container, text="Select 2 to 5 Columns (every pair is correlated)", padding=10)
         column_frame.pack(fill='x', pady=5)
 
         ttk.Label(column_frame, text="Column X:").grid(row=0, column=0, sticky='e')
@@ -37,6 +101,38 @@ class PearsonApp:
         self.combo_col_y = ttk.Combobox(column_frame, state="readonly", width=30)
         self.combo_col_y.grid(row=1, column=1, sticky='w', padx=5, pady=2)
 
+        self.combo_cols = [self.combo_col_x, self.combo_col_y]
+        for i in range(2, self.MAX_COLS):
+            ttk.Label(column_frame, text=f"Column {i+1} (optional):").grid(row=i, column=0, sticky='e')
+            combo = ttk.Combobox(column_frame, state="readonly", width=30)
+            combo.grid(row=i, column=1, sticky='w', padx=5, pady=2)
+            self.combo_cols.append(combo)
+
+        ttk.Label(column_frame, text="Workers:").grid(row=self.MAX_COLS, column=0, sticky='e')
+        self.entry_workers = ttk.Entry(column_frame, width=10)
+        self.entry_workers.insert(0, str(default_workers()))
+        self.entry_workers.grid(row=self.MAX_COLS, column=1, sticky='w', padx=5, pady=2)
+
+        param_frame = ttk.Labelframe(container, text="Calculation Mode", padding=10)
+        param_frame.pack(fill='x', pady=5)
+
+        ttk.Label(param_frame, text="Mode:").grid(row=0, column=0, sticky='w')
+        self.combo_mode = ttk.Combobox(param_frame, state="readonly", values=MODES, width=20)
+        self.combo_mode.set(MODES[0])
+        self.combo_mode.grid(row=0, column=1, sticky='w', padx=5)
+
+        self.whole_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(param_frame, text="Whole recording (no windowing)",
+                        variable=self.whole_var).grid(row=1, column=0, columnspan=2, sticky='w')
+        ttk.Label(param_frame, text="Window size:").grid(row=2, column=0, sticky='w')
+        self.entry_window = ttk.Entry(param_frame, width=10)
+        self.entry_window.insert(0, "1000")
+        self.entry_window.grid(row=2, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Overlap ratio (0-1):").grid(row=3, column=0, sticky='w')
+        self.entry_overlap = ttk.Entry(param_frame, width=10)
+        self.entry_overlap.insert(0, "0.5")
+        self.entry_overlap.grid(row=3, column=1, sticky='w', padx=5)
+
         progress_frame = ttk.Frame(container, padding=0)
         progress_frame.pack(fill='both', expand=True, pady=5)
 
@@ -53,29 +149,26 @@ class PearsonApp:
         if folder:
             self.entry_folder.delete(0, tk.END)
             self.entry_folder.insert(0, folder)
-            self.combo_col_x['values'] = []
-            self.combo_col_y['values'] = []
-            self.combo_col_x.set('')
-            self.combo_col_y.set('')
+            for combo in self.combo_cols:
+                combo['values'] = []
+                combo.set('')
 
     def load_columns(self):
         folder = self.entry_folder.get()
         if not os.path.isdir(folder):
             messagebox.showerror("Invalid folder", "Please select a valid folder first.")
             return
-        files = [f for f in os.listdir(folder) if f.lower().endswith((".xls", ".xlsx", ".csv"))]
+        files = [f for f in os.listdir(folder) if is_data_file(f)]
         if not files:
             messagebox.showwarning("No files found", "No Excel/CSV files in the folder.")
             return
         try:
-            path = os.path.join(folder, files[0])
-            df = pd.read_excel(path) if path.endswith(('.xls', '.xlsx')) else pd.read_csv(path)
-            cols = [''] + list(df.columns.str.strip())
-            self.combo_col_x['values'] = cols
-            self.combo_col_y['values'] = cols
-            self.combo_col_x.set('')
-            self.combo_col_y.set('')
-            messagebox.showinfo("Columns Loaded", f"Loaded columns from {files[0]}")
+            index = SchemaIndex.scan([os.path.join(folder, f) for f in files])
+            cols = [''] + [col.strip() for col in index.intersection()]
+            for combo in self.combo_cols:
+                combo['values'] = cols
+                combo.set('')
+            messagebox.showinfo("Columns Loaded", index.report())
         except Exception as e:
             messagebox.showerror("Load Error", str(e))
 
@@ -87,64 +180,105 @@ class PearsonApp:
         folder = self.entry_folder.get()
         col_x = self.combo_col_x.get()
         col_y = self.combo_col_y.get()
+        try:
+            workers = int(self.entry_workers.get())
+            window_size = int(self.entry_window.get())
+            overlap = float(self.entry_overlap.get())
+        except ValueError:
+            messagebox.showerror("Invalid input", "Workers, window size and overlap must be numeric.")
+            return
         if not os.path.isdir(folder) or not col_x or not col_y:
             messagebox.showerror("Missing info", "Ensure folder and two columns are selected.")
             return
-        threading.Thread(target=self.process_files, args=(folder, col_x, col_y), daemon=True).start()
+        if workers < 1:
+            messagebox.showerror("Invalid input", "Workers must be >=1.")
+            return
+        # Optional extra columns; duplicates would only repeat pairs
+        extra = [c.get() for c in self.combo_cols[2:] if c.get()]
+        streaming = self.combo_mode.get() == MODES[1]
+        window = None
+        if not self.whole_var.get():
+            step = int(window_size * (1 - overlap))
+            if not (0 <= overlap < 1) or step < 1 or window_size < 2:
+                messagebox.showerror("Invalid window settings",
+                                     "Overlap must be in [0, 1), the step >=1 sample and window size >=2.")
+                return
+            if streaming:
+                messagebox.showerror("Invalid window settings", "Windowed mode needs the in-memory mode.")
+                return
+            window = (window_size, overlap)
+        threading.Thread(target=self.process_files, args=(folder, col_x, col_y, workers, extra, streaming, window),
+                         daemon=True).start()
 
     def pearson_correlation(self, X, Y):
-        if len(X) == len(Y):
-            Sum_xy = sum((X - X.mean()) * (Y - Y.mean()))
-            Sum_x_squared = sum((X - X.mean())**2)
-            Sum_y_squared = sum((Y - Y.mean())**2)
-            corr = Sum_xy / np.sqrt(Sum_x_squared * Sum_y_squared)
-            return corr
-        else:
-            raise ValueError("X 與 Y 的長度不相等")
+        return pearson_correlation(X, Y)
 
-    def process_files(self, folder, col_x, col_y):
-        files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
+    def process_files(self, folder, col_x, col_y, workers=1, extra=(), streaming=False, window=None):
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if is_data_file(f)]
         self.progress['maximum'] = len(files)
         self.progress['value'] = 0
-        results = []
+        cols = list(dict.fromkeys(col.strip().upper() for col in [col_x, col_y, *extra]))
+        if len(cols) < 2:
+            messagebox.showerror("Missing info", "Select at least two different columns.")
+            return
+        if window is not None:
+            window_size, overlap = window
+            step = int(window_size * (1 - overlap))
+
+        def merge(file, values):
+            pairs, = values
+            row = {"檔名": os.path.basename(file)}
+            for (a, b), corr in pairs.items():
+                row[f"Pearson({a},{b})"] = corr
+            return row, []
 
-        for file in files:
+        def merge_windows(file, values):
+            (starts, pairs), = values
+            # One summary row per file, plus the per-window series in long format
+            row = {"檔名": os.path.basename(file)}
+            windows = []
+            for (a, b), curve in pairs.items():
+                for stat, value in summarize_windows(curve).items():
+                    row[f"Pearson({a},{b}) {stat}"] = value
+                windows.append(pd.DataFrame({"檔名": os.path.basename(file), "Column X": a, "Column Y": b,
+                                             "Window": np.arange(len(curve)), "Start": starts[:len(curve)],
+                                             "End": starts[:len(curve)] + window_size, "Pearson": curve}))
+            return row, windows
+
+        def on_file_done(file, result):
+            self.log_message(f"Processed: {os.path.basename(file)}")
+            self.progress['value'] += 1
+
+        def on_error(file, exc):
             basename = os.path.basename(file)
-            try:
-                df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
-                df.columns = df.columns.str.strip().str.upper()
-                col_x = col_x.strip().upper()
-                col_y = col_y.strip().upper()
-
-                if col_x not in df.columns or col_y not in df.columns:
-                    self.log_message(f"{basename}: missing selected columns.")
-                    continue
-
-                X = df[col_x].dropna()
-                Y = df[col_y].dropna()
-                min_len = min(len(X), len(Y))
-                if min_len < 1:
-                    self.log_message(f"{basename}: not enough data.")
-                    continue
-
-                X = X[:min_len]
-                Y = Y[:min_len]
-
-                corr = self.pearson_correlation(X, Y)
-
-                results.append({
-                    "檔名": basename,
-                    f"Pearson({col_x},{col_y})": corr
-                })
-                self.log_message(f"Processed: {basename}")
-            except Exception as e:
-                self.log_message(f"Error {basename}: {e}")
+            if isinstance(exc, SkipFile):
+                self.log_message(f"{basename}: {exc}")
+            else:
+                self.log_message(f"Error {basename}: {exc}")
             self.progress['value'] += 1
 
+        if streaming:
+            # Constant memory per file: the worker reads the columns in chunks and merges co-moments
+            outcomes = BatchRunner(workers).run(files, functools.partial(plan_pearson_stream, cols=cols),
+                                                compute_pearson_stream_unit, merge, on_file_done, on_error)
+        elif window is None:
+            outcomes = BatchRunner(workers).run(files, functools.partial(plan_pearson_file, cols=cols),
+                                                compute_pearson_unit, merge, on_file_done, on_error)
+        else:
+            outcomes = BatchRunner(workers).run(files, functools.partial(plan_pearson_file, cols=cols,
+                                                                         window=(window_size, step)),
+                                                compute_pearson_unit, merge_windows, on_file_done, on_error)
+        results = [row for row, _ in filter(None, outcomes)]
+        windows = [frame for _, frames in filter(None, outcomes) for frame in frames]
+
         if results:
-            result_df = pd.DataFrame(results)
             output_path = os.path.join(folder, "Pearson_Correlations.xlsx")
-            result_df.to_excel(output_path, index=False)
+            if windows:
+                with pd.ExcelWriter(output_path) as writer:
+                    pd.DataFrame(results).to_excel(writer, sheet_name='Summary', index=False)
+                    pd.concat(windows, ignore_index=True).to_excel(writer, sheet_name='Windows', index=False)
+            else:
+                pd.DataFrame(results).to_excel(output_path, index=False)
             self.log_message(f"Results saved to {output_path}")
             messagebox.showinfo("Done", f"Analysis completed. Saved to: {output_path}")
         else:
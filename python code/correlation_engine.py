@@ -0,0 +1,202 @@
+import itertools
+import numpy as np
+import pandas as pd
+from data_cache import iter_column_chunks
+
+
+def _as_matrix(columns):
+    names = list(columns)
+    return names, np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in names])
+
+
+def _normalize(comoment):
+    # 由协方差（或离差积和）矩阵得到相关系数矩阵；方差为 0 的列对应 NaN
+    scale = np.sqrt(np.diag(comoment))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = comoment / np.outer(scale, scale)
+    np.fill_diagonal(corr, np.where(scale > 0, 1.0, np.nan))
+    return corr
+
+
+def _pairwise_moments(data):
+    """
+    每对列在两者都不是 NaN 的行上的样本数、均值与离差积和，几次矩阵乘法得到。
+    :param data: (行数, 列数) 数组，NaN 为缺失
+    :return: (count, mean, comoment, spread)，均为 (列数, 列数) 矩阵：
+             count[i, j] 为第 i、j 列都有值的行数，mean[i, j] 为这些行上第 i 列的均值，
+             comoment[i, j] 为这些行上的离差积和，spread[i, j] 为这些行上第 i 列的离差平方和
+    """
+    valid = ~np.isnan(data)
+    weight = valid.astype(np.float64)
+    # 先减去各列的均值，减少下面由原始矩求离差时的精度损失
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.nan_to_num(np.nansum(data, axis=0) / valid.sum(axis=0))
+    z = np.where(valid, data - shift, 0.0)
+    count = weight.T @ weight
+    sums = z.T @ weight
+    with np.errstate(invalid='ignore', divide='ignore'):
+        comoment = np.where(count > 0, z.T @ z - sums * sums.T / count, 0.0)
+        spread = np.where(count > 0, (z * z).T @ weight - sums ** 2 / count, 0.0)
+        mean = np.where(count > 0, sums / count + shift[:, None], 0.0)
+    return count, mean, comoment, spread
+
+
+def _pairwise_normalize(count, comoment, spread):
+    # spread[i, j] 与 spread[j, i] 分别为同一组行上两列的离差平方和；少于 2 行的列对为 NaN
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = comoment / np.sqrt(spread * spread.T)
+    corr[count < 2] = np.nan
+    np.fill_diagonal(corr, np.where((np.diag(count) >= 2) & (np.diag(spread) > 0), 1.0, np.nan))
+    return corr
+
+
+def correlation_matrix(columns):
+    """
+    所有列两两之间的 Pearson 相关系数，一次矩阵乘法（BLAS）得到。
+    含 NaN 时每一对只用两列都有值的行（逐对完整样本），与 StreamingCorrelation 相同。
+    :param columns: {列名: 数组}，长度必须相同
+    :return: (列名列表, 相关系数矩阵)
+    """
+    names, data = _as_matrix(columns)
+    if np.isnan(data).any():
+        count, _, comoment, spread = _pairwise_moments(data)
+        return names, _pairwise_normalize(count, comoment, spread)
+    centered = data - data.mean(axis=0)
+    return names, _normalize(centered.T @ centered)
+
+
+def pairs_of(names, matrix):
+    """
+    把相关系数矩阵展开成 {(列a, 列b): r}，按列的顺序列出所有组合。
+    """
+    return {(names[i], names[j]): matrix[i, j] for i, j in itertools.combinations(range(len(names)), 2)}
+
+
+class StreamingCorrelation:
+    """
+    单遍、常数内存的相关系数矩阵：逐块累积样本数、均值和离差积和矩阵（Welford / Chan 的合并公式），
+    每块内部用矩阵乘法，块之间只需 O(列数^2) 的合并。结果与一次性计算（correlation_matrix）相同（舍入误差以内）。
+    与 correlation_matrix 一样逐对处理缺失：每一对只用两列都不是 NaN 的行，
+    所以某列的缺失不影响其他列对，增减列也不改变其余列对的结果。
+    """
+
+    def __init__(self, names):
+        """
+        :param names: 列名列表，update 的每一块都按此顺序给出
+        """
+        self.names = list(names)
+        k = len(self.names)
+        # 各量均按列对保存，见 _pairwise_moments
+        self.count = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+        self.spread = np.zeros((k, k))
+
+    def update(self, block):
+        """
+        合并一块数据。
+        :param block: (行数, 列数) 数组，或 {列名: 数组}；NaN 为缺失，只影响含该列的列对
+        """
+        if isinstance(block, dict):
+            block = np.column_stack([np.asarray(block[name], dtype=np.float64) for name in self.names])
+        block = np.asarray(block, dtype=np.float64)
+        if not len(block):
+            return
+        count, mean, comoment, spread = _pairwise_moments(block)
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, self.count * count / total, 0.0)
+            share = np.where(total > 0, count / total, 0.0)
+        # 本块没有某列对的行时 delta 为 0，该列对保持不变
+        delta = np.where(count > 0, mean - self.mean, 0.0)
+        self.comoment += comoment + delta * delta.T * weight
+        self.spread += spread + delta ** 2 * weight
+        self.mean += delta * share
+        self.count = total
+
+    def correlation(self):
+        """:return: 相关系数矩阵（某列对的样本数不足 2 时为 NaN）"""
+        return _pairwise_normalize(self.count, self.comoment, self.spread)
+
+
+def streaming_correlation(path, columns, chunk_rows=100000, normalize=False):
+    """
+    分块读取文件并以 StreamingCorrelation 累积，适合放不进内存的长文件。
+    每一对只使用两列都不是 NaN 的行，与一次性读入计算的结果相同。
+    :param path: 文件路径
+    :param columns: 列名列表
+    :param chunk_rows: 每块的行数
+    :param normalize: 见 data_cache.load_columns
+    :return: (列名列表, 相关系数矩阵, 各列对使用的行数矩阵)
+    """
+    names = [name.strip().upper() for name in columns] if normalize else list(columns)
+    stream = StreamingCorrelation(names)
+    for chunk in iter_column_chunks(path, columns, chunk_rows, normalize):
+        missing = [name for name in names if name not in chunk]
+        if missing:
+            raise KeyError(f"missing columns: {', '.join(missing)}")
+        stream.update({name: _numeric(chunk[name]) for name in names})
+    return names, stream.correlation(), stream.count.astype(np.int64)
+
+
+def _numeric(values):
+    if values.dtype.kind in 'biuf':
+        return np.asarray(values, dtype=np.float64)
+    # 文字列（如带 % 的坏值）转不成数字的记为 NaN
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def windowed_correlation(columns, window_size, step):
+    """
+    滑动窗口内所有列两两之间的相关系数。
+    以累加和求每个窗口的和、平方和与乘积和，每对列的代价为 O(N)，与窗口长度和重叠无关；
+    先减去整段的均值，减少累加和相减时的精度损失。
+    含 NaN 时窗口仍按行划分，每一对只用窗口内两列都有值的行（与 correlation_matrix 相同）。
+    :param columns: {列名: 数组}，长度必须相同
+    :param window_size: 窗口长度（样本数）
+    :param step: 窗口步长
+    :return: (各窗口起点, {(列a, 列b): 各窗口的 r})
+    """
+    names, data = _as_matrix(columns)
+    n = len(data)
+    if n < window_size:
+        return np.empty(0, dtype=np.int64), {pair: np.empty(0) for pair in itertools.combinations(names, 2)}
+    starts = np.arange(0, n - window_size + 1, step)
+
+    def window_sums(values):
+        total = np.concatenate(([0.0], np.cumsum(values)))
+        return total[starts + window_size] - total[starts]
+
+    if np.isnan(data).any():
+        return starts, _windowed_pairwise(data, names, window_sums)
+    data = data - data.mean(axis=0)
+    sums = [window_sums(data[:, i]) for i in range(len(names))]
+    # 每个窗口的离差平方和 = 平方和 - 和^2 / n
+    spread = [window_sums(data[:, i] ** 2) - sums[i] ** 2 / window_size for i in range(len(names))]
+    result = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i, j in itertools.combinations(range(len(names)), 2):
+            cross = window_sums(data[:, i] * data[:, j]) - sums[i] * sums[j] / window_size
+            result[(names[i], names[j])] = cross / np.sqrt(np.clip(spread[i], 0, None) * np.clip(spread[j], 0, None))
+    return starts, result
+
+
+def _windowed_pairwise(data, names, window_sums):
+    # 有缺失时逐对计算：窗口内两列都有值的行数、和、平方和与乘积和
+    valid = ~np.isnan(data)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.nan_to_num(np.nansum(data, axis=0) / valid.sum(axis=0))
+    data = np.where(valid, data - shift, 0.0)
+    result = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i, j in itertools.combinations(range(len(names)), 2):
+            both = valid[:, i] & valid[:, j]
+            a, b = np.where(both, data[:, i], 0.0), np.where(both, data[:, j], 0.0)
+            n = window_sums(both.astype(np.float64))
+            sum_a, sum_b = window_sums(a), window_sums(b)
+            spread_a = np.clip(window_sums(a * a) - sum_a ** 2 / n, 0, None)
+            spread_b = np.clip(window_sums(b * b) - sum_b ** 2 / n, 0, None)
+            curve = (window_sums(a * b) - sum_a * sum_b / n) / np.sqrt(spread_a * spread_b)
+            curve[n < 2] = np.nan
+            result[(names[i], names[j])] = curve
+    return result
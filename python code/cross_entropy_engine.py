@@ -0,0 +1,182 @@
+import numpy as np
+
+# 自适应分箱可用的规则（np.histogram_bin_edges 的 bins 参数）
+ADAPTIVE_BINS = ("auto", "fd", "doane", "scott", "stone", "rice", "sturges", "sqrt")
+EPSILON = 1e-10
+
+
+class BinGrid:
+    """
+    所有样本共用的分箱网格。
+    固定宽度时箱中心为 bin_width 的整数倍（bin_width=1 即原来的四舍五入取整），网格与数据无关，不同文件自然对齐；
+    自适应时由合并后的样本一次求出箱边界，再供所有文件使用。
+    """
+
+    def __init__(self, bin_width=1.0, edges=None):
+        """
+        :param bin_width: 固定箱宽（edges 为 None 时使用）
+        :param edges: 自适应分箱的边界数组
+        """
+        self.bin_width = bin_width
+        self.edges = None if edges is None else np.asarray(edges, dtype=np.float64)
+
+    @classmethod
+    def adaptive(cls, samples, bins="fd", trim=0.5):
+        """
+        由所有文件的样本合并后求出共用的箱边界。
+        边界只覆盖 [trim, 100 - trim] 百分位之间的范围，两端的离群值计入首尾两箱，
+        否则个别异常值（如 1e12 的坏点）会让按规则求出的箱数大到无法分配。
+        :param samples: 数组列表（通常为每个文件的两列）
+        :param bins: ADAPTIVE_BINS 中的规则名，或箱数
+        :param trim: 两端各排除的百分比
+        :return: BinGrid
+        """
+        pooled = np.concatenate([np.asarray(s, dtype=np.float64).ravel() for s in samples])
+        pooled = pooled[np.isfinite(pooled)]
+        if not len(pooled):
+            raise ValueError("no finite samples to build the bin grid from.")
+        low, high = np.percentile(pooled, [trim, 100 - trim])
+        if low == high:
+            low, high = pooled.min(), pooled.max()
+        core = pooled[(pooled >= low) & (pooled <= high)]
+        return cls(edges=np.histogram_bin_edges(core, bins=bins))
+
+    def codes(self, values):
+        """
+        各样本所在箱的整数编号（固定宽度时为 round(v / bin_width)，可为负）。
+        :param values: 有限值数组
+        :return: int64 数组
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not np.isfinite(values).all():
+            raise ValueError("bin codes need finite values; drop NaN and inf first.")
+        if self.edges is None:
+            return np.rint(values / self.bin_width).astype(np.int64)
+        # 与 np.histogram 相同：最后一个箱包含右边界
+        return np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, len(self.edges) - 2)
+
+    def centers(self, codes):
+        """箱编号对应的箱中心（原因说明中显示的值）。"""
+        if self.edges is None:
+            centers = np.asarray(codes) * self.bin_width
+            return centers.astype(np.int64) if float(self.bin_width).is_integer() else centers
+        return (self.edges[codes] + self.edges[np.asarray(codes) + 1]) / 2
+
+
+def _cross_entropy_rows(counts_x, counts_y):
+    # counts_* 为 (行数, 箱数) 的计数矩阵，每行一对样本；与原来 pandas 版的步骤一一对应
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prob_x = counts_x / counts_x.sum(axis=1, keepdims=True)
+        prob_y = counts_y / counts_y.sum(axis=1, keepdims=True)
+        nonzero = prob_y > 0
+        prob_x = np.where(nonzero, prob_x, 0.0)
+        sum_x = prob_x.sum(axis=1, keepdims=True)
+        sum_y = np.where(nonzero, prob_y, 0.0).sum(axis=1, keepdims=True)
+        true_prob = prob_x / sum_x
+        pred_prob = np.clip(prob_y / sum_y, EPSILON, 1. - EPSILON)
+        values = -np.sum(np.where(nonzero, true_prob * np.log2(pred_prob), 0.0), axis=1)
+    return values, sum_x[:, 0], sum_y[:, 0], nonzero.any(axis=1)
+
+
+def _evaluate(codes_x, rows_x, codes_y, rows_y, n_rows, labels, grid):
+    # 一次 bincount 得到所有行的直方图：行号 * 箱数 + 箱编号（codes 为 labels 中的下标）
+    n_bins = len(labels)
+    counts_x = np.bincount(rows_x * n_bins + codes_x, minlength=n_rows * n_bins).reshape(n_rows, n_bins)
+    counts_y = np.bincount(rows_y * n_bins + codes_y, minlength=n_rows * n_bins).reshape(n_rows, n_bins)
+    values, sum_x, sum_y, overlap = _cross_entropy_rows(counts_x, counts_y)
+    occupied_x = (counts_x > 0).sum(axis=1)
+    occupied_y = (counts_y > 0).sum(axis=1)
+    reasons = [None] * n_rows
+    for i in range(n_rows):
+        if occupied_x[i] < 2:
+            reasons[i] = f"Column 1 only has one unique value: {grid.centers(labels[np.flatnonzero(counts_x[i])])}"
+        elif occupied_y[i] < 2:
+            reasons[i] = f"Column 2 only has one unique value: {grid.centers(labels[np.flatnonzero(counts_y[i])])}"
+        elif not overlap[i]:
+            reasons[i] = "No overlapping nonzero values between columns."
+        elif sum_x[i] == 0 or sum_y[i] == 0:
+            reasons[i] = "Zero sum after filtering probabilities."
+        if reasons[i] is not None:
+            values[i] = np.nan
+    return values, reasons, occupied_x, occupied_y
+
+
+def batch_cross_entropy(pairs, grid=None, window=None, max_bytes=256 * 2 ** 20):
+    """
+    一次计算多对样本的交叉熵 H(P_x, P_y)（以 2 为底）：所有样本先映射到共用网格的箱编号，
+    再以一次 bincount 得到每一对（或每个窗口）的直方图，不做 pandas 的索引对齐。
+    bin_width=1 的固定网格与原来取整后用 value_counts 计算的结果相同。
+    :param pairs: [(x, y), ...]，已去掉 NaN；窗口模式按两者中较短的长度切窗
+    :param grid: BinGrid；None 时为 bin_width=1 的固定网格
+    :param window: None 时每对一个结果；(窗口长度, 步长) 时对每对的每个滑动窗口各算一个
+    :param max_bytes: 窗口模式下每批展开的样本下标的内存上限
+    :return: 与 pairs 对应的列表，每项为 (交叉熵, 原因, Column 1 的非空箱数, Column 2 的非空箱数)；
+             窗口模式下前两项和后两项均为按窗口排列的数组 / 列表，原因为 None 表示正常
+    """
+    grid = grid or BinGrid()
+    coded = [(grid.codes(x), grid.codes(y)) for x, y in pairs]
+    all_codes = np.concatenate([c for pair in coded for c in pair]) if coded else np.empty(0, dtype=np.int64)
+    if not len(all_codes):
+        labels = np.zeros(1, dtype=np.int64)
+    elif all_codes.max() - all_codes.min() < 4 * len(all_codes):
+        labels = np.arange(all_codes.min(), all_codes.max() + 1)
+    else:
+        # 离群值使编号范围远大于样本数时，只为出现过的箱分配列，直方图不会因此变得巨大
+        labels = np.unique(all_codes)
+    dense = [(np.searchsorted(labels, cx), np.searchsorted(labels, cy)) for cx, cy in coded]
+    n_bins = len(labels)
+
+    if window is None:
+        if not dense:
+            return []
+        rows_x = np.concatenate([np.full(len(cx), i, dtype=np.int64) for i, (cx, _) in enumerate(dense)])
+        rows_y = np.concatenate([np.full(len(cy), i, dtype=np.int64) for i, (_, cy) in enumerate(dense)])
+        values, reasons, occupied_x, occupied_y = _evaluate(np.concatenate([cx for cx, _ in dense]), rows_x,
+                                                            np.concatenate([cy for _, cy in dense]), rows_y,
+                                                            len(dense), labels, grid)
+        return [(values[i], reasons[i], occupied_x[i], occupied_y[i]) for i in range(len(dense))]
+
+    size, step = window
+    results = []
+    # 窗口可以重叠，每批展开的样本下标和直方图不超过 max_bytes
+    batch = max(1, max_bytes // (8 * (4 * size + 2 * n_bins)))
+    for cx, cy in dense:
+        n = min(len(cx), len(cy))
+        starts = np.arange(0, n - size + 1, step) if n >= size else np.empty(0, dtype=np.int64)
+        values, reasons, occupied_x, occupied_y = [], [], [], []
+        for a in range(0, len(starts), batch):
+            block = starts[a:a + batch]
+            index = (block[:, None] + np.arange(size)).ravel()
+            rows = np.repeat(np.arange(len(block)), size)
+            part = _evaluate(cx[index], rows, cy[index], rows, len(block), labels, grid)
+            values.append(part[0])
+            reasons.extend(part[1])
+            occupied_x.append(part[2])
+            occupied_y.append(part[3])
+        empty = [np.empty(0)]
+        results.append((np.concatenate(values or empty), reasons,
+                        np.concatenate(occupied_x or empty).astype(np.int64),
+                        np.concatenate(occupied_y or empty).astype(np.int64)))
+    return results
+
+
+def cross_entropy(x, y, grid=None):
+    """
+    单对样本的交叉熵（batch_cross_entropy 的单对版本）。
+    :param x: 真实分布的样本（有限值数组）
+    :param y: 预测分布的样本
+    :param grid: BinGrid；None 时为 bin_width=1 的固定网格
+    :return: (交叉熵, 原因, Column 1 的非空箱数, Column 2 的非空箱数)
+    """
+    return batch_cross_entropy([(x, y)], grid)[0]
+
+
+def calculate_cross_entropy(col_x, col_y):
+    """
+    以两列整数值的经验分布计算交叉熵 H(P_x, P_y)（以 2 为底）。
+    :param col_x: 真实分布的样本（pandas Series，已取整）
+    :param col_y: 预测分布的样本（pandas Series，已取整）
+    :return: (交叉熵, 原因)；无法计算时交叉熵为 nan，原因为说明文字，否则原因为 None
+    """
+    value, reason, _, _ = cross_entropy(np.asarray(col_x, dtype=np.float64), np.asarray(col_y, dtype=np.float64))
+    return value, reason
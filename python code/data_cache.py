@@ -0,0 +1,215 @@
+import os
+import csv
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_NAME = ".column_cache"
+# 设置该环境变量可把所有缓存集中到一个目录；默认放在数据文件所在目录下的 .column_cache
+CACHE_DIR_ENV = "DATA_CACHE_DIR"
+# 各工具可读取的数据文件；.npz 为重采样工具写出的列式格式（每列一个数组）
+DATA_EXTENSIONS = ('.csv', '.xlsx', '.xls', '.npz')
+
+
+def is_data_file(name):
+    """文件名是否为可读取的数据文件（忽略大小写，排除 Excel 的 ~$ 临时文件）。"""
+    return name.lower().endswith(DATA_EXTENSIONS) and not os.path.basename(name).startswith('~$')
+
+
+def sniff_delimiter(path):
+    """
+    识别 CSV 的分隔符（逗号、分号或制表符），无法判断时返回逗号。
+    只用前几行判断：Sniffer 在大样本上非常慢。
+    """
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        sample = ''.join(line for _, line in zip(range(5), f))
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+    except csv.Error:
+        return ","
+
+
+def read_source(path):
+    """
+    解析原始文件（不经过缓存）。xlsx/xls 取第一个工作表；.npz 每个数组为一列；
+    CSV 自动识别分隔符（部分导出是带引号的分号分隔格式）。
+    :param path: 文件路径
+    :return: DataFrame
+    """
+    if path.lower().endswith(('.xls', '.xlsx')):
+        return pd.read_excel(path)
+    if path.lower().endswith('.npz'):
+        with np.load(path) as npz:
+            return pd.DataFrame({name: npz[name] for name in npz.files})
+    return pd.read_csv(path, sep=sniff_delimiter(path))
+
+
+def cache_dir(folder):
+    """数据文件夹对应的缓存目录（设置了 DATA_CACHE_DIR 时为该目录）。"""
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(folder, CACHE_DIR_NAME)
+
+
+def _cache_root(path):
+    return cache_dir(os.path.dirname(path))
+
+
+def _entry_names(path):
+    # 目录名 = 路径哈希 + 修改时间 + 大小；文件一改动就对应新目录，旧目录视为过期
+    stat = os.stat(path)
+    prefix = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+    return prefix, f"{prefix}-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _write_entry(path, directory):
+    df = read_source(path)
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        entry = {"name": str(name), "file": f"col{i}.npy", "mask": None, "dtype": str(series.dtype)}
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            values = series.to_numpy()
+        else:
+            # 文字列存成定长 unicode 数组以便内存映射，缺失值另存掩码
+            missing = series.isna().to_numpy()
+            values = series.astype(str).to_numpy().astype(str)
+            if missing.any():
+                values[missing] = ''
+                entry["mask"] = f"col{i}.mask.npy"
+                np.save(os.path.join(directory, entry["mask"]), missing)
+        np.save(os.path.join(directory, entry["file"]), values)
+        columns.append(entry)
+    meta = {"source": path, "rows": len(df), "columns": columns}
+    with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+def cache_entry(path):
+    """
+    取得文件的缓存条目；不存在或已过期（路径、修改时间、大小任一不同）时重新解析并写入。
+    :param path: 文件路径
+    :return: (条目目录, 元数据)
+    """
+    path = os.path.abspath(path)
+    root = _cache_root(path)
+    prefix, name = _entry_names(path)
+    directory = os.path.join(root, name)
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+            return directory, json.load(f)
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(root, exist_ok=True)
+    # 先写到临时目录再改名，并行的工作进程不会读到写了一半的条目
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=root)
+    try:
+        meta = _write_entry(path, tmp)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for other in os.listdir(root):
+        if other.startswith(prefix + "-") and other != name:
+            shutil.rmtree(os.path.join(root, other), ignore_errors=True)
+    return directory, meta
+
+
+def list_columns(path):
+    """
+    列出文件的列名（第一次调用会建立缓存，之后只读元数据）。
+    :param path: 文件路径
+    :return: 列名列表
+    """
+    return [column["name"] for column in cache_entry(path)[1]["columns"]]
+
+
+def load_columns(path, columns=None, normalize=False):
+    """
+    以内存映射方式读取指定的列，只有用到的列才会被读入。
+    :param path: 文件路径
+    :param columns: 列名列表；None 时读取全部列。找不到的列不出现在结果中
+    :param normalize: True 时列名先去空白并转大写再匹配，结果也以规范化的列名为键
+    :return: {列名: 数组}，按 columns 的顺序；含缺失值的文字列为 object 数组（缺失为 None）
+    """
+    directory, meta = cache_entry(path)
+    key = (lambda name: name.strip().upper()) if normalize else (lambda name: name)
+    available = {key(column["name"]): column for column in meta["columns"]}
+    wanted = available if columns is None else [key(name) for name in columns]
+    result = {}
+    for name in wanted:
+        column = available.get(name)
+        if column is None:
+            continue
+        values = np.load(os.path.join(directory, column["file"]), mmap_mode='r')
+        if column["mask"] is not None:
+            missing = np.load(os.path.join(directory, column["mask"]))
+            values = np.where(missing, None, values.astype(object))
+        result[name] = values
+    return result
+
+
+def read_table(path, columns=None, normalize=False):
+    """
+    load_columns 的 DataFrame 版本，可直接替换 pd.read_excel / pd.read_csv。
+    :param path: 文件路径
+    :param columns: 需要的列；None 时读取全部列
+    :param normalize: 见 load_columns
+    :return: DataFrame
+    """
+    data = load_columns(path, columns, normalize)
+    if not data:
+        return pd.DataFrame(index=pd.RangeIndex(cache_entry(path)[1]["rows"]))
+    return pd.DataFrame({name: np.asarray(values) for name, values in data.items()})
+
+
+def iter_column_chunks(path, columns, chunk_rows=100000, normalize=False):
+    """
+    分块读取指定的列，常驻内存与文件长度无关。
+    已有缓存条目时按块切内存映射的数组；否则 CSV 直接用 pandas 分块解析（不建立缓存，适合超长文件），
+    其他格式先建立缓存再切块。
+    :param path: 文件路径
+    :param columns: 列名列表
+    :param chunk_rows: 每块的行数
+    :param normalize: 见 load_columns
+    :return: 逐块产生 {列名: 数组}；找不到的列不出现在结果中
+    """
+    if cached_meta(path) is None and not path.lower().endswith(('.xls', '.xlsx', '.npz')):
+        key = (lambda name: name.strip().upper()) if normalize else (lambda name: name)
+        wanted = {key(name) for name in columns}
+        for chunk in pd.read_csv(path, sep=sniff_delimiter(path), chunksize=chunk_rows,
+                                 usecols=lambda name: key(str(name)) in wanted):
+            chunk.columns = [key(str(name)) for name in chunk.columns]
+            yield {key(name): chunk[key(name)].to_numpy() for name in columns if key(name) in chunk.columns}
+        return
+    data = load_columns(path, columns, normalize)
+    rows = max((len(values) for values in data.values()), default=0)
+    for start in range(0, rows, chunk_rows):
+        yield {name: values[start:start + chunk_rows] for name, values in data.items()}
+
+
+def cached_meta(path):
+    """
+    只在缓存条目已存在且未过期时返回其元数据，不会触发解析。
+    :param path: 文件路径
+    :return: 元数据；没有有效条目时为 None
+    """
+    path = os.path.abspath(path)
+    _, name = _entry_names(path)
+    try:
+        with open(os.path.join(_cache_root(path), name, "meta.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def clear_cache(folder):
+    """删除 folder 对应的缓存目录。"""
+    shutil.rmtree(cache_dir(folder), ignore_errors=True)
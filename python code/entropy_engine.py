@@ -0,0 +1,398 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba 为可选依赖，没有时使用分块的 numpy 实现
+    njit = None
+    prange = range
+
+MEASURES = ("apen", "sampen")
+
+
+def apen_tolerance(x, r_factor=0.2):
+    """ApEn 工具使用的容差：r_factor * std(x)（总体标准差）。"""
+    return r_factor * np.std(x)
+
+
+def sampen_tolerance(x, m):
+    """
+    nolds.sampen 的默认容差：m = 2 时约为 0.2 * std(x, ddof=1)，其他维度按切比雪夫距离随维度的增长校正。
+    """
+    return np.std(x, ddof=1) * 0.1164 * (0.5627 * np.log(m) + 1.3334)
+
+
+def match_counts(x, r, max_len, tau=1, max_bytes=64 * 2 ** 20):
+    """
+    一次遍历统计所有模板长度 1..max_len 的匹配数（切比雪夫距离），长度 l 的结果直接由长度 l-1 延伸得到。
+    先按值排序，只有首个元素落在 [x_i - r, x_i + r] 内的模板才需要逐点延伸；没有 numba 时退回分块比较。
+    :param x: 一维序列
+    :param r: 容差
+    :param max_len: 最长的模板长度（计算 m 维的熵需要 m + 1）
+    :param tau: 延迟
+    :param max_bytes: 分块实现每块比较矩阵的内存上限
+    :return: (closed, open_)，形状均为 (N, max_len)：
+             closed[i, l - 1] = 与模板 i 在长度 l 上距离 <= r 的模板数（含自身，ApEn 用）；
+             open_[i, l - 1] = 距离 < r 且不含自身的模板数（SampEn 用）。
+             只统计两个模板都完整（起点 + (l - 1) * tau < N）的情况
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    N = len(x)
+    closed = np.zeros((N, max_len), dtype=np.int64)
+    open_ = np.zeros((N, max_len), dtype=np.int64)
+    if njit is not None:
+        order = np.argsort(x, kind='stable')
+        _sorted_match_counts(x, order, x[order], float(r), max_len, tau, closed, open_)
+        return closed, open_
+
+    block = max(1, max_bytes // (N * 10))
+    for a in range(0, N, block):
+        b = min(N, a + block)
+        d = np.abs(x[a:b, None] - x[None, :])
+        within = d <= r
+        strict = d < r
+        strict[np.arange(b - a), np.arange(a, b)] = False
+        closed[a:b, 0] = within.sum(axis=1)
+        open_[a:b, 0] = strict.sum(axis=1)
+        for k in range(1, max_len):
+            shift = k * tau
+            rows = min(b, N - shift) - a
+            if rows <= 0:
+                break
+            # 行和列同时平移 shift，矩阵的对角线仍对应同一对模板
+            d = np.abs(x[a + shift:a + shift + rows, None] - x[None, shift:])
+            within = within[:rows, :N - shift] & (d <= r)
+            strict = strict[:rows, :N - shift] & (d < r)
+            closed[a:a + rows, k] = within.sum(axis=1)
+            open_[a:a + rows, k] = strict.sum(axis=1)
+    return closed, open_
+
+
+def _apen_from_counts(closed, N, m, tau):
+    # 与 EntropyHub.ApEn 相同：Phi^l = sum(log(C_i / n)) / n，n 为长度 l 的模板数，计数为 0 的模板（NaN）不计
+    def phi(length):
+        n = N - (length - 1) * tau
+        counts = closed[:n, length - 1]
+        counts = counts[counts > 0]
+        return np.sum(np.log(counts / n)) / n
+
+    return phi(m) - phi(m + 1)
+
+
+def _sampen_from_counts(x, open_, r, m, tau):
+    # 与 nolds.sampen 相同：长度 m 和 m + 1 都只用前 N - m * tau 个模板，只数 i < j 的配对
+    N = len(x)
+    n = N - m * tau
+    A = open_[:n, m].sum() / 2
+    # 长度 m 的计数中还含与最后 tau 个模板的配对，需要扣除
+    head = open_[:n, m - 1].sum()
+    tail = open_[n:n + tau, m - 1].sum()
+    tail_pairs = 0
+    for s in range(n, min(n + tau, N - (m - 1) * tau)):
+        for t in range(s + 1, min(n + tau, N - (m - 1) * tau)):
+            tail_pairs += np.max(np.abs(x[s:s + m * tau:tau] - x[t:t + m * tau:tau])) < r
+    B = (head - (tail - 2 * tail_pairs)) / 2
+    return _sampen_value(A, B)
+
+
+def _sampen_value(A, B):
+    # nolds 的约定：A、B 都为 0 时为 NaN，只有一个为 0 时为 ±inf
+    if A > 0 and B > 0:
+        return -np.log(A / B)
+    if A == 0 and B == 0:
+        return np.nan
+    return -np.inf if B == 0 else np.inf
+
+
+def approximate_entropy(x, m=2, r=None, tau=1):
+    """
+    近似熵（与 EntropyHub.ApEn(x, m, tau, r)[0][-1] 相同）。
+    :param r: 容差，None 时为 0.2 * std(x)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    r = apen_tolerance(x) if r is None else r
+    closed, _ = match_counts(x, r, m + 1, tau)
+    return _apen_from_counts(closed, len(x), m, tau)
+
+
+def sample_entropy(x, m=2, r=None, tau=1):
+    """
+    样本熵（与 nolds.sampen(x, emb_dim=m, tolerance=r, lag=tau) 相同）。
+    :param r: 容差，None 时为 nolds 的默认值 sampen_tolerance(x, m)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    r = sampen_tolerance(x, m) if r is None else r
+    _, open_ = match_counts(x, r, m + 1, tau)
+    return _sampen_from_counts(x, open_, r, m, tau)
+
+
+def coarse_grain(x, scales):
+    """
+    多尺度熵的粗粒化：尺度 s 的序列为不重叠的 s 点均值，y_j = mean(x[j*s:(j+1)*s])。
+    所有尺度共用一次累加和，每个尺度只需一次相减。
+    :param x: 一维序列
+    :param scales: 尺度列表（正整数）
+    :return: {尺度: 粗粒化序列}，长度为 len(x) // 尺度
+    """
+    x = np.asarray(x, dtype=np.float64)
+    total = np.concatenate(([0.0], np.cumsum(x)))
+    result = {}
+    for s in scales:
+        s = int(s)
+        if s < 1:
+            raise ValueError("scale must be >= 1")
+        n = len(x) // s
+        result[s] = (total[s:n * s + 1:s] - total[0:n * s:s]) / s
+    return result
+
+
+def tolerance_groups(x, ms, measures=MEASURES, r_factor=None):
+    """
+    按容差把 (指标, m) 分组，同一组共用一次匹配计数。
+    :param x: 用来计算容差的序列（多尺度时为原始序列）
+    :param ms: 嵌入维度列表
+    :param measures: MEASURES 的子集
+    :param r_factor: 给定时所有指标和维度共用 r = r_factor * std(x)；
+                     None 时沿用各工具原来的默认值（ApEn 为 0.2 * std，SampEn 为 nolds 的默认值，随 m 变化）
+    :return: {容差: [(指标, m), ...]}
+    """
+    x = np.asarray(x, dtype=np.float64)
+    groups = {}
+    for measure in measures:
+        if measure not in MEASURES:
+            raise ValueError(f"Unknown measure: {measure}")
+        for m in sorted(set(int(m) for m in ms)):
+            if r_factor is not None:
+                r = r_factor * np.std(x)
+            elif measure == "apen":
+                r = apen_tolerance(x)
+            else:
+                r = sampen_tolerance(x, m)
+            groups.setdefault(float(r), []).append((measure, m))
+    return groups
+
+
+def entropies_for(x, groups, tau=1):
+    """
+    按 tolerance_groups 的分组计算一个序列的熵，每组一次匹配计数（长度取到组内 max(m) + 1）。
+    序列太短（不足 m + 2 个模板点）时结果为 NaN。
+    :param x: 一维序列
+    :param groups: tolerance_groups 的结果
+    :param tau: 延迟
+    :return: {(指标, m): 熵}
+    """
+    x = np.asarray(x, dtype=np.float64)
+    results = {}
+    for r, requests in groups.items():
+        usable = [(measure, m) for measure, m in requests if len(x) > (m + 1) * tau]
+        for measure, m in requests:
+            results[(measure, m)] = np.nan
+        if not usable:
+            continue
+        closed, open_ = match_counts(x, r, max(m for _, m in usable) + 1, tau)
+        for measure, m in usable:
+            if measure == "apen":
+                results[(measure, m)] = _apen_from_counts(closed, len(x), m, tau)
+            else:
+                results[(measure, m)] = _sampen_from_counts(x, open_, r, m, tau)
+    return results
+
+
+def entropy_table(columns, ms=(2,), measures=MEASURES, r_factor=None, tau=1):
+    """
+    一次计算多列、多个 m 的 ApEn / SampEn。
+    同一列中容差相同的所有 (指标, m) 共用一次匹配计数（长度取到 max(m) + 1），
+    容差只按列计算一次。
+    :param columns: {列名: 数组}
+    :param ms: 嵌入维度列表
+    :param measures: MEASURES 的子集
+    :param r_factor: 见 tolerance_groups
+    :param tau: 延迟
+    :return: {(列名, 指标, m): 熵}
+    """
+    results = {}
+    for name, x in columns.items():
+        for (measure, m), value in entropies_for(x, tolerance_groups(x, ms, measures, r_factor), tau).items():
+            results[(name, measure, m)] = value
+    return results
+
+
+def multiscale_table(columns, scales=range(1, 21), ms=(2,), measures=MEASURES, r_factor=None, tau=1):
+    """
+    多尺度熵（Costa 的做法）：容差由原始序列决定，各尺度沿用同一个容差，尺度 1 的结果即单尺度的值。
+    每列只做一次累加和得到所有尺度的粗粒化序列。
+    :param columns: {列名: 数组}
+    :param scales: 尺度列表
+    :param ms: 嵌入维度列表
+    :param measures: MEASURES 的子集
+    :param r_factor: 见 tolerance_groups
+    :param tau: 延迟
+    :return: {(列名, 指标, m, 尺度): 熵}
+    """
+    results = {}
+    for name, x in columns.items():
+        groups = tolerance_groups(x, ms, measures, r_factor)
+        for scale, y in coarse_grain(x, scales).items():
+            for (measure, m), value in entropies_for(y, groups, tau).items():
+                results[(name, measure, m, scale)] = value
+    return results
+
+
+def window_starts(n, window_size, step):
+    """长度 n 的序列上各窗口的起点（只取完整的窗口）。"""
+    if n < window_size:
+        return np.empty(0, dtype=np.int64)
+    return np.arange(0, n - window_size + 1, step)
+
+
+def _sliding_counts(x, r, length, tau, size, starts, strict, max_bytes):
+    # 依次产生各窗口 [s, s + size) 中每个模板（长度 length）与窗口内其他模板的匹配数。
+    # 窗口前进时只比较移出和移入的模板：移出的模板从其余模板的计数中减掉，移入的模板与窗口内的模板比较后加上，
+    # 每个窗口的代价为 O(step * size) 而不是 O(size ** 2)。
+    # strict=True：距离 < r 且不含自身（SampEn）；False：距离 <= r 且含自身（ApEn）
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    counts = np.zeros(len(x) - (length - 1) * tau, dtype=np.int64)
+    if njit is not None:
+        def update(rows_lo, rows_hi, lo, hi, old_hi, sign):
+            _update_counts(x, float(r), length, tau, rows_lo, rows_hi, lo, hi, old_hi, sign, strict, counts)
+    else:
+        emb = np.column_stack([x[k * tau:k * tau + len(counts)] for k in range(length)])
+
+        def update(rows_lo, rows_hi, lo, hi, old_hi, sign):
+            rows = max(1, max_bytes // (8 * max(1, hi - lo)))
+            for a in range(rows_lo, rows_hi, rows):
+                b = min(rows_hi, a + rows)
+                d = np.abs(emb[a:b, 0, None] - emb[None, lo:hi, 0])
+                for k in range(1, length):
+                    np.maximum(d, np.abs(emb[a:b, k, None] - emb[None, lo:hi, k]), out=d)
+                match = d < r if strict else d <= r
+                if strict:
+                    # 自身配对在矩阵中位于 (i - a, i - lo)
+                    own = np.arange(max(a, lo), min(b, hi))
+                    match[own - a, own - lo] = False
+                counts[lo:hi] += sign * match.sum(axis=0)
+                if sign > 0:
+                    counts[a:b] += match[:, :old_hi - lo].sum(axis=1)
+
+    lo = hi = 0
+    for s in starts:
+        s = int(s)
+        if s >= hi:
+            # 与上一个窗口不重叠：从空集合开始
+            counts[lo:hi] = 0
+            lo = hi = s
+        update(lo, s, lo, hi, hi, -1)
+        counts[lo:s] = 0
+        lo = s
+        update(hi, s + size, lo, s + size, hi, 1)
+        hi = s + size
+        yield counts[lo:hi]
+
+
+def window_entropies(x, window_size, step, groups, tau=1, max_bytes=64 * 2 ** 20):
+    """
+    滑动窗口的 ApEn / SampEn：窗口前进时增量更新匹配计数，不逐窗重算。
+    容差由 groups 固定（通常按整段序列计算），各窗口共用，这样各窗口的值可以互相比较，计数也才能增量更新；
+    每个窗口的结果与对该窗口直接调用 approximate_entropy / sample_entropy（同一个 r）相同。
+    :param x: 一维序列
+    :param window_size: 窗口长度（样本数）
+    :param step: 窗口步长（样本数）
+    :param groups: tolerance_groups 的结果
+    :param tau: 延迟
+    :param max_bytes: 每块比较矩阵的内存上限
+    :return: {(指标, m): 各窗口的熵}，与 window_starts(len(x), window_size, step) 对应
+    """
+    x = np.asarray(x, dtype=np.float64)
+    starts = window_starts(len(x), window_size, step)
+    results = {}
+    for r, requests in groups.items():
+        for measure, m in requests:
+            values = np.full(len(starts), np.nan)
+            if len(starts) and window_size > (m + 1) * tau:
+                if measure == "apen":
+                    n_m, n_m1 = window_size - (m - 1) * tau, window_size - m * tau
+                    streams = zip(_sliding_counts(x, r, m, tau, n_m, starts, False, max_bytes),
+                                  _sliding_counts(x, r, m + 1, tau, n_m1, starts, False, max_bytes))
+                    for w, (c_m, c_m1) in enumerate(streams):
+                        values[w] = np.sum(np.log(c_m / n_m)) / n_m - np.sum(np.log(c_m1 / n_m1)) / n_m1
+                else:
+                    n = window_size - m * tau
+                    streams = zip(_sliding_counts(x, r, m, tau, n, starts, True, max_bytes),
+                                  _sliding_counts(x, r, m + 1, tau, n, starts, True, max_bytes))
+                    for w, (c_m, c_m1) in enumerate(streams):
+                        values[w] = _sampen_value(c_m1.sum() / 2, c_m.sum() / 2)
+            results[(measure, m)] = values
+    return results
+
+
+def summarize_windows(values):
+    """
+    各窗口熵的汇总，忽略 NaN/inf 窗口。
+    :param values: 各窗口的熵（按时间顺序）
+    :return: {"mean", "std", "min", "max", "slope"}；slope 为对窗口序号的线性趋势（每个窗口的变化量）
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = np.flatnonzero(np.isfinite(values))
+    if not len(index):
+        return dict.fromkeys(("mean", "std", "min", "max", "slope"), np.nan)
+    valid = values[index]
+    slope = np.polyfit(index, valid, 1)[0] if len(index) > 1 else np.nan
+    return {"mean": valid.mean(), "std": valid.std(), "min": valid.min(), "max": valid.max(), "slope": slope}
+
+
+def _sorted_match_counts(x, order, xs, r, max_len, tau, closed, open_):
+    # 每个模板 i 独立：在排序后的值中找出首元素相差不超过 r 的候选，再逐点延伸匹配长度
+    N = x.shape[0]
+    for i in prange(N):
+        xi = x[i]
+        lo = np.searchsorted(xs, xi - r)
+        while lo > 0 and abs(xs[lo - 1] - xi) <= r:
+            lo -= 1
+        hi = np.searchsorted(xs, xi + r, side='right')
+        while hi < N and abs(xs[hi] - xi) <= r:
+            hi += 1
+        for p in range(lo, hi):
+            j = order[p]
+            length = 0
+            strict = 0
+            for k in range(max_len):
+                a = i + k * tau
+                b = j + k * tau
+                if a >= N or b >= N:
+                    break
+                d = abs(x[a] - x[b])
+                if not d <= r:
+                    break
+                length += 1
+                if strict == k and d < r:
+                    strict += 1
+            for k in range(length):
+                closed[i, k] += 1
+            if j != i:
+                for k in range(strict):
+                    open_[i, k] += 1
+
+
+def _update_counts(x, r, length, tau, rows_lo, rows_hi, lo, hi, old_hi, sign, strict, counts):
+    # 模板 rows_lo..rows_hi-1 与 lo..hi-1 逐对比较（不匹配的维度出现就提前结束）；
+    # sign > 0 时移入的模板还要加上与原有模板 lo..old_hi-1 的匹配数
+    for i in range(rows_lo, rows_hi):
+        for j in range(lo, hi):
+            if strict and i == j:
+                continue
+            matched = True
+            for k in range(length):
+                d = abs(x[i + k * tau] - x[j + k * tau])
+                if (strict and not d < r) or (not strict and not d <= r):
+                    matched = False
+                    break
+            if matched:
+                counts[j] += sign
+                if sign > 0 and j < old_hi:
+                    counts[i] += 1
+
+
+if njit is not None:
+    # cache=True：编译结果写入磁盘缓存，spawn 出来的工作进程不必重新编译
+    _sorted_match_counts = njit(parallel=True, cache=True)(_sorted_match_counts)
+    # 计数数组会被不同的 i 同时更新，不能按 i 并行；并行交给 BatchRunner 按窗口块切分
+    _update_counts = njit(cache=True)(_update_counts)
@@ -0,0 +1,383 @@
+import os
+import threading
+import functools
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk, scrolledtext
+import pandas as pd
+import numpy as np
+from batch_runner import BatchRunner, SkipFile, default_workers
+from data_cache import load_columns, is_data_file
+from resampler import resample
+from schema_index import SchemaIndex
+from cross_entropy_engine import cross_entropy
+from coherence import calculate_coherence
+from correlation import pearson_correlation
+from NLID import split_nlid_units, compute_nlid_unit
+from entropy_engine import approximate_entropy, sample_entropy
+
+FEATURES = ("nlid", "apen", "sampen", "cross_entropy", "coherence", "pearson")
+
+DEFAULT_PARAMS = dict(
+    m=3, tau=1, window_size=100, overlap=0.5, whole=False,
+    threshold=0.1, threshold_type="dynamic", engine="auto", max_bytes=256 * 2 ** 20, dtype=np.float64,
+    entropy_m=2, fs=1000.0,
+)
+
+
+def load_recording(path, columns):
+    """
+    读取一个记录文件，只取出所需的列（列名去空白并转大写）。
+    :param path: CSV/XLSX 文件路径
+    :param columns: 需要的列名
+    :return: {列名: float 数组}，保留原始长度和 NaN
+    """
+    data = load_columns(path, columns, normalize=True)
+    columns = [col.strip().upper() for col in columns]
+    missing = [col for col in columns if col not in data]
+    if missing:
+        raise SkipFile(f"missing columns: {', '.join(missing)}.")
+    return {col: np.array(values, dtype=float) if values.dtype.kind in 'biuf'
+            else pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+            for col, values in data.items()}
+
+
+def resample_recording(data, time_column, rate, method="linear", time_unit=1e-3):
+    """
+    在内存中把各列重采样到等间隔时间轴（见 resampler.resample），不写中间文件。
+    :param data: load_recording 的返回值，须包含时间列
+    :param time_column: 时间列名
+    :param rate: 目标采样率（Hz）
+    :param method: 插值方法
+    :param time_unit: 时间列一个单位的秒数（默认毫秒）
+    :return: 新的 {列名: 数组}，时间列为新的时间轴
+    """
+    time_column = time_column.strip().upper()
+    grid, resampled = resample(data[time_column], {col: values for col, values in data.items() if col != time_column},
+                               rate, method, time_unit)
+    return {time_column: grid, **resampled}
+
+
+def _paired(x, y):
+    # 与 NLID/Pearson/Coherence 工具相同：两列各自去掉 NaN 后截到相同长度
+    x = x[~np.isnan(x)]
+    y = y[~np.isnan(y)]
+    min_len = min(len(x), len(y))
+    return x[:min_len], y[:min_len]
+
+
+def plan_recording(path, col_x, col_y, features, params, resample_rate=None, time_column="Time", chunks=1,
+                   time_unit=1e-3):
+    """
+    读取一个文件一次，按所选特征拆成工作单元 (特征名, 载荷)。
+    :param path: 文件路径
+    :param col_x: X 列名
+    :param col_y: Y 列名
+    :param features: FEATURES 的子集
+    :param params: 特征参数（见 DEFAULT_PARAMS）
+    :param resample_rate: 不为 None 时先在内存中重采样到该采样率（Hz），Coherence 的 fs 随之取该值
+    :param time_column: 重采样用的时间列
+    :param time_unit: 时间列一个单位的秒数（默认毫秒），重采样时把 Hz 换算到时间列的单位
+    :param chunks: NLID 滑动窗口拆分的段数
+    :return: 工作单元列表
+    """
+    cx, cy = col_x.strip().upper(), col_y.strip().upper()
+    columns = [cx, cy] + ([time_column] if resample_rate else [])
+    data = load_recording(path, columns)
+    if resample_rate:
+        data = resample_recording(data, time_column, resample_rate, time_unit=time_unit)
+    x, y = data[cx], data[cy]
+
+    units = []
+    for feature in features:
+        if feature == "nlid":
+            step = int(params["window_size"] * (1 - params["overlap"]))
+            settings = dict(params, step=step)
+            xs, ys = _paired(x, y)
+            try:
+                nlid_units = split_nlid_units(xs, ys, params["m"], params["tau"], params["window_size"], step,
+                                              params["whole"], settings, chunks)
+            except SkipFile as exc:
+                units.append(("nlid", exc))
+                continue
+            units.extend(("nlid", unit) for unit in nlid_units)
+        elif feature in ("apen", "sampen"):
+            units.append((feature, (cx, x, params["entropy_m"])))
+            units.append((feature, (cy, y, params["entropy_m"])))
+        elif feature == "coherence":
+            xs, ys = _paired(x, y)
+            units.append((feature, (xs, ys, resample_rate or params["fs"])))
+        elif feature in ("pearson", "cross_entropy"):
+            units.append((feature, _paired(x, y) if feature == "pearson" else (x, y)))
+        else:
+            raise ValueError(f"Unknown feature: {feature}")
+    return units
+
+
+def compute_feature_unit(unit):
+    """
+    计算一个工作单元。
+    :return: (特征名, 结果, 错误信息)；出错时结果为 None，不影响同一文件的其他特征
+    """
+    feature, payload = unit
+    if isinstance(payload, Exception):
+        return feature, None, str(payload)
+    try:
+        if feature == "nlid":
+            return feature, compute_nlid_unit(payload), None
+        if feature == "apen":
+            col, data, m = payload
+            return feature, (col, approximate_entropy(data, m)), None
+        if feature == "sampen":
+            col, data, m = payload
+            return feature, (col, sample_entropy(data, m)), None
+        if feature == "cross_entropy":
+            x, y = payload
+            # 与交叉熵工具相同，±inf 也去掉（箱编号要求有限值）
+            x = x[np.isfinite(x)]
+            y = y[np.isfinite(y)]
+            min_len = min(len(x), len(y))
+            # 固定宽度 1 的网格，与原来取整后计算的结果相同
+            return feature, cross_entropy(x[:min_len], y[:min_len])[:2], None
+        if feature == "coherence":
+            X, Y, fs = payload
+            return feature, calculate_coherence(X, Y, fs=fs)[2], None
+        X, Y = payload
+        return feature, pearson_correlation(X, Y), None
+    except Exception as exc:
+        return feature, None, str(exc)
+
+
+def merge_features(path, partials, col_x, col_y, whole):
+    """
+    把一个文件的各单元结果合并成特征表中的一行。
+    :return: (行, 日志列表)
+    """
+    cx, cy = col_x.strip().upper(), col_y.strip().upper()
+    row = {"檔名": os.path.basename(path)}
+    logs = []
+    nlid = []
+    for feature, value, error in partials:
+        if error is not None:
+            logs.append(f"{feature}: {error}")
+        elif feature == "nlid":
+            nlid.append(value)
+        elif feature in ("apen", "sampen"):
+            col, s = value
+            row[f"{col} {'ApEn' if feature == 'apen' else 'SampEn'}"] = s
+        elif feature == "cross_entropy":
+            row["Cross_Entropy"], reason = value
+            row["Cross_Entropy_Reason"] = reason if reason else "OK"
+        elif feature == "coherence":
+            row["Coherence"] = value
+        else:
+            row[f"Pearson({cx},{cy})"] = value
+    if nlid and len(nlid) == sum(feature == "nlid" for feature, _, _ in partials):
+        if whole:
+            (avg_xy, avg_yx), = nlid
+        else:
+            avg_xy = np.mean(np.concatenate([xy for xy, _ in nlid]))
+            avg_yx = np.mean(np.concatenate([yx for _, yx in nlid]))
+        row[f"Avg NLID({cx}|{cy})"] = avg_xy
+        row[f"Avg NLID({cy}|{cx})"] = avg_yx
+    return row, logs
+
+
+def run_pipeline(files, col_x, col_y, features, params=None, resample_rate=None, time_column="Time",
+                 workers=1, on_file_done=None, on_error=None, time_unit=1e-3):
+    """
+    对一批文件一次读取、一次计算所有所选特征。
+    :param files: 文件路径列表
+    :param params: 覆盖 DEFAULT_PARAMS 的参数
+    :param resample_rate: 见 plan_recording
+    :param time_unit: 见 plan_recording
+    :param workers: 工作进程数
+    :param on_file_done: on_file_done(path, (row, logs))
+    :param on_error: on_error(path, exc)
+    :return: 特征表 DataFrame，每个成功的文件一行，按 files 的顺序排列
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    plan = functools.partial(plan_recording, col_x=col_x, col_y=col_y, features=tuple(features), params=params,
+                             resample_rate=resample_rate, time_column=time_column, chunks=2 * workers,
+                             time_unit=time_unit)
+    merge = functools.partial(merge_features, col_x=col_x, col_y=col_y, whole=params["whole"])
+    outcomes = BatchRunner(workers).run(files, plan, compute_feature_unit, merge, on_file_done, on_error)
+    return pd.DataFrame([row for row, _ in filter(None, outcomes)])
+
+
+class FeaturePipelineApp:
+    FEATURE_LABELS = {"nlid": "NLID", "apen": "ApEn", "sampen": "SampEn", "cross_entropy": "Cross Entropy",
+                      "coherence": "Coherence", "pearson": "Pearson"}
+
+    def __init__(self, master):
+        self.master = master
+        master.title("Feature Pipeline")
+        master.geometry("900x800")
+
+        container = ttk.Frame(master, padding=10)
+        container.pack(fill='both', expand=True)
+
+        input_frame = ttk.Labelframe(container, text="Input Settings", padding=10)
+        input_frame.pack(fill='x', pady=5)
+        ttk.Label(input_frame, text="Folder:").grid(row=0, column=0, sticky='w')
+        self.entry_folder = ttk.Entry(input_frame, width=60)
+        self.entry_folder.grid(row=0, column=1, sticky='ew')
+        ttk.Button(input_frame, text="Browse", command=self.browse_folder).grid(row=0, column=2)
+        ttk.Button(input_frame, text="Load Columns", command=self.load_columns).grid(row=1, column=1, pady=5)
+        input_frame.columnconfigure(1, weight=1)
+
+        column_frame = ttk.Labelframe(container, text="Select 2 Columns", padding=10)
+        column_frame.pack(fill='x', pady=5)
+        ttk.Label(column_frame, text="Column X:").grid(row=0, column=0, sticky='e')
+        self.combo_col_x = ttk.Combobox(column_frame, state="readonly", width=30)
+        self.combo_col_x.grid(row=0, column=1, sticky='w', padx=5)
+        ttk.Label(column_frame, text="Column Y:").grid(row=1, column=0, sticky='e')
+        self.combo_col_y = ttk.Combobox(column_frame, state="readonly", width=30)
+        self.combo_col_y.grid(row=1, column=1, sticky='w', padx=5)
+
+        feature_frame = ttk.Labelframe(container, text="Features", padding=10)
+        feature_frame.pack(fill='x', pady=5)
+        self.feature_vars = {}
+        for i, feature in enumerate(FEATURES):
+            var = tk.BooleanVar(value=True)
+            ttk.Checkbutton(feature_frame, text=self.FEATURE_LABELS[feature], variable=var).grid(row=0, column=i, sticky='w', padx=5)
+            self.feature_vars[feature] = var
+
+        param_frame = ttk.Labelframe(container, text="Parameters", padding=10)
+        param_frame.pack(fill='x', pady=5)
+        self.entries = {}
+        fields = [("m", "NLID embedding dimension (m):"), ("tau", "NLID delay (tau):"),
+                  ("window_size", "NLID window size:"), ("overlap", "NLID overlap ratio (0-1):"),
+                  ("threshold", "NLID threshold:"), ("entropy_m", "ApEn/SampEn dimension (m):"),
+                  ("fs", "Coherence sampling rate (Hz):"), ("resample_rate", "Resample rate (Hz, blank = off):"),
+                  ("time_column", "Time column:"), ("workers", "Workers:")]
+        for row, (key, label) in enumerate(fields):
+            ttk.Label(param_frame, text=label).grid(row=row % 5, column=2 * (row // 5), sticky='w')
+            entry = ttk.Entry(param_frame, width=10)
+            default = {"resample_rate": "", "time_column": "Time", "workers": str(default_workers())}.get(key, DEFAULT_PARAMS.get(key))
+            entry.insert(0, str(default))
+            entry.grid(row=row % 5, column=2 * (row // 5) + 1, sticky='w', padx=5)
+            self.entries[key] = entry
+        self.whole_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="NLID whole recording (no windowing)", variable=self.whole_var).grid(row=5, column=0, columnspan=2, sticky='w')
+        ttk.Label(param_frame, text="NLID threshold type:").grid(row=6, column=0, sticky='w')
+        self.combo_threshold_type = ttk.Combobox(param_frame, state="readonly", width=10,
+                                                 values=["dynamic", "static", "fixed_rr"])
+        self.combo_threshold_type.set("dynamic")
+        self.combo_threshold_type.grid(row=6, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="NLID engine:").grid(row=7, column=0, sticky='w')
+        self.combo_engine = ttk.Combobox(param_frame, state="readonly", width=10,
+                                         values=["auto", "batch", "rolling", "sparse", "fused"])
+        self.combo_engine.set("auto")
+        self.combo_engine.grid(row=7, column=1, sticky='w', padx=5)
+        # "auto" stays bit-identical to batch; the fused kernel sums in a different order
+        ttk.Label(param_frame, text="fused: within ~1e-7 of batch").grid(row=7, column=2, sticky='w')
+
+        progress_frame = ttk.Frame(container)
+        progress_frame.pack(fill='both', expand=True, pady=5)
+        self.progress = ttk.Progressbar(progress_frame, orient="horizontal", mode="determinate")
+        self.progress.pack(fill='x', pady=5)
+        self.log = scrolledtext.ScrolledText(progress_frame, height=12, wrap='word')
+        self.log.pack(fill='both', expand=True)
+
+        ttk.Button(container, text="Start Analysis", command=self.start).pack(pady=10)
+
+    def browse_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.entry_folder.delete(0, tk.END)
+            self.entry_folder.insert(0, folder)
+            self.combo_col_x['values'] = []
+            self.combo_col_y['values'] = []
+            self.combo_col_x.set('')
+            self.combo_col_y.set('')
+
+    def load_columns(self):
+        folder = self.entry_folder.get()
+        if not os.path.isdir(folder):
+            messagebox.showerror("Invalid folder", "Please select a valid folder first.")
+            return
+        files = [f for f in os.listdir(folder) if is_data_file(f)]
+        if not files:
+            messagebox.showwarning("No files found", "No Excel/CSV files in the folder.")
+            return
+        try:
+            index = SchemaIndex.scan([os.path.join(folder, f) for f in files])
+            cols = [''] + [col.strip() for col in index.intersection()]
+            self.combo_col_x['values'] = cols
+            self.combo_col_y['values'] = cols
+            messagebox.showinfo("Columns Loaded", index.report())
+        except Exception as e:
+            messagebox.showerror("Load Error", str(e))
+
+    def log_message(self, msg):
+        self.log.insert(tk.END, msg + "\n")
+        self.log.yview(tk.END)
+
+    def start(self):
+        folder = self.entry_folder.get()
+        col_x = self.combo_col_x.get()
+        col_y = self.combo_col_y.get()
+        features = [feature for feature in FEATURES if self.feature_vars[feature].get()]
+        try:
+            params = dict(m=int(self.entries["m"].get()), tau=int(self.entries["tau"].get()),
+                          window_size=int(self.entries["window_size"].get()),
+                          overlap=float(self.entries["overlap"].get()),
+                          threshold=float(self.entries["threshold"].get()),
+                          entropy_m=int(self.entries["entropy_m"].get()), fs=float(self.entries["fs"].get()),
+                          whole=self.whole_var.get(), threshold_type=self.combo_threshold_type.get(),
+                          engine=self.combo_engine.get())
+            rate = self.entries["resample_rate"].get().strip()
+            resample_rate = float(rate) if rate else None
+            workers = int(self.entries["workers"].get())
+        except ValueError:
+            messagebox.showerror("Invalid input", "Dimensions, delay, window size and workers must be integers; other parameters floats.")
+            return
+        if not os.path.isdir(folder) or not col_x or not col_y or not features:
+            messagebox.showerror("Missing info", "Ensure folder, two columns and at least one feature are selected.")
+            return
+        if workers < 1 or (resample_rate is not None and resample_rate <= 0):
+            messagebox.showerror("Invalid input", "Workers must be >=1 and resample rate >0.")
+            return
+        if "nlid" in features and not params["whole"] and (
+                not (0 <= params["overlap"] < 1) or int(params["window_size"] * (1 - params["overlap"])) < 1
+                or params["window_size"] <= (params["m"] - 1) * params["tau"]):
+            messagebox.showerror("Invalid window settings", "Window step must be >=1 sample and window size > (m-1)*tau.")
+            return
+        threading.Thread(target=self.process_files,
+                         args=(folder, col_x, col_y, features, params, resample_rate,
+                               self.entries["time_column"].get(), workers),
+                         daemon=True).start()
+
+    def process_files(self, folder, col_x, col_y, features, params, resample_rate=None, time_column="Time", workers=1):
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if is_data_file(f)]
+        self.progress['maximum'] = len(files)
+        self.progress['value'] = 0
+
+        def on_file_done(file, result):
+            _, logs = result
+            self.log_message(f"Processed: {os.path.basename(file)}" + (" (" + "; ".join(logs) + ")" if logs else ""))
+            self.progress['value'] += 1
+
+        def on_error(file, exc):
+            basename = os.path.basename(file)
+            if isinstance(exc, SkipFile):
+                self.log_message(f"{basename}: {exc}")
+            else:
+                self.log_message(f"Error {basename}: {exc}")
+            self.progress['value'] += 1
+
+        result_df = run_pipeline(files, col_x, col_y, features, params, resample_rate, time_column,
+                                 workers, on_file_done, on_error)
+        if not result_df.empty:
+            output_path = os.path.join(folder, "Feature_Results.xlsx")
+            result_df.to_excel(output_path, index=False)
+            self.log_message(f"Results saved to {output_path}")
+            messagebox.showinfo("Done", f"Analysis completed. Saved to: {output_path}")
+        else:
+            messagebox.showwarning("No Data", "No valid files processed.")
+
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = FeaturePipelineApp(root)
+    root.mainloop()
@@ -0,0 +1,396 @@
+import os
+import sys
+import time
+import socket
+import argparse
+from collections import deque
+import numpy as np
+import pandas as pd
+from NLIDOOP3 import RecurrenceAnalysis, RollingRecurrence
+from data_cache import read_table, is_data_file
+
+
+class StreamingNLID:
+    """
+    实时计算 NLID：样本 (Time, X, Y) 逐批到达，存入环形缓冲区，每凑满一个窗口就输出该窗口的 NLID。
+    窗口的划分与批处理工具相同（window_size 个样本、步长 step），同一序列得到的数值与
+    RecurrenceAnalysis.compute_nlid_windows 相同。
+    窗口点数较多且重叠率高时，X、Y 各用一个 RollingRecurrence 增量更新距离矩阵：相空间点在样本到达时就加入，
+    窗口完成时只剩阈值比较和列求和；其余情况逐窗口整窗计算。
+    为使每个窗口的延迟不超过预算，同一批数据中完成的窗口若按估计的耗时来不及在 latency_budget 内全部计算，
+    只计算最新的几个，较早的记为跳过（数据一次到达很多时，如连接中断后补发）。
+    rolling 跳过窗口后要重建整个距离矩阵，这一次的耗时也计入估计。
+    """
+
+    def __init__(self, m, tau, window_size, step, threshold=0.1, threshold_type="dynamic",
+                 engine="auto", latency_budget=0.1):
+        """
+        :param m: 嵌入维度
+        :param tau: 时间延迟
+        :param window_size: 窗口长度（样本数）
+        :param step: 窗口步长（样本数）
+        :param threshold: 静态或动态的阈值
+        :param threshold_type: "static"、"dynamic" 或 "fixed_rr"
+        :param engine: 见 RecurrenceAnalysis.compute_nlid_windows；"auto" 时按相同的规则选择
+        :param latency_budget: 每个窗口从最后一个样本到达到输出结果的延迟预算（秒）
+        """
+        self.m, self.tau = m, tau
+        self.window_size, self.step = window_size, step
+        self.threshold, self.threshold_type = threshold, threshold_type
+        self.latency_budget = latency_budget
+        M = window_size - (m - 1) * tau
+        if M < 2 or step < 1:
+            raise ValueError("窗口长度须大于 (m - 1) * tau + 1，步长须不小于 1")
+        if engine == "auto":
+            if M >= RollingRecurrence.MIN_SIZE and step * 10 < M:
+                engine = "rolling"
+            else:
+                engine = "batch"
+        self.engine = engine
+        self.M = M
+        # 每个样本同时写在 k 和 k + window_size 两处，最近一个窗口总是连续的切片 [k, k + window_size)
+        self._buffer = np.zeros((3, 2 * window_size), dtype=np.float64)
+        self.count = 0
+        self.windows = 0
+        self.skipped = 0
+        self._cost = 0.0
+        self._rebuild = 0.0
+        self.reset()
+        self._warm_up()
+
+    def reset(self):
+        """清空缓冲区（新的记录开始时调用）；已编译的内核和计时估计保留。"""
+        self.count = 0
+        self.windows = 0
+        self.skipped = 0
+        self._pushed = 0
+        if self.engine == "rolling":
+            self._rolling = (RollingRecurrence(self.M, self.m), RollingRecurrence(self.M, self.m))
+            self._mask = np.empty((self.M, self.M), dtype=bool)
+
+    def _warm_up(self):
+        # 先算两个随机窗口：numba 内核在第一次调用时编译，第二次的耗时作为每个窗口耗时的初始估计；
+        # rolling 另外量一次重建整个距离矩阵的耗时
+        rng = np.random.default_rng(0)
+        x, y = rng.standard_normal((2, self.window_size))
+        engine = "batch" if self.engine == "rolling" else self.engine
+        for _ in range(2):
+            started = time.perf_counter()
+            RecurrenceAnalysis.compute_nlid_windows(x, y, self.m, self.tau, self.window_size, self.window_size,
+                                                    self.threshold, self.threshold_type, engine=engine)
+            self._cost = time.perf_counter() - started
+        if self.engine == "rolling":
+            started = time.perf_counter()
+            for data in (x, y):
+                rolling = RollingRecurrence(self.M, self.m)
+                rolling.push(RecurrenceAnalysis(data, self.m, self.tau).reconstruct_phase_space())
+            self._rebuild = time.perf_counter() - started
+
+    @property
+    def window_cost(self):
+        """每个窗口计算耗时的估计（秒，指数滑动平均）。"""
+        return self._cost
+
+    def push(self, t, x, y, arrival=None):
+        """
+        加入一批样本，返回这批样本中完成的各窗口的结果。X 或 Y 为 NaN 的样本（如眨眼丢失）被丢弃。
+        :param t: 各样本的时间戳
+        :param x: X 值
+        :param y: Y 值
+        :param arrival: 这批样本到达的时刻（time.monotonic()），默认为调用时
+        :return: [{"window", "start", "end", "xy", "yx", "latency", "skipped"}, ...]，
+                 window 为窗口序号，start、end 为窗口首末样本的时间戳，latency 为从到达到得出结果的秒数，
+                 skipped 为此窗口之前因延迟预算而跳过的窗口数
+        """
+        arrival = time.monotonic() if arrival is None else arrival
+        batch = np.vstack([np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (t, x, y)])
+        batch = batch[:, ~np.isnan(batch[1:]).any(axis=0)]
+        # 这批样本中完成的窗口：第 w 个窗口在累计到 window_size + w * step 个样本时完成
+        total = self.count + batch.shape[1]
+        first = max(0, -(-(self.count + 1 - self.window_size) // self.step))
+        ends = list(range(self.window_size + first * self.step, total + 1, self.step))
+        # 来不及全部计算时只保留最新的几个窗口
+        left = self.latency_budget - (time.monotonic() - arrival)
+        room = max(1, int(left // self._cost)) if self._cost > 0 else len(ends)
+        if room < len(ends) and self._rebuild:
+            room = max(1, int((left - self._rebuild) // self._cost))
+        keep = set(ends[-room:])
+
+        results = []
+        skipped = 0
+        position = 0
+        for end in ends:
+            if end not in keep:
+                skipped += 1
+                self.skipped += 1
+                continue
+            self._append(batch[:, position:position + end - self.count])
+            position = end - (total - batch.shape[1])
+            results.append(self._window(arrival, skipped))
+            skipped = 0
+        self._append(batch[:, position:])
+        return results
+
+    def _advance(self):
+        # 把样本已经到齐、仍在缓冲区中的相空间点加入两个 RollingRecurrence；
+        # 更早的点在窗口完成前就会被移出，不必加入
+        span = (self.m - 1) * self.tau
+        first = max(self._pushed, self.count - self.window_size)
+        stop = self.count - span
+        if stop <= first:
+            return
+        head = self.count % self.window_size
+        offset = first - (self.count - self.window_size)
+        _, x, y = self._buffer[:, head + offset:head + offset + stop - first + span]
+        self._rolling[0].push(RecurrenceAnalysis(x, self.m, self.tau).reconstruct_phase_space())
+        self._rolling[1].push(RecurrenceAnalysis(y, self.m, self.tau).reconstruct_phase_space())
+        self._pushed = stop
+
+    def _append(self, chunk):
+        k = chunk.shape[1]
+        size = self.window_size
+        if k > size:
+            # 早于最近一个窗口的样本不再需要
+            self.count += k - size
+            chunk = chunk[:, -size:]
+        while chunk.shape[1]:
+            head = self.count % size
+            k = min(chunk.shape[1], size - head)
+            self._buffer[:, head:head + k] = chunk[:, :k]
+            self._buffer[:, head + size:head + size + k] = chunk[:, :k]
+            self.count += k
+            chunk = chunk[:, k:]
+        if self.engine == "rolling":
+            self._advance()
+
+    def _window(self, arrival, skipped):
+        # 缓冲区中最近 window_size 个样本构成的窗口
+        started = time.perf_counter()
+        head = self.count % self.window_size
+        t, x, y = self._buffer[:, head:head + self.window_size]
+        start = self.count - self.window_size
+        if self.engine == "rolling":
+            # 窗口内的点都已在样本到达时加入（见 _advance）
+            rolling_x, rolling_y = self._rolling
+            bits_x = rolling_x.recurrence_matrix(self.threshold, self.threshold_type, out=self._mask, packed=True)
+            bits_y = rolling_y.recurrence_matrix(self.threshold, self.threshold_type, out=self._mask, packed=True)
+            xy, yx = RecurrenceAnalysis.calculate_nlid_batch(bits_x, bits_y, rolling_x.order, packed=True)
+        else:
+            xy, yx = RecurrenceAnalysis.compute_nlid_windows(
+                x, y, self.m, self.tau, self.window_size, self.window_size,
+                self.threshold, self.threshold_type, engine=self.engine)
+        self._cost = 0.8 * self._cost + 0.2 * (time.perf_counter() - started)
+        self.windows += 1
+        return {"window": start // self.step, "start": t[0], "end": t[-1],
+                "xy": float(np.squeeze(xy)), "yx": float(np.squeeze(yx)),
+                "latency": time.monotonic() - arrival, "skipped": skipped}
+
+
+class FatigueMonitor:
+    """
+    在线疲劳提示：前 baseline 个窗口的 NLID 作为该次记录的基线，之后最近 smooth 个窗口的平均值
+    偏离基线平均值超过 z 个基线标准差时发出提示。每个方向只在进入偏离状态时提示一次，回到基线范围后才会再次提示。
+    """
+
+    def __init__(self, baseline=10, smooth=5, z=3.0):
+        """
+        :param baseline: 作为基线的窗口数
+        :param smooth: 与基线比较的最近窗口数
+        :param z: 提示的门槛（基线标准差的倍数）
+        """
+        self.baseline, self.smooth, self.z = baseline, smooth, z
+        self.reset()
+
+    def reset(self):
+        """重新开始收集基线。"""
+        self.history = {key: [] for key in ("xy", "yx")}
+        self.recent = {key: deque(maxlen=self.smooth) for key in ("xy", "yx")}
+        self.reference = {}
+        self.alerting = {key: False for key in ("xy", "yx")}
+
+    def update(self, result):
+        """
+        :param result: StreamingNLID.push 返回的一个窗口的结果
+        :return: 本窗口新出现的提示 [{"direction": "xy" 或 "yx", "value": 最近窗口的平均值, "z": 偏离的标准差倍数}]
+        """
+        alerts = []
+        for key in ("xy", "yx"):
+            value = result[key]
+            if len(self.history[key]) < self.baseline:
+                self.history[key].append(value)
+                if len(self.history[key]) == self.baseline:
+                    # 基线的 NLID 可能完全不变（如量化很粗的数据），标准差给一个下限
+                    self.reference[key] = (np.mean(self.history[key]), max(np.std(self.history[key]), 1e-6))
+                continue
+            self.recent[key].append(value)
+            if len(self.recent[key]) < self.smooth:
+                continue
+            mean, std = self.reference[key]
+            value = float(np.mean(self.recent[key]))
+            score = (value - mean) / std
+            outside = abs(score) > self.z
+            if outside and not self.alerting[key]:
+                alerts.append({"direction": key, "value": value, "z": score})
+            self.alerting[key] = outside
+        return alerts
+
+
+def replay_source(path, columns=("Time", "X", "Y"), speed=1.0, time_unit=1e-3, chunk=64):
+    """
+    按记录的时间间隔重放一个数据文件，用于在没有眼动仪时测试实时流程。
+    :param path: 数据文件路径
+    :param columns: 时间、X、Y 三列的列名（不区分大小写）
+    :param speed: 重放速度的倍数；不大于 0 时不等待，尽快送出
+    :param time_unit: 时间列一个单位的秒数（默认毫秒）
+    :param chunk: 不等待时每批的样本数
+    :return: 逐批产生 (时间, X, Y) 数组
+    """
+    names = [name.strip().upper() for name in columns]
+    df = read_table(path, list(columns), normalize=True)
+    missing = [name for name in names if name not in df.columns]
+    if missing:
+        raise KeyError(f"missing columns: {', '.join(missing)}")
+    # 转不成数字的坏值（如 "45000%"）记为 NaN；X、Y 的 NaN 由 StreamingNLID 丢弃，没有时间戳的行在这里去掉
+    t, x, y = (pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64) for name in names)
+    valid = ~np.isnan(t)
+    t, x, y = t[valid], x[valid], y[valid]
+    if speed <= 0:
+        for start in range(0, len(t), chunk):
+            yield t[start:start + chunk], x[start:start + chunk], y[start:start + chunk]
+        return
+    # 每个样本应送出的时刻（相对于开始重放）；计算耽误的时间不累积
+    due = (t - t[0]) * time_unit / speed
+    started = time.monotonic()
+    sent = 0
+    while sent < len(t):
+        now = time.monotonic() - started
+        ready = int(np.searchsorted(due, now, side='right'))
+        if ready > sent:
+            yield t[sent:ready], x[sent:ready], y[sent:ready]
+            sent = ready
+        else:
+            time.sleep(due[sent] - now)
+
+
+def line_source(stream):
+    """
+    从文本流（stdin、socket）逐行读取 "时间,X,Y" 样本，分隔符可为逗号、分号、制表符或空格；
+    无法解析的行（如表头）被忽略。
+    :return: 每个样本产生一次 (时间, X, Y) 数组
+    """
+    for line in stream:
+        parts = line.replace(',', ' ').replace(';', ' ').split()
+        try:
+            t, x, y = (float(value) for value in parts[:3])
+        except ValueError:
+            continue
+        yield np.array([t]), np.array([x]), np.array([y])
+
+
+def socket_source(host, port):
+    """
+    在本机端口上等待一个 TCP 连接，读取其发送的样本行（格式见 line_source），连接关闭时结束。
+    """
+    with socket.create_server((host, port)) as server:
+        connection, _ = server.accept()
+        with connection, connection.makefile('r', encoding='utf-8', errors='replace') as stream:
+            yield from line_source(stream)
+
+
+def run_stream(source, analyzer, monitor=None, on_result=None, on_alert=None):
+    """
+    把一个样本来源接到 StreamingNLID 上，每完成一个窗口回调一次。
+    :param source: 逐批产生 (时间, X, Y) 的可迭代对象
+    :param analyzer: StreamingNLID
+    :param monitor: 可选的 FatigueMonitor
+    :param on_result: on_result(结果)，结果见 StreamingNLID.push
+    :param on_alert: on_alert(结果, 提示)，提示见 FatigueMonitor.update
+    :return: 各窗口的延迟（秒）数组
+    """
+    latencies = []
+    for t, x, y in source:
+        for result in analyzer.push(t, x, y):
+            latencies.append(result["latency"])
+            if on_result is not None:
+                on_result(result)
+            if monitor is not None:
+                for alert in monitor.update(result):
+                    if on_alert is not None:
+                        on_alert(result, alert)
+    return np.array(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Real-time NLID of a live gaze feed (Time, X, Y), one result line per completed window.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--replay", metavar="PATH",
+                        help="replay a data file, or every data file in a folder, at its recorded timing")
+    source.add_argument("--stdin", action="store_true", help='read "time,x,y" lines from standard input')
+    source.add_argument("--listen", metavar="[HOST:]PORT", help='accept one TCP connection sending "time,x,y" lines')
+    parser.add_argument("--columns", nargs=3, default=("Time", "X", "Y"), metavar=("TIME", "X", "Y"),
+                        help="column names used by --replay (default: Time X Y)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor; 0 replays without waiting")
+    parser.add_argument("--time-unit", type=float, default=1e-3, help="seconds per time unit (default: ms)")
+    parser.add_argument("--m", type=int, default=3, help="embedding dimension")
+    parser.add_argument("--tau", type=int, default=1, help="time delay")
+    parser.add_argument("--window", type=int, default=100, help="window size in samples")
+    parser.add_argument("--overlap", type=float, default=0.5, help="window overlap (0-1)")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--threshold-type", choices=("dynamic", "static", "fixed_rr"), default="dynamic")
+    parser.add_argument("--engine", choices=("auto", "batch", "fused", "rolling", "sparse"), default="auto")
+    parser.add_argument("--latency-ms", type=float, default=100.0,
+                        help="per-window latency budget; older pending windows are skipped to meet it")
+    parser.add_argument("--baseline", type=int, default=10, help="windows used as the fatigue baseline")
+    parser.add_argument("--smooth", type=int, default=5, help="recent windows compared with the baseline")
+    parser.add_argument("--z", type=float, default=3.0, help="alert when the recent mean is this many SDs off")
+    args = parser.parse_args(argv)
+
+    step = int(args.window * (1 - args.overlap))
+    if (args.m < 1 or args.tau < 1 or not (0 <= args.overlap < 1) or step < 1 or
+            args.window <= (args.m - 1) * args.tau + 1):
+        parser.error("m and tau must be >=1, 0<=overlap<1, window step >=1 sample and window size > (m-1)*tau+1.")
+    analyzer = StreamingNLID(args.m, args.tau, args.window, step, args.threshold, args.threshold_type,
+                             args.engine, args.latency_ms / 1000)
+    monitor = FatigueMonitor(args.baseline, args.smooth, args.z)
+    cx, cy = args.columns[1].strip().upper(), args.columns[2].strip().upper()
+    labels = {"xy": f"NLID({cx}|{cy})", "yx": f"NLID({cy}|{cx})"}
+
+    if args.replay:
+        if os.path.isdir(args.replay):
+            files = sorted(os.path.join(args.replay, f) for f in os.listdir(args.replay) if is_data_file(f))
+        else:
+            files = [args.replay]
+        sessions = [(os.path.basename(path), replay_source(path, args.columns, args.speed, args.time_unit))
+                    for path in files]
+    elif args.stdin:
+        sessions = [("stdin", line_source(sys.stdin))]
+    else:
+        host, _, port = args.listen.rpartition(':')
+        sessions = [(f"{host or '127.0.0.1'}:{port}", socket_source(host or '127.0.0.1', int(port)))]
+
+    print(f"Session,Window,Start,End,{labels['xy']},{labels['yx']},Latency (ms),Skipped", flush=True)
+    for name, source in sessions:
+        analyzer.reset()
+        monitor.reset()
+
+        def on_result(result):
+            print(f"{name},{result['window']},{result['start']:g},{result['end']:g},{result['xy']:.6f},"
+                  f"{result['yx']:.6f},{result['latency'] * 1000:.1f},{result['skipped']}", flush=True)
+
+        def on_alert(result, alert):
+            print(f"ALERT {name} window {result['window']} (t={result['end']:g}): {labels[alert['direction']]} "
+                  f"recent mean {alert['value']:.4f} is {alert['z']:+.1f} SD from baseline",
+                  file=sys.stderr, flush=True)
+
+        try:
+            latencies = run_stream(source, analyzer, monitor, on_result, on_alert)
+        except (OSError, KeyError, ValueError) as exc:
+            print(f"Error {name}: {exc}", file=sys.stderr, flush=True)
+            continue
+        worst = f", max latency {latencies.max() * 1000:.1f} ms" if len(latencies) else ""
+        print(f"{name}: {analyzer.windows} windows, {analyzer.skipped} skipped{worst}", file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    main()
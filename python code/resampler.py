@@ -0,0 +1,159 @@
+import os
+import functools
+import numpy as np
+import pandas as pd
+from scipy.interpolate import PchipInterpolator
+from batch_runner import BatchRunner, SkipFile
+from data_cache import load_columns, cache_entry, is_data_file
+
+METHODS = ("linear", "pchip", "nearest")
+OUTPUT_FORMATS = ("csv", "npz", "xlsx")
+DEFAULT_CHANNELS = ("X", "Y", "Pupil Diameter Left (mm)", "Pupil Diameter Right (mm)")
+
+
+def clean_time(time):
+    """
+    整理时间轴：重复的时间只保留第一次出现，丢弃无效（NaN）时间，再按时间排序。
+    :param time: 时间数组
+    :return: (排序后的时间, 对应的原始下标)
+    """
+    _, first = np.unique(time, return_index=True)
+    keep = np.sort(first)
+    keep = keep[~np.isnan(time[keep])]
+    order = np.argsort(time[keep], kind='stable')
+    keep = keep[order]
+    return time[keep], keep
+
+
+def _interpolate(time, values, grid, method):
+    # values 为 (样本数, 通道数)；所有通道一次插值
+    if method == "linear":
+        if values.shape[1] == 1:
+            return np.interp(grid, time, values[:, 0])[:, None]
+        # 各输出点所在的区间与权重只算一次，所有通道共用
+        right = np.clip(np.searchsorted(time, grid, side='right'), 1, len(time) - 1)
+        left = right - 1
+        weight = ((grid - time[left]) / (time[right] - time[left]))[:, None]
+        return values[left] + weight * (values[right] - values[left])
+    if method == "pchip":
+        return PchipInterpolator(time, values, axis=0, extrapolate=False)(grid)
+    if method == "nearest":
+        right = np.clip(np.searchsorted(time, grid), 1, len(time) - 1)
+        left = right - 1
+        nearest = np.where(grid - time[left] <= time[right] - grid, left, right)
+        return values[nearest]
+    raise ValueError(f"Unknown method: {method}")
+
+
+def resample(time, channels, rate, method="linear", time_unit=1e-3):
+    """
+    把多个通道同时重采样到等间隔时间轴 arange(起始时间, 结束时间, 1 / (rate * time_unit))。
+    linear 的结果与原来的逐点插值（內插V4_ui.py 旧版）相同。
+    含 NaN 的通道只用其有效样本插值，其余通道一起向量化计算。
+    :param time: 时间数组（可含重复、NaN，可未排序）
+    :param channels: {通道名: 数组}，长度与 time 相同
+    :param rate: 目标采样率（Hz）
+    :param method: "linear"、"pchip" 或 "nearest"
+    :param time_unit: 时间列一个单位的秒数（默认毫秒，与原始记录的 Time 列相同）
+    :return: (新的时间轴, {通道名: 重采样后的数组})
+    """
+    if rate <= 0 or time_unit <= 0:
+        raise ValueError("rate and time_unit must be > 0")
+    time = np.asarray(time, dtype=float)
+    time, keep = clean_time(time)
+    if len(time) < 2:
+        raise SkipFile("not enough time stamps to resample.")
+    grid = np.arange(time[0], time[-1], 1 / (rate * time_unit))
+
+    names = list(channels)
+    values = np.column_stack([np.asarray(channels[name], dtype=float)[keep] for name in names]) if names \
+        else np.empty((len(time), 0))
+    finite = np.isfinite(values)
+    complete = finite.all(axis=0)
+    result = {}
+    if complete.any():
+        block = _interpolate(time, values[:, complete], grid, method)
+        for name, column in zip([n for n, c in zip(names, complete) if c], block.T):
+            result[name] = column
+    for k in np.flatnonzero(~complete):
+        valid = finite[:, k]
+        if valid.sum() < 2:
+            result[names[k]] = np.full(len(grid), np.nan)
+        else:
+            result[names[k]] = _interpolate(time[valid], values[valid, k:k + 1], grid, method)[:, 0]
+    return grid, {name: result[name] for name in names}
+
+
+def resample_file(path, channels, rate, method="linear", time_column="Time", time_unit=1e-3):
+    """
+    读取一个文件（经列缓存，只读所需的列）并重采样（rate、time_unit 见 resample）。
+    列名匹配时忽略大小写和首尾空白，输出沿用参数中的写法。
+    :return: DataFrame，第一列为时间，其余为各通道
+    """
+    wanted = [time_column] + list(channels)
+    data = load_columns(path, wanted, normalize=True)
+    missing = [name for name in wanted if name.strip().upper() not in data]
+    if missing:
+        raise SkipFile(f"missing columns: {', '.join(missing)}.")
+
+    def numeric(values):
+        if values.dtype.kind in 'biuf':
+            return np.asarray(values, dtype=float)
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+    grid, resampled = resample(numeric(data[time_column.strip().upper()]),
+                               {name: numeric(data[name.strip().upper()]) for name in channels}, rate, method, time_unit)
+    return pd.DataFrame({time_column: grid, **resampled})
+
+
+def plan_resample_file(path):
+    """每个文件一个工作单元。"""
+    return [path]
+
+
+def resample_and_write(path, target_folder, channels, rate, method="linear", time_column="Time", output_format="npz",
+                       time_unit=1e-3):
+    """
+    重采样一个文件并写到目标文件夹（同名，扩展名取 output_format）。
+    npz 为列式二进制（写入最快，各工具都能读取），csv 通用，xlsx 最慢，只为兼容旧流程保留。
+    写 csv/npz 时顺便建立列缓存，后续工具读取时不必再解析。
+    :return: (输出路径, 行数)
+    """
+    df = resample_file(path, channels, rate, method, time_column, time_unit)
+    target = os.path.join(target_folder, os.path.splitext(os.path.basename(path))[0] + "." + output_format)
+    if output_format == "xlsx":
+        with pd.ExcelWriter(target) as writer:
+            df.to_excel(writer, sheet_name='Interpolated_Data', index=False)
+    else:
+        if output_format == "npz":
+            np.savez(target, **{name: df[name].to_numpy() for name in df.columns})
+        else:
+            df.to_csv(target, index=False)
+        cache_entry(target)
+    return target, len(df)
+
+
+def resample_folder(source_folder, target_folder, channels=DEFAULT_CHANNELS, rate=1000.0, method="linear",
+                    time_column="Time", output_format="npz", workers=1, on_file_done=None, on_error=None,
+                    time_unit=1e-3):
+    """
+    并行重采样文件夹中的所有 CSV/XLSX 文件（rate、time_unit 见 resample）。
+    :param on_file_done: on_file_done(path, (输出路径, 行数))
+    :param on_error: on_error(path, exc)
+    :return: 与文件列表对应的结果列表（失败为 None）
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if os.path.abspath(source_folder) == os.path.abspath(target_folder):
+        raise ValueError("Target folder must differ from the source folder.")
+    os.makedirs(target_folder, exist_ok=True)
+    files = [os.path.join(source_folder, f) for f in sorted(os.listdir(source_folder))
+             if is_data_file(f)]
+    work = functools.partial(resample_and_write, target_folder=target_folder, channels=tuple(channels), rate=rate,
+                             method=method, time_column=time_column, output_format=output_format,
+                             time_unit=time_unit)
+    return BatchRunner(workers).run(files, plan_resample_file, work, lambda path, values: values[0],
+                                    on_file_done, on_error)
+
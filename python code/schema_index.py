@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from batch_runner import default_workers
+from data_cache import cache_dir, cached_meta, sniff_delimiter
+
+# 推断 dtype 时读取的行数（没有列缓存时）
+SAMPLE_ROWS = 200
+
+
+def _count_rows(path):
+    # 按块数换行符，不解析内容；最后一行没有换行符时补 1，再减去表头
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    return max(0, lines + (last != b'\n') - 1)
+
+
+def scan_file(path):
+    """
+    读取一个文件的结构：列名、各列 dtype 和行数。
+    已有未过期的列缓存时直接用缓存的元数据（dtype 准确）；
+    否则只读表头和前 SAMPLE_ROWS 行推断 dtype（CSV 的行数按换行符计数，XLSX 取工作表的维度，
+    .npz 只读各数组的表头）。
+    :param path: 文件路径
+    :return: {"columns": [...], "dtypes": {列名: dtype}, "rows": 行数, "exact": dtype 是否来自完整解析}
+    """
+    meta = cached_meta(path)
+    if meta is not None and all("dtype" in column for column in meta["columns"]):
+        return {"columns": [column["name"] for column in meta["columns"]],
+                "dtypes": {column["name"]: column["dtype"] for column in meta["columns"]},
+                "rows": meta["rows"], "exact": True}
+
+    if path.lower().endswith('.npz'):
+        with np.load(path) as npz:
+            # zip 中各 .npy 的表头就含 dtype 和长度，不必读数据
+            dtypes, rows = {}, 0
+            for name in npz.files:
+                with npz.zip.open(name + '.npy') as handle:
+                    version = np.lib.format.read_magic(handle)
+                    read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                                   else np.lib.format.read_array_header_2_0)
+                    shape, _, dtype = read_header(handle)
+                dtypes[name] = str(dtype)
+                rows = max(rows, shape[0] if shape else 1)
+        return {"columns": list(dtypes), "dtypes": dtypes, "rows": rows, "exact": True}
+    if path.lower().endswith(('.xls', '.xlsx')):
+        sample = pd.read_excel(path, nrows=SAMPLE_ROWS)
+        rows = None
+        if path.lower().endswith('.xlsx'):
+            from openpyxl import load_workbook
+            workbook = load_workbook(path, read_only=True)
+            try:
+                sheet = workbook.worksheets[0]
+                if sheet.max_row is not None:
+                    rows = sheet.max_row - 1
+            finally:
+                workbook.close()
+        if rows is None:
+            rows = len(pd.read_excel(path, usecols=[0]))
+    else:
+        sample = pd.read_csv(path, sep=sniff_delimiter(path), nrows=SAMPLE_ROWS)
+        rows = _count_rows(path)
+    columns = [str(name) for name in sample.columns]
+    return {"columns": columns, "dtypes": {name: str(sample[name].dtype) for name in columns},
+            "rows": rows, "exact": False}
+
+
+class SchemaIndex:
+    """
+    一批文件的列结构索引：各文件的列名、dtype 和行数，以及所有文件的列的并集与交集。
+    扫描结果按 (修改时间, 大小) 缓存在数据文件夹的缓存目录下，只有变动过的文件会重新扫描。
+    """
+
+    def __init__(self, files, schemas):
+        """
+        :param files: 文件路径列表
+        :param schemas: 与 files 对应的 scan_file 结果；读取失败的文件为 {"error": 说明}
+        """
+        self.files = list(files)
+        self.schemas = dict(zip(self.files, schemas))
+
+    @classmethod
+    def scan(cls, files, workers=None):
+        """
+        并行扫描一批文件（线程池：表头扫描以 I/O 为主）。
+        :param files: 文件路径列表，通常来自同一个文件夹
+        :param workers: 线程数，默认为 CPU 核数
+        :return: SchemaIndex
+        """
+        files = list(files)
+        stored = {}
+        for folder in {os.path.dirname(os.path.abspath(path)) for path in files}:
+            stored.update(_load_index(folder))
+
+        def scan_one(path):
+            stat = os.stat(path)
+            key = os.path.abspath(path)
+            entry = stored.get(key)
+            if entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                return entry["schema"]
+            try:
+                schema = scan_file(path)
+            except Exception as exc:
+                return {"error": str(exc)}
+            stored[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "schema": schema}
+            return schema
+
+        with ThreadPoolExecutor(max(1, min(workers or default_workers(), len(files) or 1))) as pool:
+            schemas = list(pool.map(scan_one, files))
+        for folder in {os.path.dirname(os.path.abspath(path)) for path in files}:
+            _save_index(folder, {key: entry for key, entry in stored.items()
+                                 if os.path.dirname(key) == folder and os.path.exists(key)})
+        return cls(files, schemas)
+
+    @property
+    def readable(self):
+        """成功读取到结构的文件。"""
+        return [path for path in self.files if "error" not in self.schemas[path]]
+
+    def union(self):
+        """至少出现在一个文件中的列，按首次出现的顺序排列。"""
+        columns = {}
+        for path in self.readable:
+            columns.update(dict.fromkeys(self.schemas[path]["columns"]))
+        return list(columns)
+
+    def intersection(self):
+        """所有可读文件中都存在的列，按第一个文件中的顺序排列。"""
+        readable = self.readable
+        if not readable:
+            return []
+        common = set(self.schemas[readable[0]]["columns"])
+        for path in readable[1:]:
+            common &= set(self.schemas[path]["columns"])
+        return [name for name in self.schemas[readable[0]]["columns"] if name in common]
+
+    def missing(self, column):
+        """缺少该列的可读文件。"""
+        return [path for path in self.readable if column not in self.schemas[path]["columns"]]
+
+    def report(self):
+        """给 GUI 显示的一句话说明：共同列数，以及被排除的列和无法读取的文件。"""
+        common = self.intersection()
+        readable = self.readable
+        text = f"{len(common)} columns present in all {len(readable)} files"
+        partial = len(self.union()) - len(common)
+        if partial:
+            text += f"; {partial} columns missing from some files were left out"
+        if len(readable) < len(self.files):
+            text += f"; {len(self.files) - len(readable)} files could not be read"
+        return text + "."
+
+    def summary(self):
+        """
+        :return: DataFrame，每个文件一行：文件名、行数、列数、错误信息
+        """
+        return pd.DataFrame([{
+            "File": os.path.basename(path),
+            "Rows": self.schemas[path].get("rows"),
+            "Columns": len(self.schemas[path].get("columns", [])),
+            "Error": self.schemas[path].get("error"),
+        } for path in self.files])
+
+
+def _index_path(folder):
+    # 设置了 DATA_CACHE_DIR 时多个文件夹共用一个缓存目录，按文件夹路径区分
+    return os.path.join(cache_dir(folder), f"schema-{hashlib.sha1(folder.encode('utf-8')).hexdigest()[:16]}.json")
+
+
+def _load_index(folder):
+    try:
+        with open(_index_path(folder), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_index(folder, entries):
+    path = _index_path(folder)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        # 只读的数据文件夹：索引照常返回，只是下次还要重新扫描
+        pass
@@ -6,6 +6,8 @@ from tkinter import font
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import os
+from data_cache import read_table
+from ttest_engine import batch_ttests, feature_columns, CORRECTIONS
 
 class TTestGUI:
     def __init__(self, master):
@@ -101,12 +103,45 @@ class TTestGUI:
         self.chart_frame = ttk.Labelframe(self.page2, text="Mean and Std Dev Chart")
         self.chart_frame.pack(fill='both', expand=True, pady=5, padx=10)
 
+        # ---- 批次檢定分頁：兩張特徵表（如 pre / post 的 Feature_Results）的所有特徵一次檢定 ----
+        self.page3 = ttk.Frame(self.notebook)
+        self.notebook.add(self.page3, text='📑 批次檢定')
+        self.batch_tables = {}
+        self.batch_labels = {}
+        frame_tables = ttk.Labelframe(self.page3, text="📂 特徵表")
+        frame_tables.pack(fill='x', pady=5)
+        for row, group in enumerate(('A', 'B')):
+            ttk.Button(frame_tables, text=f"開啟 {group} 組特徵表",
+                       command=lambda g=group: self.load_batch_table(g)).grid(row=row, column=0, padx=10, pady=5)
+            self.batch_labels[group] = ttk.Label(frame_tables, text="尚未載入檔案", foreground='#555')
+            self.batch_labels[group].grid(row=row, column=1, sticky='w', padx=10)
+
+        frame_batch_opts = ttk.Labelframe(self.page3, text="⚙️ 批次選項")
+        frame_batch_opts.pack(fill='x', pady=5)
+        ttk.Label(frame_batch_opts, text="尾端檢定：").grid(row=0, column=0, sticky='e', padx=5, pady=5)
+        self.batch_tail = ttk.Combobox(frame_batch_opts, state='readonly', width=20, values=['雙尾', '單尾'])
+        self.batch_tail.current(0)
+        self.batch_tail.grid(row=0, column=1, sticky='w', padx=5, pady=5)
+        ttk.Label(frame_batch_opts, text="多重比較校正：").grid(row=1, column=0, sticky='e', padx=5, pady=5)
+        self.batch_correction = ttk.Combobox(frame_batch_opts, state='readonly', width=20, values=CORRECTIONS)
+        self.batch_correction.current(0)
+        self.batch_correction.grid(row=1, column=1, sticky='w', padx=5, pady=5)
+        ttk.Label(frame_batch_opts, text="顯著水準 α：").grid(row=2, column=0, sticky='e', padx=5, pady=5)
+        self.batch_alpha = ttk.Entry(frame_batch_opts, width=10)
+        self.batch_alpha.insert(0, "0.05")
+        self.batch_alpha.grid(row=2, column=1, sticky='w', padx=5, pady=5)
+
+        ttk.Button(self.page3, text="▶️ 執行批次檢定", command=self.run_batch).pack(pady=10)
+        self.txt_batch = tk.Text(self.page3, height=12, font=('Microsoft JhengHei', 11), bg='#fcfcfc')
+        self.txt_batch.pack(fill='both', expand=True, padx=10, pady=5)
+        self.txt_batch.configure(state='disabled')
+
     def load_file(self):
         file_path = filedialog.askopenfilename(filetypes=[('Excel', '*.xls;*.xlsx'), ('CSV', '*.csv')])
         if not file_path:
             return
         try:
-            self.df = pd.read_excel(file_path) if file_path.lower().endswith(('xls','xlsx')) else pd.read_csv(file_path)
+            self.df = read_table(file_path)
             cols = list(self.df.columns)
             self.combo1['values'] = cols
             self.combo2['values'] = cols
@@ -114,6 +149,61 @@ class TTestGUI:
         except Exception as e:
             messagebox.showerror('錯誤', f'檔案讀取失敗:\n{e}')
 
+    def load_batch_table(self, group):
+        file_path = filedialog.askopenfilename(filetypes=[('Excel', '*.xls;*.xlsx'), ('CSV', '*.csv')])
+        if not file_path:
+            return
+        try:
+            self.batch_tables[group] = read_table(file_path)
+            self.batch_labels[group].config(text=f"已載入: {os.path.basename(file_path)}")
+        except Exception as e:
+            messagebox.showerror('錯誤', f'檔案讀取失敗:\n{e}')
+
+    def run_batch(self):
+        if len(self.batch_tables) < 2:
+            messagebox.showwarning('警告', '請先載入 A 與 B 兩組特徵表！')
+            return
+        try:
+            alpha = float(self.batch_alpha.get())
+        except ValueError:
+            messagebox.showwarning('警告', '顯著水準必須為數字！')
+            return
+        table_a, table_b = self.batch_tables['A'], self.batch_tables['B']
+        columns = feature_columns(table_a, table_b)
+        if not columns:
+            messagebox.showwarning('警告', '兩張特徵表沒有共同的數值欄位！')
+            return
+
+        # All features at once; the first column holds the file names used to pair A and B rows
+        try:
+            result = batch_ttests(table_a, table_b, columns, tail='two-sided' if self.batch_tail.get() == '雙尾'
+                                  else 'one-sided', alpha=alpha, correction=self.batch_correction.get())
+        except Exception as e:
+            messagebox.showerror('錯誤', f'批次檢定失敗:\n{e}')
+            return
+        lines = [f"特徵數: {len(columns)}",
+                 f"獨立樣本顯著 (校正後): {int(result['Independent significant'].sum())}"]
+        if 'Paired significant' in result:
+            lines.append(f"配對樣本顯著 (校正後): {int(result['Paired significant'].sum())}"
+                         f"  (配對數最多 {int(result['Paired n'].max())})")
+        else:
+            lines.append("兩表的檔名無法配對，未執行配對檢定")
+        significant = result['Independent significant'] | result.get('Paired significant', False)
+        lines += [f"  {name}" for name in result.loc[significant, 'Feature']]
+        self.txt_batch.configure(state='normal')
+        self.txt_batch.delete('1.0', tk.END)
+        self.txt_batch.insert(tk.END, "\n".join(lines) + "\n")
+        self.txt_batch.configure(state='disabled')
+
+        save_path = filedialog.asksaveasfilename(defaultextension='.xlsx', filetypes=[('Excel','*.xlsx')])
+        if save_path:
+            try:
+                result.to_excel(save_path, index=False)
+            except Exception as e:
+                messagebox.showerror('錯誤', f'結果儲存失敗:\n{e}')
+                return
+            messagebox.showinfo('儲存成功', f'結果已儲存至:\n{save_path}')
+
     def run_ttest(self):
         # Pre-check
         if not hasattr(self, 'df') or self.df is None:
@@ -0,0 +1,235 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# 多重比较校正方法
+CORRECTIONS = ("holm", "fdr_bh", "bonferroni", "none")
+
+
+def _columns(values):
+    # (样本数, 特征数) 的 float 数组；一维时视为单个特征
+    values = np.asarray(values, dtype=np.float64)
+    return values[:, None] if values.ndim == 1 else values
+
+
+def describe(a):
+    """
+    各特征（列）的样本数、均值和母体标准差（ddof=0，与单次检定的结果相同），忽略 NaN。
+    :param a: (样本数, 特征数) 数组
+    :return: (n, 均值, 标准差)
+    """
+    a = _columns(a)
+    n = np.sum(~np.isnan(a), axis=0)
+    with warnings.catch_warnings():
+        # 整列为 NaN 时结果为 NaN，不必警告
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return n, np.nanmean(a, axis=0), np.nanstd(a, axis=0)
+
+
+def _moments(a):
+    # 样本数、均值、样本方差（ddof=1），忽略 NaN
+    n = np.sum(~np.isnan(a), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(a, axis=0) / n
+        var = np.nansum((a - mean) ** 2, axis=0) / (n - 1)
+    return n, mean, var
+
+
+def levene(a, b):
+    """
+    两组的 Levene 方差齐性检定（以中位数为中心，与 scipy.stats.levene 的默认相同），对所有特征一次计算。
+    :param a: (样本数, 特征数) 数组，NaN 为缺失
+    :param b: 同上，样本数可不同
+    :return: (W 统计量, p 值)，均为长度为特征数的数组
+    """
+    a, b = _columns(a), _columns(b)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        za = np.abs(a - np.nanmedian(a, axis=0))
+        zb = np.abs(b - np.nanmedian(b, axis=0))
+    na, mean_a, _ = _moments(za)
+    nb, mean_b, _ = _moments(zb)
+    total = na + nb
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grand = (na * mean_a + nb * mean_b) / total
+        between = na * (mean_a - grand) ** 2 + nb * (mean_b - grand) ** 2
+        within = np.nansum((za - mean_a) ** 2, axis=0) + np.nansum((zb - mean_b) ** 2, axis=0)
+        w = (total - 2) * between / within
+    return w, stats.f.sf(w, 1, total - 2)
+
+
+def ttest_independent(a, b, equal_var=True):
+    """
+    独立样本 t 检定（双尾），对所有特征一次计算，并给出效果量。
+    :param a: (样本数, 特征数) 数组，NaN 为缺失
+    :param b: 同上
+    :param equal_var: True 为 Student t，False 为 Welch t；也可为每个特征各一个布尔值的数组
+    :return: {"t", "df", "p", "cohen_d", "hedges_g"}，均为长度为特征数的数组
+    """
+    a, b = _columns(a), _columns(b)
+    na, mean_a, var_a = _moments(a)
+    nb, mean_b, var_b = _moments(b)
+    equal_var = np.broadcast_to(np.asarray(equal_var, dtype=bool), mean_a.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled = ((na - 1) * var_a + (nb - 1) * var_b) / (na + nb - 2)
+        se_student = np.sqrt(pooled * (1 / na + 1 / nb))
+        se2_a, se2_b = var_a / na, var_b / nb
+        se_welch = np.sqrt(se2_a + se2_b)
+        df_welch = (se2_a + se2_b) ** 2 / (se2_a ** 2 / (na - 1) + se2_b ** 2 / (nb - 1))
+        t = (mean_a - mean_b) / np.where(equal_var, se_student, se_welch)
+        df = np.where(equal_var, na + nb - 2, df_welch)
+        d = (mean_a - mean_b) / np.sqrt(pooled)
+        g = d * (1 - 3 / (4 * (na + nb) - 9))
+    return {"t": t, "df": df, "p": 2 * stats.t.sf(np.abs(t), df), "cohen_d": d, "hedges_g": g}
+
+
+def ttest_paired(a, b):
+    """
+    配对样本 t 检定（双尾），a 与 b 的同一行为同一对象；只使用两者都不是 NaN 的行（逐特征）。
+    :param a: (样本数, 特征数) 数组
+    :param b: 形状相同的数组
+    :return: {"n", "t", "df", "p", "cohen_dz"}，cohen_dz 为差值均值 / 差值标准差
+    """
+    diff = _columns(a) - _columns(b)
+    n, mean, var = _moments(diff)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sd = np.sqrt(var)
+        t = mean / (sd / np.sqrt(n))
+        dz = mean / sd
+    df = np.where(n > 1, n - 1, np.nan)
+    return {"n": n, "t": t, "df": df, "p": 2 * stats.t.sf(np.abs(t), df), "cohen_dz": dz}
+
+
+def one_tailed(t, p_two, mean_a, mean_b):
+    """
+    与单次检定相同的单尾 p 值：方向取均值较大的一组（A > B 或 A < B）。
+    :return: (单尾 p 值, 方向说明)
+    """
+    agree = np.where(mean_a > mean_b, t > 0, t < 0)
+    p = np.where(agree, p_two / 2, 1 - p_two / 2)
+    p = np.where(np.isnan(p_two), np.nan, p)
+    return p, np.where(mean_a > mean_b, "A > B", "A < B")
+
+
+def adjust_pvalues(p, method="holm"):
+    """
+    多重比较校正，NaN 不计入比较次数并原样保留。
+    :param p: p 值数组
+    :param method: CORRECTIONS 之一（holm、fdr_bh 为 Benjamini-Hochberg、bonferroni、none）
+    :return: 校正后的 p 值数组
+    """
+    if method not in CORRECTIONS:
+        raise ValueError(f"Unknown correction: {method}")
+    p = np.asarray(p, dtype=np.float64)
+    adjusted = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    m = len(valid)
+    if not m or method == "none":
+        adjusted[valid] = p[valid]
+        return adjusted
+    if method == "bonferroni":
+        adjusted[valid] = np.minimum(p[valid] * m, 1.0)
+        return adjusted
+    order = valid[np.argsort(p[valid], kind='stable')]
+    ranked = p[order]
+    if method == "holm":
+        values = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    else:
+        values = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    adjusted[order] = np.minimum(values, 1.0)
+    return adjusted
+
+
+def subject_keys(names):
+    """
+    由文件名得到对象编号，用于配对两张特征表：去掉扩展名，再去掉所有名称共有的前缀
+    （截到最后一个分隔符，如 "pre-p1.csv" 与 "pre-p12.csv" 得到 "p1" 与 "p12"）。
+    :param names: 文件名列表
+    :return: 对象编号列表
+    """
+    stems = [os.path.splitext(os.path.basename(str(name)))[0] for name in names]
+    if len(stems) < 2:
+        return stems
+    prefix = os.path.commonprefix(stems)
+    cut = max(prefix.rfind(sep) for sep in "-_ ") + 1
+    return [stem[cut:] for stem in stems]
+
+
+def feature_columns(table_a, table_b):
+    """两张特征表共有的数值列（按 A 表的顺序）。"""
+    numeric_b = set(table_b.select_dtypes('number').columns)
+    return [col for col in table_a.select_dtypes('number').columns if col in numeric_b]
+
+
+def batch_ttests(table_a, table_b, columns=None, key=None, tail="two-sided", alpha=0.05, correction="holm"):
+    """
+    对两张特征表（如 pre 与 post 的 Feature_Results）的所有特征列一次完成
+    Levene 检定、独立样本 t 检定（依 Levene 结果选择 Student 或 Welch）、配对 t 检定和效果量，
+    再分别对独立与配对两组 p 值做多重比较校正。
+    :param table_a: A 组的特征表，每行一个文件
+    :param table_b: B 组的特征表
+    :param columns: 要检定的特征列；None 时为两表共有的所有数值列
+    :param key: 用于配对的文件名列；None 时取第一列。两表对象编号（见 subject_keys）相同的行配对，
+                没有可配对的行时不做配对检定
+    :param tail: "two-sided" 或 "one-sided"（方向取均值较大的一组）
+    :param alpha: 显著水准，也用于 Levene 判断等变异
+    :param correction: CORRECTIONS 之一
+    :return: DataFrame，每个特征一行
+    """
+    columns = feature_columns(table_a, table_b) if columns is None else list(columns)
+    a = table_a[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    b = table_b[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    n_a, mean_a, std_a = describe(a)
+    n_b, mean_b, std_b = describe(b)
+
+    lev_w, lev_p = levene(a, b)
+    equal_var = lev_p > alpha
+    ind = ttest_independent(a, b, equal_var)
+    result = {
+        "Feature": columns,
+        "N A": n_a, "Mean A": mean_a, "Std A": std_a,
+        "N B": n_b, "Mean B": mean_b, "Std B": std_b,
+        "Levene W": lev_w, "Levene p": lev_p,
+        "Variance": np.where(np.isnan(lev_p), "", np.where(equal_var, "equal", "unequal")),
+    }
+    result.update(_family("Independent", ind["t"], ind["df"], ind["p"], mean_a, mean_b, tail, alpha, correction))
+    result.update({"Cohen's d": ind["cohen_d"], "Hedges' g": ind["hedges_g"]})
+
+    key = key if key is not None else table_a.columns[0]
+    if key in table_a.columns and key in table_b.columns:
+        rows_a, rows_b = _matched_rows(table_a[key], table_b[key])
+        if len(rows_a):
+            pa, pb = a[rows_a], b[rows_b]
+            paired = ttest_paired(pa, pb)
+            # 单尾方向按配对后（两者都不是 NaN 的行）的均值判断
+            complete = ~(np.isnan(pa) | np.isnan(pb))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                pair_mean_a = np.where(complete, pa, 0).sum(axis=0) / paired["n"]
+                pair_mean_b = np.where(complete, pb, 0).sum(axis=0) / paired["n"]
+            result["Paired n"] = paired["n"]
+            result.update(_family("Paired", paired["t"], paired["df"], paired["p"], pair_mean_a, pair_mean_b,
+                                  tail, alpha, correction))
+            result["Cohen's dz"] = paired["cohen_dz"]
+    return pd.DataFrame(result)
+
+
+def _family(name, t, df, p, mean_a, mean_b, tail, alpha, correction):
+    # 一组检定（独立或配对）的输出列；校正只在同一组的特征之间进行
+    columns = {f"{name} t": t, f"{name} df": df}
+    if tail != "two-sided":
+        p, columns[f"{name} direction"] = one_tailed(t, p, mean_a, mean_b)
+    adjusted = adjust_pvalues(p, correction)
+    columns.update({f"{name} p": p, f"{name} p adjusted": adjusted, f"{name} significant": adjusted < alpha})
+    return columns
+
+
+def _matched_rows(names_a, names_b):
+    # 两表中对象编号相同的行号（编号重复时取第一个）
+    keys_a = pd.Series(range(len(names_a)), index=subject_keys(names_a))
+    keys_b = pd.Series(range(len(names_b)), index=subject_keys(names_b))
+    keys_a = keys_a[~keys_a.index.duplicated()]
+    keys_b = keys_b[~keys_b.index.duplicated()]
+    common = keys_a.index.intersection(keys_b.index, sort=False)
+    return keys_a[common].to_numpy(), keys_b[common].to_numpy()